@@ -69,4 +69,45 @@ SELECT
 FROM stock_market_data
 WHERE year = 2026 AND month = 1 AND day = 18;
 -- Note: Adjust the date filters as needed to match your data
--- ============================================
\ No newline at end of file
+-- ============================================
+-- Queries on pre-aggregated bars
+-- ============================================
+-- stock_market_bars (stock_market_bars_table.sql) holds 1- and 5-minute
+-- OHLCV bars written by the processor, so these read one row per symbol
+-- per interval instead of every tick.
+
+-- Query 6: Daily summary from 1-minute bars
+SELECT
+  symbol,
+  SUM(vwap * volume) / SUM(volume) AS vwap,
+  SUM(volume) AS total_volume,
+  MAX(high) AS high,
+  MIN(low) AS low
+FROM stock_market_bars
+WHERE bar_interval = '1m' AND year = 2026 AND month = 1 AND day = 18
+GROUP BY symbol;
+
+-- Query 7: Intraday trend for AAPL at 5-minute resolution
+SELECT
+  bar_start,
+  open,
+  high,
+  low,
+  close,
+  volume
+FROM stock_market_bars
+WHERE symbol = 'AAPL'
+  AND bar_interval = '5m'
+  AND year = 2026
+  AND month = 1
+  AND day = 18
+ORDER BY bar_start;
+
+-- Query 8: Price range over a week from 5-minute bars
+SELECT
+  symbol,
+  MAX(high) - MIN(low) AS price_volatility
+FROM stock_market_bars
+WHERE bar_interval = '5m' AND year = 2026 AND month = 1 AND day BETWEEN 11 AND 18
+GROUP BY symbol
+ORDER BY price_volatility DESC;
@@ -0,0 +1,22 @@
+CREATE EXTERNAL TABLE IF NOT EXISTS stock_market_bars (
+  symbol    STRING,
+  bar_start TIMESTAMP,
+  open      DOUBLE,
+  high      DOUBLE,
+  low       DOUBLE,
+  close     DOUBLE,
+  volume    BIGINT,
+  vwap      DOUBLE,
+  trades    BIGINT
+)
+PARTITIONED BY (
+  bar_interval STRING,
+  year         INT,
+  month        INT,
+  day          INT
+)
+STORED AS PARQUET
+LOCATION 's3://stock-historical-data/bars/'
+TBLPROPERTIES (
+  'parquet.compression' = 'SNAPPY'
+);
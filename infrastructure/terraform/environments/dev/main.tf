@@ -46,6 +46,18 @@ module "lambda" {
   s3_bucket_arn  = module.s3.bucket_arn
 }
 
+# 1- and 5-minute OHLCV bars written by the processor
+module "bars_table" {
+  source        = "../../modules/dynamodb"
+  table_name    = "${var.dynamodb_table_name}-bars"
+  ttl_attribute = "ttl"
+
+  tags = {
+    Environment = "dev"
+    Project     = "real-time-stock-analytics"
+  }
+}
+
 module "processor_lambda" {
   source = "../../modules/lambda"
 
@@ -63,7 +75,25 @@ module "processor_lambda" {
   dynamodb_arn   = module.dynamodb.table_arn
   s3_bucket      = module.s3.bucket_name
   s3_bucket_arn  = module.s3.bucket_arn
+
+  environment = {
+    BARS_TABLE = module.bars_table.table_name
+    # Ticks for history plus the per-symbol LATEST items the quote API reads
+    DYNAMODB_WRITE_MODE = "both"
+  }
+  additional_dynamodb_arns = [module.bars_table.table_arn]
 }
 
 
 
+module "quote_api" {
+  source = "../../modules/quote_api"
+
+  function_name    = "stock-quote-api"
+  lambda_zip       = "../../../../services/quote_api/lambda.zip"
+  lambda_layer_zip = "../../../../services/quote_api/layer.zip"
+
+  dynamodb_table = module.dynamodb.table_name
+  dynamodb_arn   = module.dynamodb.table_arn
+  s3_bucket      = module.s3.bucket_name
+}
@@ -36,4 +36,9 @@ output "processor_lambda_function_name" {
 output "processor_lambda_function_arn" {
   description = "ARN of the processor Lambda function"
   value       = module.processor_lambda.function_arn
-}
\ No newline at end of file
+}
+
+output "quote_api_url" {
+  description = "HTTPS endpoint of the quote API"
+  value       = module.quote_api.function_url
+}
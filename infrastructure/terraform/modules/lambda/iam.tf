@@ -31,8 +31,8 @@ resource "aws_iam_policy" "lambda_policy" {
       },
       {
         Effect   = "Allow"
-        Action   = ["dynamodb:PutItem", "dynamodb:UpdateItem", "dynamodb:GetItem", "dynamodb:Query"]
-        Resource = var.dynamodb_arn
+        Action   = ["dynamodb:PutItem", "dynamodb:BatchWriteItem", "dynamodb:UpdateItem", "dynamodb:GetItem", "dynamodb:BatchGetItem", "dynamodb:Query"]
+        Resource = concat([var.dynamodb_arn], var.additional_dynamodb_arns)
       },
       {
         Effect   = "Allow"
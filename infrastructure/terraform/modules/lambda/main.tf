@@ -53,14 +53,16 @@ resource "aws_lambda_function" "this" {
   }
 
   environment {
-    variables = {
+    variables = merge({
       KINESIS_STREAM_NAME  = var.kinesis_stream_name
       STOCK_API_KEY        = var.stock_api_key
       STOCK_SYMBOLS        = var.stock_symbols
       DYNAMODB_TABLE       = var.dynamodb_table
       S3_BUCKET            = var.s3_bucket
       STOCK_API_SECRET_ARN = var.stock_api_secret_arn
-    }
+      # Records failing the quote schema are sent here with SendMessageBatch
+      DLQ_URL = aws_sqs_queue.dlq.url
+    }, var.environment)
   }
 
   depends_on = [
@@ -74,6 +76,8 @@ resource "aws_lambda_event_source_mapping" "kinesis" {
   function_name     = aws_lambda_function.this.arn
   starting_position = "LATEST"
   batch_size        = 100
+  # The processor's duplicate checkpoints assume one invocation per shard
+  parallelization_factor = 1
 
   destination_config {
     on_failure {
@@ -66,5 +66,14 @@ variable "lambda_layer_zip" {
 }
 
 
+variable "environment" {
+  description = "Extra environment variables for the function"
+  type        = map(string)
+  default     = {}
+}
 
-
+variable "additional_dynamodb_arns" {
+  description = "Further DynamoDB tables the function reads and writes"
+  type        = list(string)
+  default     = []
+}
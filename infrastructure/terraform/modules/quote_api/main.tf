@@ -0,0 +1,102 @@
+resource "aws_cloudwatch_log_group" "lambda_log_group" {
+  name              = "/aws/lambda/${var.function_name}"
+  retention_in_days = 7
+}
+
+resource "aws_iam_role" "lambda_role" {
+  name = "${var.function_name}-role"
+
+  assume_role_policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [{
+      Effect    = "Allow"
+      Principal = { Service = "lambda.amazonaws.com" }
+      Action    = "sts:AssumeRole"
+    }]
+  })
+}
+
+# Read-only access to the tick table
+resource "aws_iam_policy" "lambda_policy" {
+  name = "${var.function_name}-policy"
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect   = "Allow"
+        Action   = ["dynamodb:BatchGetItem", "dynamodb:GetItem", "dynamodb:Query"]
+        Resource = var.dynamodb_arn
+      },
+      {
+        Effect   = "Allow"
+        Action   = [
+          "logs:CreateLogGroup",
+          "logs:CreateLogStream",
+          "logs:PutLogEvents"
+        ]
+        Resource = "arn:aws:logs:*:*:*"
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy_attachment" "attach" {
+  role       = aws_iam_role.lambda_role.name
+  policy_arn = aws_iam_policy.lambda_policy.arn
+}
+
+resource "aws_s3_object" "lambda_zip" {
+  bucket = var.s3_bucket
+  key    = "lambda/${var.function_name}.zip"
+  source = var.lambda_zip
+  etag   = filemd5(var.lambda_zip)
+}
+
+resource "aws_s3_object" "lambda_layer" {
+  bucket = var.s3_bucket
+  key    = "lambda/${var.function_name}-layer.zip"
+  source = var.lambda_layer_zip
+  etag   = filemd5(var.lambda_layer_zip)
+}
+
+resource "aws_lambda_layer_version" "dependencies" {
+  layer_name          = "${var.function_name}-dependencies"
+  s3_bucket           = var.s3_bucket
+  s3_key              = aws_s3_object.lambda_layer.key
+  compatible_runtimes = ["python3.11"]
+  source_code_hash    = filebase64sha256(var.lambda_layer_zip)
+}
+
+resource "aws_lambda_function" "this" {
+  function_name = var.function_name
+  role          = aws_iam_role.lambda_role.arn
+  handler       = "app.handler"
+  runtime       = "python3.11"
+  timeout       = 10
+  memory_size   = 256
+
+  s3_bucket        = var.s3_bucket
+  s3_key           = aws_s3_object.lambda_zip.key
+  source_code_hash = filebase64sha256(var.lambda_zip)
+
+  layers = [aws_lambda_layer_version.dependencies.arn]
+
+  environment {
+    variables = {
+      DYNAMODB_TABLE     = var.dynamodb_table
+      QUOTE_CACHE_TTL_MS = tostring(var.cache_ttl_ms)
+    }
+  }
+
+  depends_on = [
+    aws_iam_role_policy_attachment.attach,
+    aws_cloudwatch_log_group.lambda_log_group
+  ]
+}
+
+# Callers sign requests with SigV4 and need lambda:InvokeFunctionUrl
+resource "aws_lambda_function_url" "this" {
+  function_name      = aws_lambda_function.this.function_name
+  authorization_type = "AWS_IAM"
+}
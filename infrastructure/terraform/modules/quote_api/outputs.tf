@@ -0,0 +1,14 @@
+output "function_name" {
+  description = "Name of the Lambda function"
+  value       = aws_lambda_function.this.function_name
+}
+
+output "function_arn" {
+  description = "ARN of the Lambda function"
+  value       = aws_lambda_function.this.arn
+}
+
+output "function_url" {
+  description = "HTTPS endpoint of the quote API"
+  value       = aws_lambda_function_url.this.function_url
+}
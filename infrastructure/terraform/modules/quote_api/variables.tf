@@ -0,0 +1,32 @@
+variable "function_name" {
+  type = string
+}
+
+variable "lambda_zip" {
+  type = string
+}
+
+variable "lambda_layer_zip" {
+  description = "Path to the Lambda layer zip file"
+  type        = string
+}
+
+variable "dynamodb_table" {
+  description = "DynamoDB table the processor writes quotes to"
+  type        = string
+}
+
+variable "dynamodb_arn" {
+  type = string
+}
+
+variable "s3_bucket" {
+  description = "S3 bucket the deployment packages are uploaded to"
+  type        = string
+}
+
+variable "cache_ttl_ms" {
+  description = "How long a warm container serves a quote from its cache"
+  type        = number
+  default     = 1000
+}
@@ -11,7 +11,8 @@ pip install -r requirements.txt -t ./layer/python --platform manylinux2014_x86_6
 cd layer
 zip -r ../layer.zip python -x "*.pyc" "*.pyo" "*__pycache__*" "*.dist-info*" "*tests/*" "*/tests/*"
 cd ..
-zip lambda.zip app.py
+zip lambda.zip *.py
+zip -j lambda.zip ../common/*.py
 rm -rf layer
 cd ../..
 
@@ -23,7 +24,20 @@ pip install -r requirements.txt -t ./layer/python --platform manylinux2014_x86_6
 cd layer
 zip -r ../layer.zip python -x "*.pyc" "*.pyo" "*__pycache__*" "*.dist-info*" "*tests/*" "*/tests/*"
 cd ..
-zip lambda.zip app.py
+zip lambda.zip *.py
+zip -j lambda.zip ../common/*.py
+rm -rf layer
+cd ../..
+
+# Package the quote API Lambda
+echo "Packaging quote API Lambda..."
+cd services/quote_api
+mkdir -p layer/python
+pip install -r requirements.txt -t ./layer/python --platform manylinux2014_x86_64 --only-binary=:all: --no-deps
+cd layer
+zip -r ../layer.zip python -x "*.pyc" "*.pyo" "*__pycache__*" "*.dist-info*" "*tests/*" "*/tests/*"
+cd ..
+zip lambda.zip *.py
 rm -rf layer
 cd ../..
 
@@ -1,6 +1,12 @@
 #!/bin/bash
 set -e
 
+# --- Shared Module Tests ---
+echo "--- Running Shared Module Tests ---"
+cd services/common
+pytest
+cd ../..
+
 # --- Producer Tests ---
 echo "--- Running Producer Tests ---"
 cd services/producer
@@ -21,4 +27,11 @@ pytest
 # Cleanup
 cd ../..
 
+# --- Quote API Tests ---
+echo "--- Running Quote API Tests ---"
+cd services/quote_api
+pip install -r requirements.txt
+pytest
+cd ../..
+
 echo "All tests passed successfully!"
@@ -0,0 +1,58 @@
+"""Dead-letter messages for quotes that fail validation.
+
+Rejected records are sent to the function's SQS DLQ with SendMessageBatch,
+ten messages (and at most 256 KiB) per call, instead of being retried until
+the poison data blocks the shard. The body of each message is JSON carrying
+the reasons, so the queue can be inspected and redriven by hand.
+"""
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# SendMessageBatch limits
+MAX_BATCH_ENTRIES = 10
+MAX_BATCH_BYTES = 256 * 1024
+# Kept well under the batch limit so a single letter always fits
+MAX_LETTER_BYTES = 64 * 1024
+
+# (key the caller uses to map failures back, message body)
+Letter = Tuple[str, str]
+
+
+def letter_body(source: str, reason: str, **fields: Any) -> str:
+    """JSON body of a dead letter; fields that are too large are dropped."""
+    document = {"source": source, "reason": reason, **fields}
+    body = json.dumps(document, default=str)
+    if len(body.encode("utf-8")) <= MAX_LETTER_BYTES:
+        return body
+    small = {key: value for key, value in document.items()
+             if len(json.dumps(value, default=str)) <= 1024}
+    small["truncated"] = sorted(set(document) - set(small))
+    return json.dumps(small, default=str)
+
+
+def letter_batches(letters: List[Letter]) -> List[List[Letter]]:
+    """Split letters into SendMessageBatch calls."""
+    batches: List[List[Letter]] = []
+    size = 0
+    for letter in letters:
+        length = len(letter[1].encode("utf-8"))
+        if not batches or len(batches[-1]) == MAX_BATCH_ENTRIES or size + length > MAX_BATCH_BYTES:
+            batches.append([])
+            size = 0
+        batches[-1].append(letter)
+        size += length
+    return batches
+
+
+def send_letter_batch(sqs, queue_url: str, batch: List[Letter],
+                      call: Optional[Callable[..., Any]] = None) -> List[str]:
+    """Send one batch; returns the keys of the letters SQS did not accept.
+
+    ``call`` wraps the request, for instance in a retry policy. Errors from
+    the request itself propagate.
+    """
+    # Entry ids only need to be unique within the call
+    entries = [{"Id": str(index), "MessageBody": body} for index, (_, body) in enumerate(batch)]
+    request: Dict[str, Any] = {"QueueUrl": queue_url, "Entries": entries}
+    response = call(sqs.send_message_batch, **request) if call else sqs.send_message_batch(**request)
+    return [batch[int(failed["Id"])][0] for failed in response.get("Failed", [])]
@@ -0,0 +1,123 @@
+"""Quote record codec shared by the producer and the processor.
+
+A Kinesis record holds either one legacy JSON quote document or a binary
+aggregate of many quotes. The two are told apart by the first byte: binary
+records start with ``MAGIC``, which can never start a JSON document.
+
+Binary layout, version 1 (big-endian)::
+
+    header   magic:u8  version:u8  count:u16  event_time_us:i64  request_id_len:u8
+             request_id:bytes[request_id_len]
+    quote*   symbol_len:u8  symbol:bytes[symbol_len]
+             price:f64  volume:i64  timestamp_us:i64
+
+Timestamps travel as epoch microseconds and decode to ISO-8601 UTC strings
+ending in "Z", with milliseconds unless microseconds are needed.
+``event_time`` and ``request_id`` are shared by every quote in the record and
+decode as None when they were not set. Other quote fields are not carried.
+"""
+import json
+import struct
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+MAGIC = 0xB7
+VERSION = 1
+MAX_QUOTES = 0xFFFF
+
+_HEADER = struct.Struct(">BBHqB")
+_QUOTE = struct.Struct(">dqq")
+_SYMBOL_LENGTH = struct.Struct(">B")
+_NO_TIME = -(2 ** 63)
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def is_binary(payload: bytes) -> bool:
+    return payload[:1] == bytes((MAGIC,))
+
+
+def encode_quotes(quotes: List[Dict[str, Any]], event_time: Optional[str] = None,
+                  request_id: Optional[str] = None) -> bytes:
+    """Pack up to MAX_QUOTES quotes into one binary record."""
+    if len(quotes) > MAX_QUOTES:
+        raise ValueError(f"At most {MAX_QUOTES} quotes fit in one record")
+
+    request_id_bytes = (request_id or "").encode("utf-8")
+    if len(request_id_bytes) > 0xFF:
+        raise ValueError("request_id is too long")
+
+    parts = [
+        _HEADER.pack(MAGIC, VERSION, len(quotes),
+                     _NO_TIME if event_time is None else iso_to_micros(event_time),
+                     len(request_id_bytes)),
+        request_id_bytes,
+    ]
+    for quote in quotes:
+        symbol = quote["symbol"].encode("utf-8")
+        if not 0 < len(symbol) <= 0xFF:
+            raise ValueError(f"Invalid symbol {quote['symbol']!r}")
+        parts.append(_SYMBOL_LENGTH.pack(len(symbol)))
+        parts.append(symbol)
+        parts.append(_QUOTE.pack(float(quote["price"]), int(quote.get("volume", 0)),
+                                 iso_to_micros(quote["timestamp"])))
+    return b"".join(parts)
+
+
+def decode_quotes(payload: bytes) -> List[Dict[str, Any]]:
+    """Unpack a binary record into quote dicts."""
+    try:
+        magic, version, count, event_time_us, request_id_length = _HEADER.unpack_from(payload)
+        if magic != MAGIC:
+            raise ValueError("Not a binary quote record")
+        if version != VERSION:
+            raise ValueError(f"Unsupported quote record version {version}")
+
+        offset = _HEADER.size
+        request_id = payload[offset:offset + request_id_length].decode("utf-8") or None
+        offset += request_id_length
+        event_time = None if event_time_us == _NO_TIME else micros_to_iso(event_time_us)
+
+        quotes = []
+        for _ in range(count):
+            symbol_length = payload[offset]
+            offset += 1
+            symbol = payload[offset:offset + symbol_length].decode("utf-8")
+            offset += symbol_length
+            price, volume, timestamp_us = _QUOTE.unpack_from(payload, offset)
+            offset += _QUOTE.size
+
+            quotes.append({
+                "symbol": symbol,
+                "price": price,
+                "volume": volume,
+                "timestamp": micros_to_iso(timestamp_us),
+                "event_time": event_time,
+                "request_id": request_id,
+            })
+    except (struct.error, IndexError) as err:
+        raise ValueError(f"Truncated quote record: {err}") from err
+
+    if offset != len(payload):
+        raise ValueError("Trailing bytes after quote record")
+    return quotes
+
+
+def decode_payload(payload: bytes) -> List[Dict[str, Any]]:
+    """Decode either format into a list of quote dicts."""
+    if is_binary(payload):
+        return decode_quotes(payload)
+    return [json.loads(payload.decode("utf-8"))]
+
+
+def iso_to_micros(value: str) -> int:
+    moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    delta = moment - _EPOCH
+    return (delta.days * 86_400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def micros_to_iso(value: int) -> str:
+    moment = _EPOCH + timedelta(microseconds=value)
+    timespec = "milliseconds" if value % 1000 == 0 else "microseconds"
+    return moment.replace(tzinfo=None).isoformat(timespec=timespec) + "Z"
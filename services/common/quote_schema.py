@@ -0,0 +1,254 @@
+"""Declarative quote record schema shared by the producer and the processor.
+
+``QUOTE_SCHEMA`` lists the quote fields and their constraints. ``compile_schema``
+turns a schema into one function that validates a whole batch of decoded
+quotes in a single loop. Each field is checked by a small closure built once
+per schema, with its bounds bound in, so the happy path makes no lookups on
+the schema and raises no exceptions. Rejects come back with a short reason
+("price must be > 0"), with no values in it, so reasons can be counted and a
+poison feed costs one summary log line instead of one per quote.
+
+Field kinds:
+
+* ``string``: a ``str`` of ``min_length`` to ``max_length`` characters and,
+  when ``max_bytes`` is set, at most that many bytes of UTF-8 (the binary
+  quote codec stores symbols in up to 255 bytes).
+* ``number``: an int, float or numeric string, as a finite float.
+* ``integer``: an int, integral float or digit string, as an int.
+
+Numbers and integers may be bounded with ``gt``, ``ge`` and ``le``. Volumes
+are capped at ``INT64_MAX``, the largest value the binary codec and the
+processor's ``array("q")`` columns can hold.
+* ``timestamp``: an ISO-8601 string, as a ``datetime``. Naive times are
+  UTC. It must not be before ``not_before`` nor more than ``max_future_s``
+  ahead of the batch's ``now``.
+
+``bool`` is never accepted as a number.
+"""
+import math
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, List, Optional, Tuple
+
+KINDS = ("string", "number", "integer", "timestamp")
+INT64_MAX = 2 ** 63 - 1
+_MISSING = object()
+
+# (index in the batch, field values in schema order)
+Valid = Tuple[int, tuple]
+# (index in the batch, reason)
+Rejected = Tuple[int, str]
+BatchValidator = Callable[..., Tuple[List[Valid], List[Rejected]]]
+
+
+@dataclass(frozen=True)
+class Field:
+    name: str
+    kind: str
+    min_length: int = 1
+    max_length: Optional[int] = None
+    max_bytes: Optional[int] = None
+    gt: Optional[float] = None
+    ge: Optional[float] = None
+    le: Optional[float] = None
+
+    def __post_init__(self):
+        if self.kind not in KINDS:
+            raise ValueError(f"Unknown field kind {self.kind!r}; expected one of {KINDS}")
+
+
+@dataclass(frozen=True)
+class Schema:
+    fields: Tuple[Field, ...]
+    # Oldest accepted timestamp, and how far past "now" one may be
+    not_before: datetime = datetime(2000, 1, 1, tzinfo=timezone.utc)
+    max_future_s: float = 86_400.0
+
+    @property
+    def names(self) -> Tuple[str, ...]:
+        return tuple(field.name for field in self.fields)
+
+
+QUOTE_SCHEMA = Schema((
+    Field("symbol", "string", max_length=255, max_bytes=255),
+    Field("price", "number", gt=0),
+    Field("volume", "integer", ge=0, le=INT64_MAX),
+    Field("timestamp", "timestamp"),
+))
+
+
+def parse_iso(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def compile_schema(schema: Schema = QUOTE_SCHEMA,
+                   parse_timestamp: Callable[[str], datetime] = parse_iso) -> BatchValidator:
+    """Build ``validate(quotes, now=None) -> (valid, rejected)`` for ``schema``.
+
+    ``valid`` holds ``(index, values)`` for each good quote, ``rejected``
+    ``(index, reason)`` for each bad one, both in batch order. ``now`` is
+    epoch seconds and defaults to the time of the call.
+    """
+    checks = tuple((field.name, _field_check(field, schema, parse_timestamp))
+                   for field in schema.fields)
+    max_future = schema.max_future_s
+
+    def validate(quotes, now=None):
+        latest = (time.time() if now is None else now) + max_future
+        valid: List[Valid] = []
+        rejected: List[Rejected] = []
+        accept, reject = valid.append, rejected.append
+        for index, quote in enumerate(quotes):
+            if type(quote) is not dict:
+                reject((index, "quote must be an object"))
+                continue
+            values = []
+            try:
+                for name, check in checks:
+                    values.append(check(quote.get(name, _MISSING), latest))
+            except _Rejected as rejection:
+                reject((index, rejection.reason))
+                continue
+            accept((index, tuple(values)))
+        return valid, rejected
+
+    validate.__doc__ = f"Validate a batch of {', '.join(schema.names)} records."
+    return validate
+
+
+class _Rejected(Exception):
+    """Raised by a field check; only bad quotes pay for it."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+# Returns the field's converted value or raises _Rejected
+Check = Callable[[Any, float], Any]
+
+
+def _field_check(field: Field, schema: Schema,
+                 parse_timestamp: Callable[[str], datetime]) -> Check:
+    if field.kind == "string":
+        return _string_check(field)
+    if field.kind == "timestamp":
+        return _timestamp_check(field.name, schema.not_before.timestamp(), parse_timestamp)
+    if field.kind == "number":
+        return _number_check(field)
+    return _integer_check(field)
+
+
+def _string_check(field: Field) -> Check:
+    name, min_length, max_length, max_bytes = (
+        field.name, field.min_length, field.max_length, field.max_bytes)
+    missing, not_string = f"{name} is missing", f"{name} must be a string"
+    wrong_length = (f"{name} must be {min_length}-{max_length} characters" if max_length
+                    else f"{name} must be at least {min_length} characters")
+    too_many_bytes = f"{name} must be at most {max_bytes} bytes of UTF-8"
+    not_utf8 = f"{name} must be valid UTF-8"
+
+    def check_string(value, latest):
+        if type(value) is not str:
+            raise _Rejected(missing if value is _MISSING else not_string)
+        length = len(value)
+        if length < min_length or (max_length is not None and length > max_length):
+            raise _Rejected(wrong_length)
+        if max_bytes is not None and not value.isascii():
+            try:
+                length = len(value.encode("utf-8"))
+            except UnicodeEncodeError:  # lone surrogates from JSON escapes
+                raise _Rejected(not_utf8) from None
+            if length > max_bytes:
+                raise _Rejected(too_many_bytes)
+        return value
+    return check_string
+
+
+def _number_check(field: Field) -> Check:
+    name, gt, ge, le, not_gt, not_ge, not_le = _bounds(field)
+    missing, not_number, not_finite = (
+        f"{name} is missing", f"{name} must be a number", f"{name} must be finite")
+
+    def check_number(value, latest):
+        if type(value) is not float:
+            if type(value) is not int and type(value) is not str:
+                raise _Rejected(missing if value is _MISSING else not_number)
+            try:
+                value = float(value)
+            except ValueError:
+                raise _Rejected(not_number) from None
+        if not math.isfinite(value):
+            raise _Rejected(not_finite)
+        if gt is not None and not value > gt:
+            raise _Rejected(not_gt)
+        if ge is not None and not value >= ge:
+            raise _Rejected(not_ge)
+        if le is not None and not value <= le:
+            raise _Rejected(not_le)
+        return value
+    return check_number
+
+
+def _integer_check(field: Field) -> Check:
+    name, gt, ge, le, not_gt, not_ge, not_le = _bounds(field)
+    missing, not_integer = f"{name} is missing", f"{name} must be an integer"
+
+    def check_integer(value, latest):
+        if type(value) is not int:
+            if type(value) is float and value.is_integer():
+                value = int(value)
+            elif type(value) is str:
+                try:
+                    value = int(value)
+                except ValueError:
+                    raise _Rejected(not_integer) from None
+            else:
+                raise _Rejected(missing if value is _MISSING else not_integer)
+        if gt is not None and not value > gt:
+            raise _Rejected(not_gt)
+        if ge is not None and not value >= ge:
+            raise _Rejected(not_ge)
+        if le is not None and not value <= le:
+            raise _Rejected(not_le)
+        return value
+    return check_integer
+
+
+def _timestamp_check(name: str, not_before: float,
+                     parse_timestamp: Callable[[str], datetime]) -> Check:
+    missing, not_iso = f"{name} is missing", f"{name} must be an ISO-8601 string"
+    too_old, in_future = f"{name} is too old", f"{name} is in the future"
+
+    def check_timestamp(value, latest):
+        if type(value) is not str:
+            raise _Rejected(missing if value is _MISSING else not_iso)
+        try:
+            value = parse_timestamp(value)
+        except ValueError:
+            raise _Rejected(not_iso) from None
+        epoch = (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp()
+        if epoch < not_before:
+            raise _Rejected(too_old)
+        if epoch > latest:
+            raise _Rejected(in_future)
+        return value
+    return check_timestamp
+
+
+def _bounds(field: Field):
+    """``(name, gt, ge, le, reason if not > gt, ... if not >= ge, ... if not <= le)``."""
+    gt, ge, le = field.gt, field.ge, field.le
+    return (field.name, gt, ge, le,
+            None if gt is None else f"{field.name} must be > {_limit(gt)}",
+            None if ge is None else f"{field.name} must be >= {_limit(ge)}",
+            None if le is None else f"{field.name} must be <= {_limit(le)}")
+
+
+def _limit(bound: float) -> str:
+    # Integer bounds in full: "{:g}" would print INT64_MAX as 9.22337e+18
+    return str(bound) if type(bound) is int else f"{bound:g}"
+
+
+validate_quotes = compile_schema(QUOTE_SCHEMA)
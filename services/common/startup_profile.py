@@ -0,0 +1,69 @@
+"""Opt-in cold-start profile shared by the producer and the processor.
+
+With ``STARTUP_PROFILE=true`` every ``profiler.phase(name)`` block is timed:
+module imports, logging setup and the lazily created AWS clients and heavy
+libraries. The handler logs ``profiler.report()`` so a cold start shows where
+its time went; phases that run later (a client first needed on the third
+invocation, say) show up in the next report. When disabled, ``phase`` only
+yields and nothing is recorded.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+
+class StartupProfiler:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self.phases: List[Dict[str, Any]] = []
+        self._reported = 0
+        self._first_report = True
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        if not self.enabled:
+            yield
+            return
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            finished = time.perf_counter()
+            with self._lock:
+                self.phases.append({
+                    "phase": name,
+                    "duration_ms": round((finished - started) * 1000, 3),
+                    "offset_ms": round((started - self.started) * 1000, 3),
+                })
+
+    def report(self) -> Optional[Dict[str, Any]]:
+        """Phases recorded since the last report, or None if there are none.
+
+        The first report also carries ``elapsed_ms``, the time from the
+        profiler's creation (the first import) to the call.
+        """
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            phases = self.phases[self._reported:]
+            self._reported = len(self.phases)
+            first, self._first_report = self._first_report, False
+
+        if not phases and not first:
+            return None
+        report: Dict[str, Any] = {"phases": phases}
+        if first:
+            report["elapsed_ms"] = round((time.perf_counter() - self.started) * 1000, 3)
+        return report
+
+
+# One profiler per process, so modules imported by app.py report into it too
+profiler = StartupProfiler(
+    enabled=os.environ.get("STARTUP_PROFILE", "false").lower() == "true"
+)
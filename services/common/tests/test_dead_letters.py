@@ -0,0 +1,39 @@
+import json
+from unittest.mock import MagicMock
+
+from dead_letters import MAX_LETTER_BYTES, letter_batches, letter_body, send_letter_batch
+
+
+def test_batches_hold_at_most_ten_letters_and_256_kib():
+    small = [(str(index), "x" * 100) for index in range(25)]
+    assert [len(batch) for batch in letter_batches(small)] == [10, 10, 5]
+
+    large = [(str(index), "x" * 60_000) for index in range(9)]
+    assert [len(batch) for batch in letter_batches(large)] == [4, 4, 1]
+
+
+def test_oversized_fields_are_dropped_from_the_body():
+    body = letter_body("processor", "undecodable record", record_id="r1", data="A" * MAX_LETTER_BYTES)
+
+    assert len(body) < MAX_LETTER_BYTES
+    assert json.loads(body) == {"source": "processor", "reason": "undecodable record",
+                                "record_id": "r1", "truncated": ["data"]}
+
+
+def test_refused_letters_are_mapped_back_to_their_keys():
+    sqs = MagicMock()
+    sqs.send_message_batch.return_value = {
+        "Successful": [{"Id": "0"}],
+        "Failed": [{"Id": "1", "Code": "InternalError", "SenderFault": False}],
+    }
+    calls = []
+
+    def call(fn, **kwargs):
+        calls.append(kwargs["QueueUrl"])
+        return fn(**kwargs)
+
+    unsent = send_letter_batch(sqs, "queue-url", [("record-a", "{}"), ("record-b", "{}")], call=call)
+
+    assert unsent == ["record-b"]
+    assert calls == ["queue-url"]
+    assert [entry["Id"] for entry in sqs.send_message_batch.call_args[1]["Entries"]] == ["0", "1"]
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from quote_codec import (
+    MAGIC, decode_payload, decode_quotes, encode_quotes, is_binary,
+    iso_to_micros, micros_to_iso,
+)
+
+QUOTES = [
+    {"symbol": "AAPL", "price": 189.25, "volume": 1200, "timestamp": "2024-01-02T14:30:00.123Z"},
+    {"symbol": "BRK.B", "price": 0.0001, "volume": 0, "timestamp": "2024-01-02T14:30:00.000Z"},
+]
+
+
+def test_round_trip():
+    payload = encode_quotes(QUOTES, event_time="2024-01-02T14:30:01.000Z", request_id="req-1")
+
+    assert is_binary(payload)
+    assert decode_quotes(payload) == [
+        {**quote, "event_time": "2024-01-02T14:30:01.000Z", "request_id": "req-1"}
+        for quote in QUOTES
+    ]
+
+
+def test_shared_fields_are_optional():
+    assert decode_quotes(encode_quotes(QUOTES)) == [
+        {**quote, "event_time": None, "request_id": None} for quote in QUOTES
+    ]
+
+
+def test_binary_is_smaller_than_json():
+    quotes = QUOTES * 50
+    payload = encode_quotes(quotes)
+
+    assert len(payload) < sum(len(json.dumps(quote)) for quote in quotes) / 2
+
+
+def test_legacy_json_is_detected():
+    payload = json.dumps(QUOTES[0]).encode("utf-8")
+
+    assert not is_binary(payload)
+    assert decode_payload(payload) == [QUOTES[0]]
+
+
+@pytest.mark.parametrize("payload", [
+    bytes((MAGIC,)),
+    encode_quotes(QUOTES)[:-3],
+    encode_quotes(QUOTES) + b"\x00",
+    bytes((MAGIC, 99)) + encode_quotes(QUOTES)[2:],
+])
+def test_malformed_records_raise_value_error(payload):
+    with pytest.raises(ValueError):
+        decode_payload(payload)
+
+
+@pytest.mark.parametrize("value", [
+    "2024-01-02T14:30:00.123Z",
+    "2024-01-02T14:30:00.123456Z",
+    "1969-12-31T23:59:59.999Z",
+])
+def test_timestamps_round_trip(value):
+    assert micros_to_iso(iso_to_micros(value)) == value
+
+
+def test_timestamps_are_canonicalised_to_milliseconds():
+    assert micros_to_iso(iso_to_micros("2024-01-02T14:30:00+00:00")) == "2024-01-02T14:30:00.000Z"
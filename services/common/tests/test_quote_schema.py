@@ -0,0 +1,90 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from quote_schema import QUOTE_SCHEMA, Field, Schema, compile_schema, validate_quotes
+
+NOW = datetime(2024, 1, 2, 15, 0, tzinfo=timezone.utc).timestamp()
+GOOD = {"symbol": "AAPL", "price": 189.25, "volume": 1200, "timestamp": "2024-01-02T14:30:00.123Z"}
+
+
+def test_valid_quotes_come_back_normalised_in_schema_order():
+    valid, rejected = validate_quotes([
+        GOOD,
+        {"symbol": "MSFT", "price": "401.5", "volume": 3.0, "timestamp": "2024-01-02T14:30:00"},
+    ], now=NOW)
+
+    assert rejected == []
+    assert valid == [
+        (0, ("AAPL", 189.25, 1200, datetime(2024, 1, 2, 14, 30, 0, 123000, tzinfo=timezone.utc))),
+        (1, ("MSFT", 401.5, 3, datetime(2024, 1, 2, 14, 30))),
+    ]
+
+
+@pytest.mark.parametrize("change, reason", [
+    ({"symbol": None}, "symbol must be a string"),
+    ({"symbol": ""}, "symbol must be 1-255 characters"),
+    # The binary codec holds symbols of up to 255 bytes, not characters
+    ({"symbol": "\u20ac" * 100}, "symbol must be at most 255 bytes of UTF-8"),
+    ({"symbol": "\ud800"}, "symbol must be valid UTF-8"),
+    ({"price": 0}, "price must be > 0"),
+    ({"price": -1.5}, "price must be > 0"),
+    ({"price": float("nan")}, "price must be finite"),
+    ({"price": "abc"}, "price must be a number"),
+    ({"price": True}, "price must be a number"),
+    ({"volume": -1}, "volume must be >= 0"),
+    ({"volume": 1.5}, "volume must be an integer"),
+    # Volumes are stored as signed 64-bit integers downstream
+    ({"volume": 2 ** 63}, "volume must be <= 9223372036854775807"),
+    ({"volume": 1e20}, "volume must be <= 9223372036854775807"),
+    ({"volume": "99999999999999999999"}, "volume must be <= 9223372036854775807"),
+    ({"timestamp": "yesterday"}, "timestamp must be an ISO-8601 string"),
+    ({"timestamp": 1704205800}, "timestamp must be an ISO-8601 string"),
+    ({"timestamp": "1999-12-31T23:59:59Z"}, "timestamp is too old"),
+    ({"timestamp": "2024-01-03T15:00:01Z"}, "timestamp is in the future"),
+])
+def test_each_violation_is_rejected_with_its_reason(change, reason):
+    assert validate_quotes([{**GOOD, **change}], now=NOW) == ([], [(0, reason)])
+
+
+def test_the_largest_int64_volume_is_accepted():
+    [(_, values)], rejected = validate_quotes([{**GOOD, "volume": 2 ** 63 - 1}], now=NOW)
+
+    assert rejected == [] and values[2] == 2 ** 63 - 1
+
+
+def test_multibyte_symbols_within_255_bytes_are_accepted():
+    [(_, values)], rejected = validate_quotes([{**GOOD, "symbol": "\u20ac" * 85}], now=NOW)
+
+    assert rejected == [] and values[0] == "\u20ac" * 85
+
+
+def test_missing_fields_and_non_objects_are_rejected():
+    quote = dict(GOOD)
+    del quote["volume"]
+
+    valid, rejected = validate_quotes([GOOD, quote, ["AAPL"], GOOD], now=NOW)
+
+    assert [index for index, _ in valid] == [0, 3]
+    assert rejected == [(1, "volume is missing"), (2, "quote must be an object")]
+
+
+def test_schemas_compile_with_their_own_fields_and_parser():
+    parsed = []
+
+    def parse(value):
+        parsed.append(value)
+        return datetime.fromisoformat(value)
+
+    validate = compile_schema(Schema((Field("ticker", "string", max_length=5),
+                                      Field("at", "timestamp"))), parse)
+
+    assert validate([{"ticker": "TOOLONG", "at": "2024-01-02T14:30:00Z"},
+                     {"ticker": "AAPL", "at": "2024-01-02T14:30:00Z"}], now=NOW) == (
+        [(1, ("AAPL", datetime(2024, 1, 2, 14, 30, tzinfo=timezone.utc)))],
+        [(0, "ticker must be 1-5 characters")],
+    )
+    assert parsed == ["2024-01-02T14:30:00Z"]
+    assert QUOTE_SCHEMA.names == ("symbol", "price", "volume", "timestamp")
+    with pytest.raises(ValueError):
+        Field("price", "decimal")
@@ -0,0 +1,43 @@
+from startup_profile import StartupProfiler
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = StartupProfiler(enabled=False)
+
+    with profiler.phase("import:boto3"):
+        pass
+
+    assert profiler.phases == []
+    assert profiler.report() is None
+
+
+def test_first_report_covers_init_and_later_reports_only_new_phases():
+    profiler = StartupProfiler(enabled=True)
+    with profiler.phase("import:botocore"):
+        pass
+    with profiler.phase("init:logging"):
+        pass
+
+    first = profiler.report()
+    assert [phase["phase"] for phase in first["phases"]] == ["import:botocore", "init:logging"]
+    assert first["elapsed_ms"] >= first["phases"][-1]["offset_ms"]
+
+    assert profiler.report() is None
+
+    with profiler.phase("init:s3"):
+        pass
+    later = profiler.report()
+    assert [phase["phase"] for phase in later["phases"]] == ["init:s3"]
+    assert "elapsed_ms" not in later
+
+
+def test_phase_is_recorded_when_it_raises():
+    profiler = StartupProfiler(enabled=True)
+
+    try:
+        with profiler.phase("init:dynamodb"):
+            raise RuntimeError("no credentials")
+    except RuntimeError:
+        pass
+
+    assert profiler.phases[0]["phase"] == "init:dynamodb"
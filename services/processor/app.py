@@ -2,38 +2,150 @@ import base64
 import json
 import logging
 import os
-from collections import defaultdict, deque
+import random
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from decimal import Decimal
+from functools import lru_cache
+from typing import Callable, Dict, Any, List, Optional, Set, Tuple
 
-import boto3
-from botocore.exceptions import ClientError, BotoCoreError
-from pythonjsonlogger import jsonlogger
+from startup_profile import profiler
+
+# boto3 itself, NumPy (vectorized analytics) and pyarrow (Parquet archive)
+# are imported on first use; see get_dynamodb and friends below.
+with profiler.phase("import:botocore"):
+    from botocore.config import Config
+    from botocore.exceptions import ClientError, BotoCoreError
+with profiler.phase("import:pythonjsonlogger"):
+    from pythonjsonlogger import jsonlogger
+
+with profiler.phase("import:pipeline"):
+    from archive import ParquetArchiveWriter, put_partition
+    from checkpoints import CheckpointStore, ShardCheckpoint, record_position, shard_of
+    from dead_letters import letter_batches, letter_body, send_letter_batch
+    from bars import Bar, BarAggregator, bar_partitions, encode_bars, parse_intervals
+    from indicators import IndicatorConfig, IndicatorEngine
+    from io_stage import IOStage
+    from state_store import WRITE_BATCH_SIZE as STATE_WRITE_BATCH_SIZE, IndicatorStateStore
+    from metrics import InvocationMetrics
+    from retry import AdaptiveRetry, AIMDLimiter, Deadline, DeadlineExceeded, Throttled, is_throttle
+    from fast_decode import decode_record, parse_timestamp
+    from quote_batch import NS_PER_MS, NS_PER_US, QuoteBatch, epoch_ns
+    from quote_schema import QUOTE_SCHEMA, compile_schema
 
 # =====================================================
 # Configuration
 # =====================================================
-DYNAMODB_TABLE = os.environ["DYNAMODB_TABLE"]
-S3_BUCKET = os.environ["S3_BUCKET"]
+# Required; checked when the handler runs rather than at import
+DYNAMODB_TABLE = os.environ.get("DYNAMODB_TABLE", "")
+S3_BUCKET = os.environ.get("S3_BUCKET", "")
 SECRET_NAME = os.environ.get("SECRET_NAME", "stock-api-key-dev")
 
-MOVING_AVG_WINDOW = 5
+# "parquet" buffers each invocation into one file per date partition;
+# "json" keeps the legacy one-object-per-event layout.
+S3_ARCHIVE_FORMAT = os.environ.get("S3_ARCHIVE_FORMAT", "parquet")
+
+# Records that fail the quote schema go to this SQS queue; when it is unset
+# they are reported as batch item failures instead
+DLQ_URL = os.environ.get("DLQ_URL", "")
+# Rejected quotes copied into each dead letter, beyond which only the count is kept
+MAX_DEAD_LETTER_QUOTES = int(os.environ.get("MAX_DEAD_LETTER_QUOTES", "100"))
+
+# Indicator windows, in ticks
+MOVING_AVG_WINDOW = int(os.environ.get("MOVING_AVG_WINDOW", "5"))
+EMA_SPAN = int(os.environ.get("EMA_SPAN", "10"))
+VWAP_WINDOW = int(os.environ.get("VWAP_WINDOW", "20"))
+VOLATILITY_WINDOW = int(os.environ.get("VOLATILITY_WINDOW", "20"))
+# Symbols whose indicator state a warm container keeps; the least recently
+# used are evicted between batches (0 keeps every symbol)
+MAX_TRACKED_SYMBOLS = int(os.environ.get("MAX_TRACKED_SYMBOLS", "10000"))
+
+# "scalar" updates indicators tick by tick, "vectorized" computes them per
+# symbol over the whole batch with NumPy, and "auto" picks vectorized once a
+# batch is large enough to amortise the array setup.
+ANALYTICS_MODE = os.environ.get("ANALYTICS_MODE", "auto")
+VECTORIZED_MIN_RECORDS = int(os.environ.get("VECTORIZED_MIN_RECORDS", "256"))
+
+# BatchWriteItem accepts at most 25 put requests per call
+DYNAMODB_BATCH_SIZE = 25
+
+# "ticks" writes every tick, "latest" only upserts one latest-quote item per
+# symbol per batch, "both" does both.
+DYNAMODB_WRITE_MODE = os.environ.get("DYNAMODB_WRITE_MODE", "ticks")
+# Sort key of the latest-quote item; sorts after every ISO-8601 tick timestamp
+LATEST_QUOTE_TIMESTAMP = "LATEST"
+
+# Snapshot each changed symbol's indicator windows after every batch and load
+# them on a cache miss, so windows survive cold starts and shard moves.
+# Snapshots use sort key "STATE" in STATE_TABLE (default: the tick table),
+# and each shard's last container sort key "STATE_OWNER".
+PERSIST_INDICATOR_STATE = os.environ.get("PERSIST_INDICATOR_STATE", "true").lower() == "true"
+STATE_TABLE = os.environ.get("STATE_TABLE", "") or DYNAMODB_TABLE
+
+# Skip records a shard has already processed (retried or replayed batches)
+# before decoding them. Per-shard checkpoints use sort key "CHECKPOINT" in
+# CHECKPOINT_TABLE (default: STATE_TABLE); DEDUPE_FILTER_CAPACITY sizes the
+# filter of records that succeeded after an earlier record failed.
+DEDUPE_RECORDS = os.environ.get("DEDUPE_RECORDS", "true").lower() == "true"
+CHECKPOINT_TABLE = os.environ.get("CHECKPOINT_TABLE", "") or STATE_TABLE
+DEDUPE_FILTER_CAPACITY = int(os.environ.get("DEDUPE_FILTER_CAPACITY", "10000"))
+
+# OHLCV + VWAP bars per symbol for each interval ("" turns bars off). A bar is
+# written once event time passes its end by BAR_ALLOWED_LATENESS_MS and a tick
+# of its symbol has passed its end; later ticks are left out of it. A bar
+# whose symbol has no such tick within BAR_IDLE_TIMEOUT_MS is not written.
+# Closed bars go to the BARS_TABLE rollup table (when set) and as Parquet
+# under BARS_S3_PREFIX in S3_BUCKET.
+BAR_INTERVALS = parse_intervals(os.environ.get("BAR_INTERVALS", "1m,5m"))
+BAR_ALLOWED_LATENESS_MS = int(os.environ.get("BAR_ALLOWED_LATENESS_MS", "10000"))
+BAR_IDLE_TIMEOUT_MS = int(os.environ.get("BAR_IDLE_TIMEOUT_MS", "300000"))
+BARS_TABLE = os.environ.get("BARS_TABLE", "")
+BARS_S3_PREFIX = os.environ.get("BARS_S3_PREFIX", "bars/")
+# Closed bars kept for another attempt after a failed write, per sink
+MAX_PENDING_BARS = int(os.environ.get("MAX_PENDING_BARS", "100000"))
+
+# Concurrent writes per invocation; also sizes the botocore connection pools
+# and caps the adaptive concurrency limit
+IO_MAX_WORKERS = int(os.environ.get("IO_MAX_WORKERS", "16"))
+
+# Retries of every DynamoDB and S3 call, on throttles, 5xx and connection
+# errors (the DYNAMODB_ names are still read for existing deployments)
+AWS_MAX_RETRIES = int(os.environ.get(
+    "AWS_MAX_RETRIES", os.environ.get("DYNAMODB_MAX_RETRIES", "5")))
+AWS_BACKOFF_BASE = float(os.environ.get(
+    "AWS_BACKOFF_BASE", os.environ.get("DYNAMODB_BACKOFF_BASE", "0.05")))
+AWS_BACKOFF_CAP = float(os.environ.get("AWS_BACKOFF_CAP", "2.0"))
+AWS_CONNECT_TIMEOUT = float(os.environ.get("AWS_CONNECT_TIMEOUT", "2"))
+AWS_READ_TIMEOUT = float(os.environ.get("AWS_READ_TIMEOUT", "10"))
+# Time kept back from the Lambda timeout to report the records that were not
+# reached. No call is started unless it can run to its connect and read
+# timeouts before the reserve begins.
+DEADLINE_RESERVE_MS = int(os.environ.get("DEADLINE_RESERVE_MS", "3000"))
+
+# Share of per-record success logs kept; failures are always logged in full
+LOG_RECORD_SAMPLE_RATE = float(os.environ.get("LOG_RECORD_SAMPLE_RATE", "0.01"))
+EMIT_METRICS = os.environ.get("EMIT_METRICS", "true").lower() == "true"
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "StockPipeline")
 
 # =====================================================
 # Logging (Structured)
 # =====================================================
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+with profiler.phase("init:logging"):
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
 
-# Clear any existing handlers
-if logger.handlers:
-    for handler in logger.handlers:
-        logger.removeHandler(handler)
+    # Clear any existing handlers
+    if logger.handlers:
+        for handler in logger.handlers:
+            logger.removeHandler(handler)
 
-logHandler = logging.StreamHandler()
-formatter = jsonlogger.JsonFormatter()
-logHandler.setFormatter(formatter)
-logger.addHandler(logHandler)
+    logHandler = logging.StreamHandler()
+    formatter = jsonlogger.JsonFormatter()
+    logHandler.setFormatter(formatter)
+    logger.addHandler(logHandler)
 
 
 def log(message: str, level: str = "info", **kwargs):
@@ -48,14 +160,100 @@ def log(message: str, level: str = "info", **kwargs):
         logger.info(log_data)
 
 
+def sampled() -> bool:
+    """Whether to keep a per-record success log line."""
+    return LOG_RECORD_SAMPLE_RATE >= 1 or random.random() < LOG_RECORD_SAMPLE_RATE
+
+
+# Aggregated per invocation and emitted as CloudWatch Embedded Metric Format
+metrics = InvocationMetrics(METRICS_NAMESPACE, {
+    "FunctionName": os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "stock-stream-processor"),
+})
+
 # =====================================================
 # AWS Clients
 # =====================================================
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(DYNAMODB_TABLE)
+# Created on first use and reused while warm. Writes run on I/O stage
+# threads and boto3's default session is not thread-safe, hence the lock.
+_clients: Dict[str, Any] = {}
+_clients_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _boto3():
+    with profiler.phase("import:boto3"):
+        import boto3
+    return boto3
+
+
+def _client(name: str, create: Callable[[], Any]):
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                with profiler.phase(f"init:{name}"):
+                    client = _clients[name] = create()
+    return client
+
+
+def _io_config() -> Config:
+    # botocore keeps 10 pooled connections by default, fewer than the I/O
+    # stage can have in flight. Retries are left to `retrier`, which knows
+    # the invocation's deadline.
+    return Config(
+        max_pool_connections=IO_MAX_WORKERS,
+        connect_timeout=AWS_CONNECT_TIMEOUT,
+        read_timeout=AWS_READ_TIMEOUT,
+        retries={"total_max_attempts": 1},
+    )
 
-s3 = boto3.client("s3")
-secrets_manager = boto3.client("secretsmanager")
+
+def get_dynamodb():
+    return _client("dynamodb", lambda: _boto3().resource("dynamodb", config=_io_config()))
+
+
+def get_table():
+    return _client("table", lambda: get_dynamodb().Table(DYNAMODB_TABLE))
+
+
+def get_s3():
+    return _client("s3", lambda: _boto3().client("s3", config=_io_config()))
+
+
+def get_sqs():
+    return _client("sqs", lambda: _boto3().client("sqs", config=_io_config()))
+
+
+def get_secrets_manager():
+    return _client("secretsmanager", lambda: _boto3().client("secretsmanager"))
+
+
+io_stage = IOStage(IO_MAX_WORKERS)
+
+
+def _on_retry(err: BaseException, attempt: int):
+    metrics.count("AWSThrottles" if is_throttle(err) else "AWSRetries")
+
+
+# Shared by every AWS call; its deadline is set per invocation
+retrier = AdaptiveRetry(
+    AIMDLimiter(IO_MAX_WORKERS, maximum=IO_MAX_WORKERS),
+    max_attempts=AWS_MAX_RETRIES + 1,
+    backoff_base=AWS_BACKOFF_BASE,
+    backoff_cap=AWS_BACKOFF_CAP,
+    on_retry=_on_retry,
+    attempt_timeout=AWS_CONNECT_TIMEOUT + AWS_READ_TIMEOUT,
+)
+
+
+def out_of_time(stage: str) -> bool:
+    """True, with a warning, when no AWS call of ``stage`` could finish in time."""
+    if not retrier.out_of_time():
+        return False
+    log("Invocation deadline reached - skipping " + stage, level="warning", stage=stage)
+    metrics.count("StagesSkipped")
+    return True
 
 # =====================================================
 # Secrets Management
@@ -71,7 +269,7 @@ def get_secret() -> Dict[str, Any]:
         return _secret_cache
     
     try:
-        response = secrets_manager.get_secret_value(SecretId=SECRET_NAME)
+        response = get_secrets_manager().get_secret_value(SecretId=SECRET_NAME)
         
         if "SecretString" in response:
             _secret_cache = json.loads(response["SecretString"])
@@ -90,35 +288,514 @@ def get_secret() -> Dict[str, Any]:
 # =====================================================
 # In-memory state (warm Lambda only)
 # =====================================================
-price_cache: Dict[str, deque] = defaultdict(
-    lambda: deque(maxlen=MOVING_AVG_WINDOW)
-)
+indicator_engine = IndicatorEngine(IndicatorConfig(
+    sma_window=MOVING_AVG_WINDOW,
+    ema_span=EMA_SPAN,
+    vwap_window=VWAP_WINDOW,
+    volatility_window=VOLATILITY_WINDOW,
+), max_symbols=MAX_TRACKED_SYMBOLS or None)
+state_store = IndicatorStateStore(STATE_TABLE)
+# Names this container in the shard claims that tell it its windows are current
+CONTAINER_ID = uuid.uuid4().hex
+checkpoint_store = CheckpointStore(CHECKPOINT_TABLE, DEDUPE_FILTER_CAPACITY)
+bar_aggregator = BarAggregator(BAR_INTERVALS, BAR_ALLOWED_LATENESS_MS, BAR_IDLE_TIMEOUT_MS)
+# Closed bars whose write failed, retried with the next invocation's bars
+pending_bars: Dict[str, List[Bar]] = {"dynamodb": [], "s3": []}
 
 
 # =====================================================
 # Helpers
 # =====================================================
-def decode_kinesis_record(record: Dict[str, Any]) -> Dict[str, Any]:
-    payload = base64.b64decode(record["kinesis"]["data"]).decode("utf-8")
-    return json.loads(payload)
+def decode_kinesis_record(record: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Decode a record's quotes: one legacy JSON document or a binary aggregate."""
+    return decode_record(record)
+
+
+# Validates a decoded batch in one pass; timestamps are parsed by fromisoformat
+validate_quotes = compile_schema(QUOTE_SCHEMA, parse_timestamp)
+
+
+def dead_letter_rejects(rejects: Dict[str, List[Dict[str, Any]]],
+                        records: Dict[str, Dict[str, Any]]) -> Set[str]:
+    """Send every record with rejected quotes to the DLQ, one letter each.
 
+    `rejects` maps eventIDs to their rejected quotes and reasons. Returns the
+    eventIDs that were not dead-lettered and have to fail instead.
+    """
+    rejected = sum(len(entries) for entries in rejects.values())
+    metrics.count("QuotesRejected", rejected)
+    # One line for the whole batch, however many quotes a poison feed sends
+    log("Invalid quotes rejected", level="warning",
+        records=len(rejects), quotes=rejected,
+        reasons=dict(Counter(entry["reason"] for entries in rejects.values() for entry in entries)),
+        sample_record_ids=list(rejects)[:5],
+        dead_letter=bool(DLQ_URL))
+    if not DLQ_URL:
+        return set(rejects)
 
-def calculate_moving_average(symbol: str, price: float) -> float:
-    prices = price_cache[symbol]
-    prices.append(price)
-    return round(sum(prices) / len(prices), 2)
+    letters = []
+    for record_id, entries in rejects.items():
+        kinesis = records[record_id].get("kinesis", {})
+        fields: Dict[str, Any] = {
+            "record_id": record_id,
+            "sequence_number": kinesis.get("sequenceNumber"),
+            "rejected_quotes": len(entries),
+            "quotes": entries[:MAX_DEAD_LETTER_QUOTES],
+        }
+        if any("quote" not in entry for entry in entries):
+            # Undecodable: keep the payload as it arrived
+            fields["data"] = kinesis.get("data")
+        letters.append((record_id, letter_body("stock-stream-processor", entries[0]["reason"], **fields)))
 
+    tasks: List[WriteTask] = [
+        (None, lambda batch=batch: _send_dead_letters(batch), [record_id for record_id, _ in batch])
+        for batch in letter_batches(letters)
+    ]
+    with metrics.timer("DeadLetterTime"):
+        unsent = run_write_tasks(tasks)
+    metrics.count("RecordsDeadLettered", len(rejects) - len(unsent))
+    return unsent
 
-def write_to_dynamodb(item: Dict[str, Any]):
+
+def _send_dead_letters(batch) -> List[str]:
     try:
-        table.put_item(Item=item)
-        log("DynamoDB write successful", 
-            symbol=item.get("symbol"), 
-            timestamp=item.get("timestamp"))
-    except Exception as err:
-        log("DynamoDB write failed", level="error", 
-            error=str(err), error_type=type(err).__name__)
+        unsent = send_letter_batch(get_sqs(), DLQ_URL, batch, call=retrier.call)
+    except (ClientError, BotoCoreError, DeadlineExceeded) as err:
+        log("Dead-letter send failed", level="error",
+            error=str(err), error_type=type(err).__name__, letters=len(batch))
         raise
+    if unsent:
+        log("Dead-letter queue refused letters", level="error", record_ids=unsent)
+    return unsent
+
+
+def use_vectorized_analytics(batch_size: int) -> bool:
+    if ANALYTICS_MODE == "auto":
+        return batch_size >= VECTORIZED_MIN_RECORDS
+    return ANALYTICS_MODE == "vectorized"
+
+
+@lru_cache(maxsize=None)
+def _batch_analytics():
+    # Pulls in NumPy, which scalar-sized batches never need
+    with profiler.phase("import:batch_analytics"):
+        import batch_analytics
+    return batch_analytics
+
+
+def add_indicators(batch: QuoteBatch, sequence_numbers: Dict[str, int]):
+    """Fill the batch's indicator columns, in sequence order per symbol."""
+    batch.reset_indicators()
+    if not use_vectorized_analytics(len(batch)):
+        state = indicator_engine.state
+        for row, (symbol, price, volume) in enumerate(zip(batch.symbols, batch.prices, batch.volumes)):
+            ticks = state(symbol)
+            ticks.update(price, volume)
+            batch.set_indicators(row, ticks.rounded())
+        return
+
+    import numpy as np
+    record_ids = batch.record_ids
+    order = sorted(range(len(batch)), key=lambda row: sequence_numbers[record_ids[row]])
+    prices, volumes = batch.column("prices"), batch.column("volumes")
+    outputs = [batch.column(name) for name in ("moving_average", "ema", "stddev", "vwap")]
+    compute_columns = _batch_analytics().compute_columns
+    for symbol, rows in batch.rows_by_symbol(order).items():
+        rows = np.asarray(rows, dtype=np.intp)
+        values = compute_columns(indicator_engine.state(symbol), prices[rows], volumes[rows])
+        for output, column in zip(outputs, values):
+            output[rows] = column
+
+
+def rollback_indicators(batch: QuoteBatch, saved: Dict[str, Any],
+                        failed: Set[str], sequence_numbers: Dict[str, int]):
+    """Take the ticks of records whose writes failed back out of the engine.
+
+    Each symbol with a failed record is restored to its state from before
+    the batch and its successful ticks are folded in again, in sequence order.
+    """
+    record_ids = batch.record_ids
+    failed_rows = [row for row, record_id in enumerate(record_ids) if record_id in failed]
+    symbols = {batch.symbols[row] for row in failed_rows}
+    order = sorted(
+        (row for row, symbol in enumerate(batch.symbols)
+         if symbol in symbols and record_ids[row] not in failed),
+        key=lambda row: sequence_numbers[record_ids[row]],
+    )
+    for symbol in symbols:
+        indicator_engine.restore(symbol, saved[symbol])
+    for row in order:
+        indicator_engine.state(batch.symbols[row]).update(batch.prices[row], batch.volumes[row])
+    metrics.count("StateRollbacks", len(symbols))
+
+
+def stale_indicator_symbols(batch: QuoteBatch) -> Set[str]:
+    """Warm symbols of shards another container has processed since this one.
+
+    Claims each of the batch's shards for this container. A shard whose
+    claim fails is treated as having moved.
+    """
+    held: Dict[str, Set[str]] = defaultdict(set)
+    for record_id, symbol in zip(batch.record_ids, batch.symbols):
+        # Every shard is claimed, also those without warm symbols
+        warm = held[shard_of(record_id)]
+        if symbol in indicator_engine.symbols:
+            warm.add(symbol)
+
+    stale: Set[str] = set()
+    for shard_id, symbols in held.items():
+        try:
+            if retrier.call(state_store.claim, get_dynamodb(), shard_id, CONTAINER_ID):
+                continue
+        except (ClientError, BotoCoreError, DeadlineExceeded) as err:
+            log("Shard claim failed - re-reading its indicator state", level="warning",
+                error=str(err), error_type=type(err).__name__, shard_id=shard_id)
+        stale |= symbols
+    metrics.count("StateRefreshed", len(stale))
+    return stale
+
+
+def hydrate_indicator_state(symbols: Set[str], refresh: Set[str]) -> bool:
+    """Load persisted windows for symbols the engine does not hold yet, and
+    newer ones for the ``refresh`` symbols it does.
+
+    Returns False when the snapshots could not be read.
+    """
+    try:
+        with metrics.timer("StateHydrateLatency"):
+            loaded = state_store.hydrate(get_dynamodb(), indicator_engine, symbols,
+                                         call=retrier.call, refresh=refresh)
+    except (ClientError, BotoCoreError, DeadlineExceeded, Throttled, ValueError) as err:
+        log("Indicator state hydration failed", level="error",
+            error=str(err), error_type=type(err).__name__, symbols=len(symbols | refresh))
+        return False
+    metrics.count("StateHydrated", len(loaded))
+    return True
+
+
+def to_dynamodb_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """The DynamoDB resource rejects floats, so numbers go in as Decimal."""
+    return {
+        key: Decimal(str(value)) if isinstance(value, float) else value
+        for key, value in item.items()
+    }
+
+
+# A write task is (ordering key, fn, eventIDs covered). fn returns the
+# eventIDs it could not write; if it raises, every covered eventID failed.
+WriteTask = Tuple[Optional[str], Callable[[], List[str]], List[str]]
+
+
+def dynamodb_write_tasks(batch: QuoteBatch) -> List[WriteTask]:
+    """Split the batch's rows into BatchWriteItem chunks of DYNAMODB_BATCH_SIZE."""
+    # BatchWriteItem rejects duplicate keys within one request, so the last
+    # row per key wins and every eventID that produced it shares its outcome.
+    owners: Dict[Tuple[str, str], List[str]] = defaultdict(list)
+    latest: Dict[Tuple[str, str], int] = {}
+    for row, key in enumerate(zip(batch.symbols, batch.timestamps)):
+        owners[key].append(batch.record_ids[row])
+        latest[key] = row
+
+    keys = list(latest)
+    tasks: List[WriteTask] = []
+    for start in range(0, len(keys), DYNAMODB_BATCH_SIZE):
+        chunk = keys[start:start + DYNAMODB_BATCH_SIZE]
+
+        def write_chunk(chunk=chunk) -> List[str]:
+            # Items are only built as dicts when their chunk is written
+            items = {key: batch.item(latest[key]) for key in chunk}
+            return [
+                record_id
+                for key in _write_dynamodb_chunk(items)
+                for record_id in owners[key]
+            ]
+
+        # Keys within the tick table are distinct, so chunks need no ordering
+        tasks.append((None, write_chunk,
+                      [record_id for key in chunk for record_id in owners[key]]))
+    return tasks
+
+
+def _write_dynamodb_chunk(
+    chunk: Dict[Tuple[str, str], Dict[str, Any]],
+    table_name: Optional[str] = None,
+) -> List[Tuple[str, str]]:
+    """Write one BatchWriteItem chunk, retrying UnprocessedItems as throttles.
+
+    Returns the keys of the items that could not be written.
+    """
+    table_name = table_name or DYNAMODB_TABLE
+    pending = [
+        {"PutRequest": {"Item": to_dynamodb_item(item)}}
+        for item in chunk.values()
+    ]
+
+    def write():
+        nonlocal pending
+        with metrics.timer("DynamoDBWriteLatency"):
+            response = get_dynamodb().batch_write_item(
+                RequestItems={table_name: pending}
+            )
+        pending = response.get("UnprocessedItems", {}).get(table_name, [])
+        if pending:
+            metrics.count("DynamoDBThrottledRetries")
+            log("DynamoDB batch write left unprocessed items", level="warning",
+                unprocessed_items=len(pending))
+            raise Throttled(f"{len(pending)} unprocessed items")
+
+    try:
+        retrier.call(write)
+    except Throttled:
+        log("DynamoDB unprocessed items exhausted retries", level="error",
+            unprocessed_items=len(pending))
+        return [_item_key(request) for request in pending]
+    except (ClientError, BotoCoreError, DeadlineExceeded) as err:
+        log("DynamoDB batch write failed", level="error",
+            error=str(err), error_type=type(err).__name__,
+            items=len(pending))
+        return [_item_key(request) for request in pending]
+    return []
+
+
+def _item_key(request: Dict[str, Any]) -> Tuple[str, str]:
+    item = request["PutRequest"]["Item"]
+    return item["symbol"], item["timestamp"]
+
+
+def latest_quote_tasks(batch: QuoteBatch) -> List[WriteTask]:
+    """Collapse a batch to its newest tick per symbol, one upsert each.
+
+    Every eventID of a symbol shares the outcome of that symbol's upsert:
+    older ticks in the batch are superseded by it, not lost, since the
+    archive still holds them.
+    """
+    newest: Dict[str, int] = {}
+    owners: Dict[str, List[str]] = defaultdict(list)
+    event_ns = batch.event_ns
+    for row, symbol in enumerate(batch.symbols):
+        owners[symbol].append(batch.record_ids[row])
+        if symbol not in newest or event_ns[row] >= event_ns[newest[symbol]]:
+            newest[symbol] = row
+
+    return [
+        (symbol,
+         lambda row=row: write_latest_quote(batch.item(row), event_ns[row] // NS_PER_US) or [],
+         owners[symbol])
+        for symbol, row in newest.items()
+    ]
+
+
+def write_latest_quote(item: Dict[str, Any], quote_time_us: int):
+    """Upsert the symbol's latest-quote item unless it already holds a newer tick.
+
+    ``quote_time_us`` is the tick's timestamp in epoch microseconds. Ticks
+    are ordered by it rather than by their timestamp strings, which arrive
+    with or without fractions and offsets.
+    """
+    values = to_dynamodb_item(item)
+    values["quote_timestamp"] = values.pop("timestamp")
+    values["quote_time_us"] = quote_time_us
+    symbol = values.pop("symbol")
+
+    names = {f"#{field}": field for field in values}
+    try:
+        with metrics.timer("DynamoDBWriteLatency"):
+            retrier.call(
+                get_table().update_item,
+                Key={"symbol": symbol, "timestamp": LATEST_QUOTE_TIMESTAMP},
+                UpdateExpression="SET " + ", ".join(f"#{field} = :{field}" for field in values),
+                # Items written before quote_time_us existed are replaced once
+                ConditionExpression=(
+                    "attribute_not_exists(#quote_time_us) OR #quote_time_us < :quote_time_us"
+                ),
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues={f":{field}": value for field, value in values.items()},
+            )
+    except ClientError as err:
+        if err.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+            metrics.count("LatestQuoteSkipped")
+            if sampled():
+                log("Latest quote already newer - skipped",
+                    symbol=symbol, timestamp=values["quote_timestamp"])
+            return
+        log("Latest quote write failed", level="error",
+            error=str(err), error_type=type(err).__name__, symbol=symbol)
+        raise
+
+
+def load_checkpoints(records: List[Dict[str, Any]]) -> Dict[str, ShardCheckpoint]:
+    """Checkpoints of the shards in a batch.
+
+    A shard whose checkpoint cannot be read is left out, so its records are
+    all processed, as they were before checkpoints existed.
+    """
+    shard_ids = {position[0] for position in map(_record_position, records) if position}
+    checkpoints = {}
+    for shard_id in shard_ids:
+        try:
+            checkpoints[shard_id] = retrier.call(checkpoint_store.get, get_dynamodb(), shard_id)
+        except (ClientError, BotoCoreError, DeadlineExceeded) as err:
+            metrics.count("CheckpointUnavailable")
+            log("Shard checkpoint could not be read - not skipping duplicates", level="warning",
+                error=str(err), error_type=type(err).__name__, shard_id=shard_id)
+    return checkpoints
+
+
+def save_checkpoints(checkpoints: Dict[str, ShardCheckpoint],
+                     records: List[Dict[str, Any]], failed_ids: Dict[str, None]):
+    """Advance each shard's checkpoint past the batch's successful records."""
+    outcomes: Dict[str, Tuple[List[int], List[int]]] = defaultdict(lambda: ([], []))
+    for record in records:
+        position = _record_position(record)
+        if position and position[0] in checkpoints:
+            outcomes[position[0]][record["eventID"] in failed_ids].append(position[1])
+
+    for shard_id, (succeeded, failed) in outcomes.items():
+        checkpoint = checkpoints[shard_id]
+        checkpoint.advance(succeeded, failed)
+        if out_of_time("checkpoint save"):
+            # Kept in memory like a failed save; the next batch saves it
+            metrics.count("CheckpointSaveFailed")
+            continue
+        try:
+            if not retrier.call(checkpoint_store.save, get_dynamodb(), checkpoint):
+                log("Shard checkpoint is newer in the table - dropped ours", level="warning",
+                    shard_id=shard_id)
+        except (ClientError, BotoCoreError, DeadlineExceeded) as err:
+            # Kept in memory; the next batch saves it again
+            metrics.count("CheckpointSaveFailed")
+            log("Shard checkpoint save failed", level="error",
+                error=str(err), error_type=type(err).__name__, shard_id=shard_id)
+
+
+def _record_position(record: Dict[str, Any]) -> Optional[Tuple[str, int]]:
+    try:
+        return record_position(record)
+    except (KeyError, ValueError):
+        return None
+
+
+def state_snapshot_tasks(symbols: Set[str]) -> List[WriteTask]:
+    """Snapshot tasks for the symbols a batch changed.
+
+    They cover no records: a lost snapshot only means the next cold start
+    resumes from an older window.
+    """
+    items = state_store.items(indicator_engine, symbols)
+    tasks: List[WriteTask] = []
+    for start in range(0, len(items), STATE_WRITE_BATCH_SIZE):
+        chunk = items[start:start + STATE_WRITE_BATCH_SIZE]
+
+        def write_chunk(chunk=chunk) -> List[str]:
+            try:
+                with metrics.timer("StateSnapshotLatency"):
+                    failed = state_store.write(get_dynamodb(), chunk, call=retrier.call)
+            except (ClientError, BotoCoreError, DeadlineExceeded) as err:
+                log("Indicator state snapshot failed", level="error",
+                    error=str(err), error_type=type(err).__name__, symbols=len(chunk))
+                failed = [item["symbol"] for item in chunk]
+            if failed:
+                log("Indicator state snapshot left unprocessed items", level="warning",
+                    symbols=failed)
+                metrics.count("StateSnapshotsFailed", len(failed))
+            return []
+
+        tasks.append((None, write_chunk, []))
+    return tasks
+
+
+def update_bars(batch: QuoteBatch):
+    """Fold the batch's ticks into their bars and write the bars that closed.
+
+    Partial bars, which another container may have written in full, are
+    dropped. Bar writes cover no records. A failed write keeps its bars for the next
+    invocation, up to MAX_PENDING_BARS per sink.
+    """
+    late = 0
+    add = bar_aggregator.add
+    for symbol, event_ns, price, volume in zip(batch.symbols, batch.event_ns, batch.prices, batch.volumes):
+        if not add(symbol, event_ns // NS_PER_MS, price, volume):
+            late += 1
+    closed = bar_aggregator.close()
+    partial = [bar for bar in closed if bar.partial]
+    if partial:
+        # Started before this container's first tick of the symbol, or the
+        # symbol's ticks stopped arriving before they ended
+        closed = [bar for bar in closed if not bar.partial]
+        metrics.count("PartialBarsSkipped", len(partial))
+    metrics.count("LateTicksExcluded", late)
+    metrics.count("BarsClosed", len(closed))
+    metrics.gauge("BarsOpen", len(bar_aggregator))
+
+    if out_of_time("bar writes"):
+        for sink, enabled in _bar_sinks():
+            if enabled:
+                _defer_bars(sink, closed)
+        return
+    tasks = bar_write_tasks(closed)
+    if tasks:
+        with metrics.timer("BarWriteTime"):
+            run_write_tasks(tasks)
+
+
+def bar_write_tasks(closed: List[Bar]) -> List[WriteTask]:
+    tasks: List[WriteTask] = []
+    for sink, enabled in _bar_sinks():
+        bars, pending_bars[sink] = pending_bars[sink] + closed, []
+        if not enabled or not bars:
+            continue
+        chunks = (
+            [bars[start:start + DYNAMODB_BATCH_SIZE] for start in range(0, len(bars), DYNAMODB_BATCH_SIZE)]
+            if sink == "dynamodb" else [members for _, members in bar_partitions(BARS_S3_PREFIX, bars)]
+        )
+        for chunk in chunks:
+            write = _write_bars_dynamodb if sink == "dynamodb" else _write_bars_s3
+
+            def write_chunk(sink=sink, chunk=chunk, write=write) -> List[str]:
+                failed = write(chunk)
+                if failed:
+                    metrics.count("BarsWriteFailed", len(failed))
+                    _defer_bars(sink, failed)
+                return []
+
+            tasks.append((sink, write_chunk, []))
+    return tasks
+
+
+def _bar_sinks() -> List[Tuple[str, bool]]:
+    return [("dynamodb", bool(BARS_TABLE)), ("s3", bool(BARS_S3_PREFIX))]
+
+
+def _defer_bars(sink: str, bars: List[Bar]):
+    """Keep bars for the next invocation's write, up to MAX_PENDING_BARS."""
+    backlog = pending_bars[sink]
+    backlog.extend(bars)
+    if len(backlog) > MAX_PENDING_BARS:
+        metrics.count("BarsDropped", len(backlog) - MAX_PENDING_BARS)
+        del backlog[:len(backlog) - MAX_PENDING_BARS]
+
+
+def _write_bars_dynamodb(bars: List[Bar]) -> List[Bar]:
+    """Returns the bars that could not be written."""
+    items = {(bar.symbol, item["timestamp"]): (bar, item)
+             for bar in bars for item in (bar.item(),)}
+    failed = _write_dynamodb_chunk({key: item for key, (_, item) in items.items()}, BARS_TABLE)
+    return [items[key][0] for key in failed]
+
+
+def _write_bars_s3(bars: List[Bar]) -> List[Bar]:
+    """Returns the bars that could not be written."""
+    [(key, _)] = bar_partitions(BARS_S3_PREFIX, bars)
+    try:
+        with metrics.timer("S3WriteLatency"):
+            retrier.call(get_s3().put_object, Bucket=S3_BUCKET, Key=key, Body=encode_bars(bars),
+                         ContentType="application/vnd.apache.parquet")
+    except Exception as err:
+        log("Bar rollup write failed", level="error",
+            error=str(err), error_type=type(err).__name__,
+            bucket=S3_BUCKET, key=key, bars=len(bars))
+        return bars
+    return []
 
 
 def write_to_s3(raw_event: Dict[str, Any], event_time: datetime):
@@ -130,16 +807,19 @@ def write_to_s3(raw_event: Dict[str, Any], event_time: datetime):
     )
 
     try:
-        s3.put_object(
-            Bucket=S3_BUCKET,
-            Key=key,
-            Body=json.dumps(raw_event).encode("utf-8"),
-            ContentType="application/json"
-        )
-        log("S3 write successful", 
-            bucket=S3_BUCKET, 
-            key=key, 
-            symbol=raw_event.get("symbol"))
+        with metrics.timer("S3WriteLatency"):
+            retrier.call(
+                get_s3().put_object,
+                Bucket=S3_BUCKET,
+                Key=key,
+                Body=json.dumps(raw_event).encode("utf-8"),
+                ContentType="application/json"
+            )
+        if sampled():
+            log("S3 write successful",
+                bucket=S3_BUCKET,
+                key=key,
+                symbol=raw_event.get("symbol"))
     except Exception as err:
         log("S3 write failed", level="error", 
             error=str(err), error_type=type(err).__name__, 
@@ -147,15 +827,76 @@ def write_to_s3(raw_event: Dict[str, Any], event_time: datetime):
         raise
 
 
+def s3_write_tasks(batch: QuoteBatch) -> List[WriteTask]:
+    """Archive tasks for a batch.
+
+    Parquet mode writes one object per date partition; JSON mode writes one
+    object per event, ordered per symbol, from the batch's kept sources.
+    """
+    if S3_ARCHIVE_FORMAT != "parquet":
+        return [
+            (batch.symbols[row],
+             lambda row=row: write_to_s3(batch.sources[row], batch.event_time(row)) or [],
+             [batch.record_ids[row]])
+            for row in range(len(batch))
+        ]
+
+    writer = ParquetArchiveWriter()
+    add = writer.add_ms
+    for record_id, symbol, price, volume, event_ns in zip(
+        batch.record_ids, batch.symbols, batch.prices, batch.volumes, batch.event_ns
+    ):
+        add(record_id, symbol, price, volume, event_ns // NS_PER_MS)
+
+    tasks: List[WriteTask] = []
+    for key, record_ids, columns in writer.drain():
+
+        def write_partition(key=key, record_ids=record_ids, columns=columns) -> List[str]:
+            try:
+                with metrics.timer("S3WriteLatency"):
+                    retrier.call(put_partition, get_s3(), S3_BUCKET, key, columns)
+            except Exception as err:
+                log("S3 write failed", level="error",
+                    error=str(err), error_type=type(err).__name__,
+                    bucket=S3_BUCKET, key=key, records=len(record_ids))
+                raise
+            log("S3 write successful",
+                bucket=S3_BUCKET, key=key, records=len(record_ids))
+            return []
+
+        tasks.append((None, write_partition, record_ids))
+    return tasks
+
+
+def run_write_tasks(tasks: List[WriteTask]) -> Set[str]:
+    """Run write tasks on the I/O stage and return the eventIDs that failed."""
+    results = io_stage.run([(key, fn) for key, fn, _ in tasks])
+
+    failed_records: Set[str] = set()
+    for (_, _, record_ids), result in zip(tasks, results):
+        if isinstance(result, Exception):
+            failed_records.update(record_ids)
+        else:
+            failed_records.update(result)
+    return failed_records
+
+
 # =====================================================
 # Lambda Handler (Partial Batch Failure Enabled)
 # =====================================================
+def check_configuration():
+    missing = [name for name in ("DYNAMODB_TABLE", "S3_BUCKET") if not globals()[name]]
+    if missing:
+        raise RuntimeError(f"Missing required environment variables: {', '.join(missing)}")
+
+
 def handler(event, context):
-    batch_failures: List[Dict[str, str]] = []
-    
+    check_configuration()
+    metrics.reset()
+    retrier.deadline = Deadline(context, DEADLINE_RESERVE_MS)
     log("Lambda invocation started", 
         function="processor",
-        request_id=context.request_id,
+        request_id=getattr(context, "aws_request_id", None),
         event_records=len(event.get('Records', [])))
     
     # Load secrets on cold start
@@ -166,78 +907,184 @@ def handler(event, context):
         log("Failed to load secrets - continuing without", level="warning",
             error=str(err), error_type=type(err).__name__)
 
-    successful_records = 0
-    failed_records = 0
+    # eventIDs of failed records, in order; a record holding several quotes
+    # fails as a whole
+    failed_ids: Dict[str, None] = {}
+    # JSON archiving writes the decoded documents back out, so only it keeps them
+    batch = QuoteBatch(keep_sources=S3_ARCHIVE_FORMAT != "parquet")
+    sequence_numbers: Dict[str, int] = {}
 
-    for record in event["Records"]:
+    checkpoints = load_checkpoints(event["Records"]) if DEDUPE_RECORDS else {}
+    skipped = 0
+
+    decode_started = time.perf_counter()
+    records_by_id: Dict[str, Dict[str, Any]] = {}
+    # Every decoded quote of the batch, with the eventID of its record
+    quotes: List[Dict[str, Any]] = []
+    owners: List[str] = []
+    # eventID -> rejected quotes with their reasons
+    rejects: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for index, record in enumerate(event["Records"]):
         record_id = record["eventID"]
 
+        if checkpoints:
+            position = _record_position(record)
+            if position and position[0] in checkpoints and checkpoints[position[0]].seen(position[1]):
+                skipped += 1
+                continue
+
+        records_by_id[record_id] = record
         try:
-            data = decode_kinesis_record(record)
+            record_quotes = decode_kinesis_record(record)
+            sequence_numbers[record_id] = int(
+                record["kinesis"].get("sequenceNumber", index)
+            )
+        except (KeyError, ValueError) as err:
+            rejects[record_id].append({"reason": "undecodable record", "error": str(err)})
+            continue
 
-            symbol = data["symbol"]
-            price = float(data["price"])
-            volume = int(data["volume"])
-            timestamp = data["timestamp"]
+        except Exception as err:
+            log("Unexpected error", level="error",
+                error=str(err),
+                error_type=type(err).__name__,
+                record_id=record_id,
+                exc_info=True)
+            metrics.failure("UnexpectedError")
+            failed_ids[record_id] = None
+            continue
 
-            event_time = datetime.fromisoformat(
-                timestamp.replace("Z", "+00:00")
-            )
+        quotes.extend(record_quotes)
+        owners.extend([record_id] * len(record_quotes))
+
+    valid, invalid = validate_quotes(quotes)
+    for position, reason in invalid:
+        rejects[owners[position]].append({"reason": reason, "quote": quotes[position]})
+    metrics.timing("DecodeTime", (time.perf_counter() - decode_started) * 1000)
+    if rejects:
+        # A record with a bad quote fails as a whole unless it was dead-lettered
+        unsent = dead_letter_rejects(rejects, records_by_id)
+        for record_id in records_by_id:
+            if record_id in unsent:
+                metrics.failure("InvalidRecord")
+                failed_ids[record_id] = None
+
+    keep_sources = batch.sources is not None
+    for position, (symbol, price, volume, event_time) in valid:
+        record_id = owners[position]
+        if record_id in failed_ids:
+            continue
+        data = quotes[position]
+        batch.append(record_id, symbol, price, volume, data["timestamp"],
+                     epoch_ns(event_time), data if keep_sources else None)
+    # Only the batch holds the quotes from here on
+    del quotes, valid
+
+    symbols = batch.symbol_set()
+    stale = stale_indicator_symbols(batch) if PERSIST_INDICATOR_STATE and len(batch) else set()
+    unknown = (symbols - indicator_engine.symbols.keys()) | stale
+    if PERSIST_INDICATOR_STATE and unknown and not hydrate_indicator_state(unknown, stale):
+        # Starting these symbols from empty or stale windows would overwrite
+        # their good snapshots, so their records are failed and retried
+        # instead. Stale windows are dropped, since the shard is claimed now.
+        for symbol in stale:
+            indicator_engine.symbols.pop(symbol, None)
+        for record_id, symbol in zip(batch.record_ids, batch.symbols):
+            if symbol in unknown and record_id not in failed_ids:
+                metrics.failure("StateUnavailable")
+                failed_ids[record_id] = None
+        batch = batch.without(failed_ids)
+        symbols = batch.symbol_set()
 
-            moving_avg = calculate_moving_average(symbol, price)
+    if len(batch) and retrier.out_of_time():
+        # Nothing was written yet, so the whole batch goes back to Kinesis
+        # now instead of after a timeout
+        log("Invocation deadline reached before writes - failing remaining records",
+            level="warning", records=len(set(batch.record_ids)))
+        for record_id in batch.record_ids:
+            if record_id not in failed_ids:
+                metrics.failure("DeadlineExceeded")
+                failed_ids[record_id] = None
+        batch, symbols = QuoteBatch(), set()
 
-            processed_item = {
-                "symbol": symbol,
-                "timestamp": timestamp,
-                "price": price,
-                "volume": volume,
-                "moving_average": moving_avg
-            }
+    # Kept until the writes are known to have succeeded: the ticks of failed
+    # records come back with Lambda's retry and must not be counted twice
+    saved_state = indicator_engine.save(symbols)
+    with metrics.timer("AnalyticsTime"):
+        add_indicators(batch, sequence_numbers)
 
-            write_to_dynamodb(processed_item)
-            write_to_s3(data, event_time)
+    # DynamoDB and S3 writes run concurrently; a record fails if any write
+    # covering it failed.
+    write_tasks = s3_write_tasks(batch)
+    if DYNAMODB_WRITE_MODE in ("ticks", "both"):
+        write_tasks += dynamodb_write_tasks(batch)
+    if DYNAMODB_WRITE_MODE in ("latest", "both"):
+        write_tasks += latest_quote_tasks(batch)
+    with metrics.timer("WriteTime"):
+        write_failures = run_write_tasks(write_tasks)
+    if write_failures:
+        rollback_indicators(batch, saved_state, write_failures, sequence_numbers)
+    if PERSIST_INDICATOR_STATE and not out_of_time("indicator state snapshots"):
+        # Snapshots are taken only once failed ticks are rolled back
+        with metrics.timer("StateSnapshotTime"):
+            run_write_tasks(state_snapshot_tasks(symbols))
+    metrics.gauge("ConcurrencyLimit", retrier.limiter.limit)
 
+    # Success is logged for a sample of quotes only; the invocation summary
+    # below carries the totals
+    for row, record_id in enumerate(batch.record_ids):
+        if record_id in write_failures:
+            if record_id not in failed_ids:
+                metrics.failure("WriteFailed")
+            failed_ids[record_id] = None
+            continue
+
+        if sampled():
             log("Record processed successfully",
-                symbol=symbol,
-                price=price,
-                volume=volume,
-                moving_average=moving_avg,
+                symbol=batch.symbols[row],
+                price=batch.prices[row],
+                volume=batch.volumes[row],
+                moving_average=batch.moving_average[row],
                 record_id=record_id)
-            
-            successful_records += 1
 
-        except (KeyError, ValueError) as err:
-            log("Invalid record format", level="error",
-                error=str(err),
-                error_type=type(err).__name__,
-                record_id=record_id)
-            batch_failures.append({"itemIdentifier": record_id})
-            failed_records += 1
+    if BAR_INTERVALS:
+        update_bars(batch.without(failed_ids))
 
-        except (ClientError, BotoCoreError) as err:
-            log("AWS service error", level="error",
-                error=str(err),
-                error_type=type(err).__name__,
-                record_id=record_id)
-            batch_failures.append({"itemIdentifier": record_id})
-            failed_records += 1
+    if checkpoints:
+        save_checkpoints(checkpoints, event["Records"], failed_ids)
 
-        except Exception as err:
-            log("Unexpected error", level="error",
-                error=str(err),
-                error_type=type(err).__name__,
-                record_id=record_id,
-                exc_info=True)
-            batch_failures.append({"itemIdentifier": record_id})
-            failed_records += 1
+    # Evicted only now, after this batch's snapshots were taken
+    evicted = indicator_engine.evict()
+    bar_aggregator.forget(evicted)
+    metrics.count("StateEvictions", len(evicted))
+    metrics.gauge("StateSymbols", len(indicator_engine))
+    metrics.gauge("StateBytes", indicator_engine.footprint(), "Bytes")
+
+    total_records = len(event.get('Records', []))
+    metrics.count("RecordsReceived", total_records)
+    metrics.count("QuotesProcessed", len(batch))
+    metrics.count("DuplicateRecordsSkipped", skipped)
+    metrics.count("RecordsSucceeded", total_records - len(failed_ids))
+    metrics.count("RecordsFailed", len(failed_ids))
 
     log("Lambda invocation completed",
         function="processor",
-        request_id=context.request_id,
-        total_records=len(event.get('Records', [])),
-        successful_records=successful_records,
-        failed_records=failed_records)
+        request_id=getattr(context, "aws_request_id", None),
+        total_records=total_records,
+        total_quotes=len(batch),
+        skipped_records=skipped,
+        successful_records=total_records - len(failed_ids),
+        failed_records=len(failed_ids),
+        metrics=metrics.summary())
+    if EMIT_METRICS:
+        metrics.flush()
+
+    # Only when STARTUP_PROFILE is set, and only once phases have run
+    startup = profiler.report()
+    if startup:
+        log("Startup profile", function="processor", **startup)
 
     return {
-        "batchItemFailures": batch_failures
-    }
\ No newline at end of file
+        "batchItemFailures": [
+            {"itemIdentifier": record_id} for record_id in failed_ids
+        ]
+    }
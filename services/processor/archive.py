@@ -0,0 +1,155 @@
+"""Micro-batched Parquet archive for the S3 historical store.
+
+Rows are buffered per ``year=/month=/day=`` partition for the length of one
+invocation and written as a single Snappy-compressed Parquet file per
+partition, matching ``athena/stock_market_table.sql``. Records that are
+retried can be archived more than once; compaction removes the duplicates.
+
+pyarrow is only imported when the first file is encoded or read, so it stays
+off the cold-start path of invocations that never archive Parquet.
+"""
+import hashlib
+import io
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+from startup_profile import profiler
+
+# Mirrors the column list of the stock_market_data Athena table
+ARCHIVE_COLUMNS = ("symbol", "price", "volume", "event_time")
+
+Partition = Tuple[int, int, int]
+
+MS_PER_DAY = 86_400_000
+_EPOCH = datetime(1970, 1, 1)
+
+
+def partition_prefix(partition: Partition) -> str:
+    year, month, day = partition
+    return f"year={year}/month={month:02d}/day={day:02d}/"
+
+
+class ParquetArchiveWriter:
+    """Buffers archive rows per date partition until ``flush`` is called."""
+
+    def __init__(self):
+        self._rows: Dict[Partition, Dict[str, list]] = defaultdict(
+            lambda: {name: [] for name in ARCHIVE_COLUMNS}
+        )
+        self._record_ids: Dict[Partition, List[str]] = defaultdict(list)
+
+    def __len__(self) -> int:
+        return sum(len(ids) for ids in self._record_ids.values())
+
+    def add(self, record_id: str, symbol: str, price: float, volume: int,
+            event_time: datetime):
+        delta = _to_naive_utc(event_time) - _EPOCH
+        self.add_ms(record_id, symbol, price, volume,
+                    (delta.days * 86_400 + delta.seconds) * 1000 + delta.microseconds // 1000)
+
+    def add_ms(self, record_id: str, symbol: str, price: float, volume: int,
+               event_ms: int):
+        """``add`` for an event time in epoch milliseconds, with no datetime."""
+        partition = _partition_of_day(event_ms // MS_PER_DAY)
+        columns = self._rows[partition]
+        columns["symbol"].append(symbol)
+        columns["price"].append(price)
+        columns["volume"].append(volume)
+        # Epoch milliseconds are what the timestamp("ms") column stores
+        columns["event_time"].append(event_ms)
+        self._record_ids[partition].append(record_id)
+
+    def drain(self) -> List[Tuple[str, List[str], Dict[str, list]]]:
+        """Return ``(key, record_ids, columns)`` per partition and clear the buffer."""
+        partitions = [
+            (self.object_key(partition, self._record_ids[partition]),
+             self._record_ids[partition],
+             columns)
+            for partition, columns in self._rows.items()
+        ]
+        self._rows = defaultdict(self._rows.default_factory)
+        self._record_ids = defaultdict(list)
+        return partitions
+
+    def flush(self, s3_client, bucket: str) -> List[Tuple[str, List[str], Exception]]:
+        """Write one object per buffered partition and clear the buffer.
+
+        Returns ``(key, record_ids, error)`` for each partition that could not
+        be written, so callers can map the failure back to its records.
+        """
+        failures = []
+        for key, record_ids, columns in self.drain():
+            try:
+                put_partition(s3_client, bucket, key, columns)
+            except Exception as err:
+                failures.append((key, record_ids, err))
+        return failures
+
+    @staticmethod
+    def object_key(partition: Partition, record_ids: List[str]) -> str:
+        # Named after the records it holds, so a batch Lambda retries as a
+        # whole (after a timeout or crash) overwrites its earlier object. A
+        # retry after a partial batch failure starts at the failed record and
+        # holds other records, so it lands in a new object and repeats rows
+        # the first attempt archived; tools/compact.py drops those duplicates.
+        digest = hashlib.sha1("\n".join(record_ids).encode("utf-8")).hexdigest()
+        return f"{partition_prefix(partition)}batch-{digest[:20]}.parquet"
+
+
+def put_partition(s3_client, bucket: str, key: str, columns: Dict[str, list]):
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=encode_parquet(columns),
+        ContentType="application/vnd.apache.parquet",
+    )
+
+
+@lru_cache(maxsize=None)
+def load_pyarrow():
+    """``(pyarrow, pyarrow.parquet)``, imported on first use."""
+    with profiler.phase("import:pyarrow"):
+        import pyarrow
+        import pyarrow.parquet
+    return pyarrow, pyarrow.parquet
+
+
+@lru_cache(maxsize=None)
+def archive_schema():
+    """Arrow schema of ``ARCHIVE_COLUMNS``. Athena reads Parquet timestamps as
+    naive UTC, in millisecond precision."""
+    pa, _ = load_pyarrow()
+    return pa.schema([
+        pa.field("symbol", pa.string()),
+        pa.field("price", pa.float64()),
+        pa.field("volume", pa.int64()),
+        pa.field("event_time", pa.timestamp("ms")),
+    ])
+
+
+def encode_parquet(columns: Dict[str, list]) -> bytes:
+    pa, pq = load_pyarrow()
+    table = pa.Table.from_pydict(columns, schema=archive_schema())
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression="snappy")
+    return buffer.getvalue()
+
+
+@lru_cache(maxsize=1024)
+def _partition_of_day(day: int) -> Partition:
+    date = (_EPOCH + timedelta(days=day)).date()
+    return date.year, date.month, date.day
+
+
+def _to_naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def read_parquet(body: bytes) -> Dict[str, List[Any]]:
+    """Decode an archive object back into columns (used by tests and tools)."""
+    _, pq = load_pyarrow()
+    return pq.read_table(io.BytesIO(body)).to_pydict()
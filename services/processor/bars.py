@@ -0,0 +1,258 @@
+"""Incremental OHLCV + VWAP bars per symbol.
+
+Each tick is folded into the open bar of every configured interval (1 and 5
+minutes by default) as it is processed, so a bar costs O(1) per tick and
+closed bars can be written in bulk instead of being recomputed from the
+archive at query time.
+
+Bars are closed on event time. The aggregator's watermark is the newest
+event time it has seen, and a bar closes once the watermark passes its end
+by ``allowed_lateness_ms``. A tick arriving within that window still lands
+in its bar. One arriving later would reopen a bar that has already been
+written, so it is left out of the bars and counted instead. The archive
+still holds it.
+
+Open bars live in the warm container only, and a shard can move between
+containers at any batch. A bar is only complete if the container saw its
+symbol's ticks from before the bar started until after it ended:
+
+* a bar that started before the container's first tick of its symbol is
+  ``partial``: another container had the symbol's earlier ticks;
+* a bar closes complete once a tick of its own symbol passes its end. While
+  none has, it stays open. If ``idle_timeout_ms`` of event time go by
+  without one, the symbol's ticks have stopped arriving (it went quiet, or
+  its shard moved away) and the bar closes ``partial``.
+
+The processor does not write partial bars: writing them would replace the
+full bar (in DynamoDB) or add a second row for it (in S3) whenever another
+container had written it. A bar no container saw whole is lost, and can be
+rebuilt from the archive. Per-symbol bookkeeping is dropped with ``forget``
+when the processor evicts the symbol's indicator state.
+"""
+import hashlib
+import io
+import re
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from archive import load_pyarrow, partition_prefix
+
+_INTERVAL = re.compile(r"^(\d+)([smh])$")
+_UNIT_MS = {"s": 1000, "m": 60_000, "h": 3_600_000}
+
+
+def parse_intervals(spec: str) -> Dict[str, int]:
+    """``"1m,5m"`` -> ``{"1m": 60000, "5m": 300000}``."""
+    intervals = {}
+    for name in (part.strip() for part in spec.split(",")):
+        if not name:
+            continue
+        match = _INTERVAL.match(name)
+        if not match or int(match.group(1)) < 1:
+            raise ValueError(f"Invalid bar interval {name!r}; expected e.g. 30s, 1m or 1h")
+        intervals[name] = int(match.group(1)) * _UNIT_MS[match.group(2)]
+    return intervals
+
+
+def _iso(millis: int) -> str:
+    moment = datetime.fromtimestamp(millis / 1000, tz=timezone.utc)
+    return moment.isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+class Bar:
+    """Open, high, low, close, volume and VWAP of one symbol over one interval."""
+
+    __slots__ = (
+        "symbol", "interval", "start_ms", "open", "high", "low", "close",
+        "volume", "pv_sum", "trades", "first_ms", "last_ms", "partial",
+    )
+
+    def __init__(self, symbol: str, interval: str, start_ms: int,
+                 event_ms: int, price: float, volume: int, partial: bool = False):
+        self.symbol = symbol
+        self.interval = interval
+        self.start_ms = start_ms
+        self.open = self.high = self.low = self.close = price
+        self.volume = volume
+        self.pv_sum = price * volume
+        self.trades = 1
+        self.first_ms = self.last_ms = event_ms
+        # May be missing ticks seen by another container
+        self.partial = partial
+
+    def add(self, event_ms: int, price: float, volume: int):
+        # Late ticks can arrive out of order, so open and close follow event time
+        if event_ms < self.first_ms:
+            self.open, self.first_ms = price, event_ms
+        if event_ms >= self.last_ms:
+            self.close, self.last_ms = price, event_ms
+        if price > self.high:
+            self.high = price
+        if price < self.low:
+            self.low = price
+        self.volume += volume
+        self.pv_sum += price * volume
+        self.trades += 1
+
+    @property
+    def vwap(self) -> Optional[float]:
+        if self.volume <= 0:
+            return None
+        return self.pv_sum / self.volume
+
+    @property
+    def start(self) -> datetime:
+        """Start of the bar as naive UTC, like the archive's event_time."""
+        return datetime.fromtimestamp(self.start_ms / 1000, tz=timezone.utc).replace(tzinfo=None)
+
+    def item(self) -> Dict[str, Any]:
+        """The bar as a rollup table item, keyed ``(symbol, "<interval>#<start>")``."""
+        start = _iso(self.start_ms)
+        item = {
+            "symbol": self.symbol,
+            "timestamp": f"{self.interval}#{start}",
+            "interval": self.interval,
+            "bar_start": start,
+            "open": self.open,
+            "high": self.high,
+            "low": self.low,
+            "close": self.close,
+            "volume": self.volume,
+            "trades": self.trades,
+        }
+        vwap = self.vwap
+        if vwap is not None:
+            item["vwap"] = round(vwap, 4)
+        return item
+
+
+class BarAggregator:
+    """Open bars of every symbol and interval for a warm container."""
+
+    def __init__(self, intervals: Dict[str, int], allowed_lateness_ms: int = 0,
+                 idle_timeout_ms: int = 300_000):
+        self.intervals = intervals
+        self.allowed_lateness_ms = allowed_lateness_ms
+        self.idle_timeout_ms = idle_timeout_ms
+        self.bars: Dict[Tuple[str, str, int], Bar] = {}
+        self.watermark_ms: Optional[int] = None
+        # Event time of the first and the newest tick of each symbol seen
+        self.first_seen_ms: Dict[str, int] = {}
+        self.last_seen_ms: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.bars)
+
+    def add(self, symbol: str, event_ms: int, price: float, volume: int) -> bool:
+        """Fold a tick into its bars; False if it was too late for any of them."""
+        horizon = None if self.watermark_ms is None else self.watermark_ms - self.allowed_lateness_ms
+        on_time = True
+        first_seen_ms = self.first_seen_ms.setdefault(symbol, event_ms)
+        if event_ms > self.last_seen_ms.get(symbol, event_ms - 1):
+            self.last_seen_ms[symbol] = event_ms
+        for interval, length in self.intervals.items():
+            start_ms = event_ms - event_ms % length
+            bar = self.bars.get((symbol, interval, start_ms))
+            if bar is None and horizon is not None and start_ms + length <= horizon:
+                on_time = False
+                continue
+            if bar is None:
+                self.bars[(symbol, interval, start_ms)] = Bar(
+                    symbol, interval, start_ms, event_ms, price, volume,
+                    partial=start_ms < first_seen_ms)
+            else:
+                bar.add(event_ms, price, volume)
+        if self.watermark_ms is None or event_ms > self.watermark_ms:
+            self.watermark_ms = event_ms
+        return on_time
+
+    def close(self) -> List[Bar]:
+        """Remove and return the bars the watermark has passed, oldest first.
+
+        A bar whose symbol has no tick past its end yet stays open until
+        ``idle_timeout_ms`` later, and then closes partial.
+        """
+        if self.watermark_ms is None:
+            return []
+        horizon = self.watermark_ms - self.allowed_lateness_ms
+        idle_horizon = self.watermark_ms - max(self.allowed_lateness_ms, self.idle_timeout_ms)
+        closed = []
+        for key, bar in self.bars.items():
+            end_ms = bar.start_ms + self.intervals[bar.interval]
+            if end_ms > horizon:
+                continue
+            if self.last_seen_ms.get(bar.symbol, end_ms - 1) >= end_ms:
+                closed.append(key)
+            elif end_ms <= idle_horizon:
+                bar.partial = True
+                closed.append(key)
+        return sorted((self.bars.pop(key) for key in closed),
+                      key=lambda bar: (bar.start_ms, bar.interval, bar.symbol))
+
+    def forget(self, symbols: Iterable[str]):
+        """Drop what is known about ``symbols``; their open bars close partial."""
+        for symbol in symbols:
+            self.first_seen_ms.pop(symbol, None)
+            self.last_seen_ms.pop(symbol, None)
+
+    def clear(self):
+        self.bars.clear()
+        self.watermark_ms = None
+        self.first_seen_ms.clear()
+        self.last_seen_ms.clear()
+
+
+# =====================================================
+# Parquet rollup
+# =====================================================
+def bar_partitions(prefix: str, bars: List[Bar]) -> List[Tuple[str, List[Bar]]]:
+    """Group bars into ``bar_interval=/year=/month=/day=`` objects.
+
+    Objects are named after the bars they hold, so rewriting the same bars
+    after a failed attempt replaces the earlier object.
+    """
+    grouped: Dict[Tuple[str, int, int, int], List[Bar]] = defaultdict(list)
+    for bar in bars:
+        start = bar.start
+        grouped[(bar.interval, start.year, start.month, start.day)].append(bar)
+
+    objects = []
+    for (interval, *day), members in grouped.items():
+        digest = hashlib.sha1("\n".join(
+            f"{bar.symbol}/{bar.start_ms}" for bar in members
+        ).encode("utf-8")).hexdigest()
+        key = (f"{prefix}bar_interval={interval}/{partition_prefix(tuple(day))}"
+               f"bars-{digest[:20]}.parquet")
+        objects.append((key, members))
+    return objects
+
+
+def encode_bars(bars: List[Bar]) -> bytes:
+    """One Parquet file in the column layout of the stock_market_bars table."""
+    pa, pq = load_pyarrow()
+    schema = pa.schema([
+        pa.field("symbol", pa.string()),
+        pa.field("bar_start", pa.timestamp("ms")),
+        pa.field("open", pa.float64()),
+        pa.field("high", pa.float64()),
+        pa.field("low", pa.float64()),
+        pa.field("close", pa.float64()),
+        pa.field("volume", pa.int64()),
+        pa.field("vwap", pa.float64()),
+        pa.field("trades", pa.int64()),
+    ])
+    table = pa.Table.from_pydict({
+        "symbol": [bar.symbol for bar in bars],
+        "bar_start": [bar.start for bar in bars],
+        "open": [bar.open for bar in bars],
+        "high": [bar.high for bar in bars],
+        "low": [bar.low for bar in bars],
+        "close": [bar.close for bar in bars],
+        "volume": [bar.volume for bar in bars],
+        "vwap": [bar.vwap for bar in bars],
+        "trades": [bar.trades for bar in bars],
+    }, schema=schema)
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression="snappy")
+    return buffer.getvalue()
@@ -0,0 +1,113 @@
+"""Micro-benchmark: memory per quote of the processor's batch representations.
+
+Run from services/processor:
+
+    python benchmarks/bench_batch_memory.py [--records N]
+
+Builds the batch of N validated quotes, with indicators, the way the
+handler holds it through the write stage, and reports what tracemalloc saw
+allocated and still held per quote:
+
+* tuples: ``(eventID, processed item dict, decoded quote, datetime)`` per
+  quote, as the handler kept them before ``QuoteBatch``;
+* columns: one ``QuoteBatch`` (Parquet archive mode, no sources kept).
+
+The decoded quotes and eventIDs exist before either is built and are not
+counted.
+"""
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, ".."), os.path.join(HERE, "..", "..", "common")]
+
+from fast_decode import parse_timestamp  # noqa: E402
+from quote_batch import QuoteBatch, epoch_ns  # noqa: E402
+from quote_schema import QUOTE_SCHEMA, compile_schema  # noqa: E402
+
+validate_quotes = compile_schema(QUOTE_SCHEMA, parse_timestamp)
+
+
+def indicators(price):
+    """Stand-in (sma, ema, stddev, vwap), new floats per quote like the real ones."""
+    return round(price * 0.999, 2), round(price * 1.001, 2), round(price * 0.01, 4), round(price, 2)
+
+
+def make_quotes(count):
+    # Symbols and timestamps are fresh strings per quote, as JSON decoding makes them
+    return [
+        {
+            "symbol": "".join(["SYM", str(index % 50)]),
+            "price": 100 + (index % 997) / 100,
+            "volume": index * 7,
+            "timestamp": f"2024-01-02T14:{(index // 60) % 60:02d}:{index % 60:02d}.{index % 1000:03d}Z",
+        }
+        for index in range(count)
+    ]
+
+
+def build_tuples(quotes, record_ids, valid):
+    processed = []
+    for position, (symbol, price, volume, event_time) in valid:
+        data = quotes[position]
+        item = {"symbol": symbol, "timestamp": data["timestamp"], "price": price, "volume": volume}
+        sma, ema, stddev, vwap = indicators(price)
+        item.update({"moving_average": sma, "ema": ema, "stddev": stddev, "vwap": vwap})
+        processed.append((record_ids[position], item, data, event_time))
+    return processed
+
+
+def build_columns(quotes, record_ids, valid):
+    batch = QuoteBatch()
+    for position, (symbol, price, volume, event_time) in valid:
+        batch.append(record_ids[position], symbol, price, volume,
+                     quotes[position]["timestamp"], epoch_ns(event_time))
+    batch.reset_indicators()
+    for row, price in enumerate(batch.prices):
+        batch.set_indicators(row, indicators(price))
+    return batch
+
+
+def measure(build, quotes, record_ids):
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    start = tracemalloc.take_snapshot()
+    # Validation is part of the cost: its values tuples and datetimes
+    # are what the tuple representation keeps alive
+    valid, _ = validate_quotes(quotes, now=1_704_300_000)
+    result = build(quotes, record_ids, valid)
+    del valid
+    gc.collect()
+    held, peak = tracemalloc.get_traced_memory()
+    stats = tracemalloc.take_snapshot().compare_to(start, "filename")
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in stats)
+    del result
+    return held - before, peak - before, blocks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=100_000)
+    args = parser.parse_args()
+
+    quotes = make_quotes(args.records)
+    record_ids = [f"shardId-000000000000:{index:056d}" for index in range(args.records)]
+
+    print(f"{args.records} quotes")
+    results = {name: measure(build, quotes, record_ids)
+               for name, build in (("tuples", build_tuples), ("columns", build_columns))}
+    baseline = results["tuples"][0]
+    for name, (held, peak, blocks) in results.items():
+        print(f"  {name:<8} {held / args.records:7.1f} B/quote held"
+              f"  {peak / args.records:7.1f} B/quote peak"
+              f"  {blocks / args.records:5.2f} objects/quote"
+              f"  {baseline / held:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
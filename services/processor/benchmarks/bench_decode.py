@@ -0,0 +1,87 @@
+"""Micro-benchmark: reference vs fast Kinesis record decode.
+
+Run from services/processor:
+
+    python benchmarks/bench_decode.py [--records N] [--repeat R]
+
+Times decoding N records plus parsing their timestamps, for legacy JSON
+records and for binary aggregates, and prints the best of R runs per path.
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, ".."), os.path.join(HERE, "..", "..", "common")]
+
+from fast_decode import (  # noqa: E402
+    JSON_BACKEND, decode_record, decode_record_reference,
+    parse_timestamp, parse_timestamp_reference,
+)
+from quote_codec import encode_quotes  # noqa: E402
+
+
+def make_quotes(count):
+    return [
+        {
+            "symbol": f"SYM{index % 50}",
+            "price": 100 + (index % 997) / 100,
+            "volume": index * 7,
+            "timestamp": f"2024-01-02T14:{(index // 60) % 60:02d}:{index % 60:02d}.{index % 1000:03d}Z",
+            "event_time": "2024-01-02T15:00:00.000Z",
+            "request_id": "6f1c0e0e-3c55-4c1b-9d2e-8f7a0c1d2e3f",
+        }
+        for index in range(count)
+    ]
+
+
+def kinesis_records(payloads):
+    return [{"kinesis": {"data": base64.b64encode(p).decode("ascii")}} for p in payloads]
+
+
+def run(records, decode, parse):
+    for record in records:
+        for quote in decode(record):
+            float(quote["price"])
+            int(quote["volume"])
+            parse(quote["timestamp"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    quotes = make_quotes(args.records)
+    cases = {
+        "json": kinesis_records(json.dumps(q).encode("utf-8") for q in quotes),
+        "binary x100": kinesis_records(
+            encode_quotes(quotes[i:i + 100], event_time=quotes[0]["event_time"],
+                          request_id=quotes[0]["request_id"])
+            for i in range(0, len(quotes), 100)
+        ),
+    }
+    paths = {
+        "reference": (decode_record_reference, parse_timestamp_reference),
+        f"fast ({JSON_BACKEND})": (decode_record, parse_timestamp),
+    }
+
+    print(f"{args.records} quotes, best of {args.repeat}")
+    for case, records in cases.items():
+        timings = {}
+        for name, (decode, parse) in paths.items():
+            timings[name] = min(timeit.repeat(
+                lambda: run(records, decode, parse), number=1, repeat=args.repeat
+            ))
+        baseline = timings["reference"]
+        for name, seconds in timings.items():
+            print(f"  {case:<12} {name:<16} {seconds * 1e6 / args.records:8.2f} us/quote"
+                  f"  {baseline / seconds:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""Throughput and latency benchmark for the processor handler.
+
+Run from services/processor:
+
+    python benchmarks/bench_handler.py [--invocations N] [--batch-size B]
+        [--symbols S] [--skew Z] [--malformed-rate R] [--record-format F]
+        [--dynamodb-latency-ms MS] [--s3-latency-ms MS]
+        [--output FILE] [--compare BASELINE]
+
+Drives ``app.handler`` with synthetic Kinesis events against the in-memory
+DynamoDB and S3 stand-ins of ``tools/local_aws.py``, which sleep for the
+given latency per call. Symbols are drawn from a Zipf distribution
+(``--skew 0`` is uniform) and ``--malformed-rate`` of the records are
+corrupted. Reports records/sec,
+p50/p95/p99 invocation time and the mean time per stage, and writes them as
+JSON to ``--output`` so runs can be compared across commits with
+``--compare``.
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [
+    os.path.join(HERE, ".."),
+    os.path.join(HERE, "..", "tools"),
+    os.path.join(HERE, "..", "..", "common"),
+]
+
+os.environ.setdefault("DYNAMODB_TABLE", "bench-table")
+os.environ.setdefault("S3_BUCKET", "bench-bucket")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ["EMIT_METRICS"] = "false"
+
+import app  # noqa: E402
+import local_aws  # noqa: E402
+from quote_codec import encode_quotes  # noqa: E402
+
+# Per-invocation stage timers recorded by app.metrics
+STAGES = ("DecodeTime", "AnalyticsTime", "WriteTime")
+
+
+# =====================================================
+# Synthetic events
+# =====================================================
+class EventGenerator:
+    def __init__(self, symbols: int, skew: float, malformed_rate: float,
+                 record_format: str, quotes_per_record: int, seed: int):
+        self.random = random.Random(seed)
+        self.symbols = [f"SYM{index:05d}" for index in range(symbols)]
+        self.weights = [1 / (rank + 1) ** skew for rank in range(symbols)]
+        self.prices = {symbol: 100.0 for symbol in self.symbols}
+        self.malformed_rate = malformed_rate
+        self.record_format = record_format
+        self.quotes_per_record = quotes_per_record
+        self.clock = datetime(2024, 1, 2, 14, 30, tzinfo=timezone.utc)
+        self.sequence = 0
+
+    def quotes(self, count: int):
+        quotes = []
+        for symbol in self.random.choices(self.symbols, self.weights, k=count):
+            self.prices[symbol] = round(
+                max(0.01, self.prices[symbol] * (1 + self.random.gauss(0, 0.001))), 4
+            )
+            self.clock += timedelta(milliseconds=1)
+            quotes.append({
+                "symbol": symbol,
+                "price": self.prices[symbol],
+                "volume": self.random.randint(1, 10_000),
+                "timestamp": self.clock.isoformat(timespec="milliseconds").replace("+00:00", "Z"),
+            })
+        return quotes
+
+    def event(self, records: int):
+        if self.record_format == "binary":
+            quotes = self.quotes(records * self.quotes_per_record)
+            payloads = [
+                encode_quotes(quotes[start:start + self.quotes_per_record])
+                for start in range(0, len(quotes), self.quotes_per_record)
+            ]
+        else:
+            payloads = [json.dumps(quote).encode("utf-8") for quote in self.quotes(records)]
+
+        event_records = []
+        for payload in payloads:
+            if self.random.random() < self.malformed_rate:
+                payload = payload[: len(payload) // 2]
+            self.sequence += 1
+            event_records.append({
+                "eventID": f"shardId-000000000000:{self.sequence}",
+                "kinesis": {
+                    "sequenceNumber": str(self.sequence),
+                    "data": base64.b64encode(payload).decode("ascii"),
+                },
+            })
+        return {"Records": event_records}
+
+
+# =====================================================
+# Benchmark
+# =====================================================
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def run(args):
+    dynamodb = local_aws.FakeDynamoDB(args.dynamodb_latency_ms)
+    s3 = local_aws.FakeS3(args.s3_latency_ms)
+    local_aws.install(app, dynamodb, s3)
+    app.DYNAMODB_WRITE_MODE = args.write_mode
+    app.ANALYTICS_MODE = args.analytics_mode
+    app.S3_ARCHIVE_FORMAT = args.archive_format
+    # Log lines are still formatted, just not shown
+    app.logHandler.setStream(open(os.devnull, "w"))
+
+    generator = EventGenerator(args.symbols, args.skew, args.malformed_rate,
+                               args.record_format, args.quotes_per_record, args.seed)
+    events = [generator.event(args.batch_size)
+              for _ in range(args.warmup + args.invocations)]
+
+    durations, stages = [], {stage: [] for stage in STAGES}
+    records = quotes = failed = 0
+    for index, event in enumerate(events):
+        started = time.perf_counter()
+        result = app.handler(event, None)
+        elapsed = time.perf_counter() - started
+        if index < args.warmup:
+            continue
+
+        summary = app.metrics.summary()
+        durations.append(elapsed * 1000)
+        for stage in STAGES:
+            stages[stage].append(summary.get(f"{stage}_ms", {}).get("sum", 0.0))
+        records += len(event["Records"])
+        quotes += summary.get("QuotesProcessed", 0)
+        failed += len(result["batchItemFailures"])
+
+    total_seconds = sum(durations) / 1000
+    return {
+        "invocations": len(durations),
+        "records": records,
+        "quotes": quotes,
+        "failed_records": failed,
+        "records_per_sec": round(records / total_seconds, 1),
+        "quotes_per_sec": round(quotes / total_seconds, 1),
+        "invocation_ms": {
+            "mean": round(sum(durations) / len(durations), 3),
+            "p50": round(percentile(durations, 0.50), 3),
+            "p95": round(percentile(durations, 0.95), 3),
+            "p99": round(percentile(durations, 0.99), 3),
+            "max": round(max(durations), 3),
+        },
+        "stage_mean_ms": {
+            stage: round(sum(values) / len(values), 3) for stage, values in stages.items()
+        },
+        "calls": {
+            "dynamodb": dynamodb.calls + dynamodb.table.calls,
+            "s3": s3.calls,
+        },
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """Print the change of the headline numbers against a baseline run."""
+    print(f"\nvs {baseline.get('commit') or 'baseline'}:")
+    pairs = [("records_per_sec", results["records_per_sec"], baseline["results"]["records_per_sec"])]
+    pairs += [
+        (f"{name} ms", results["invocation_ms"][name], baseline["results"]["invocation_ms"][name])
+        for name in ("p50", "p95", "p99")
+    ]
+    for name, current, previous in pairs:
+        change = (current - previous) / previous * 100 if previous else 0.0
+        print(f"  {name:<16} {previous:>12} -> {current:<12} {change:+6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--invocations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=500,
+                        help="Kinesis records per invocation")
+    parser.add_argument("--symbols", type=int, default=100)
+    parser.add_argument("--skew", type=float, default=1.0,
+                        help="Zipf exponent of symbol popularity (0 = uniform)")
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--record-format", choices=("json", "binary"), default="json")
+    parser.add_argument("--quotes-per-record", type=int, default=20,
+                        help="quotes per binary record")
+    parser.add_argument("--dynamodb-latency-ms", type=float, default=5.0)
+    parser.add_argument("--s3-latency-ms", type=float, default=20.0)
+    parser.add_argument("--write-mode", choices=("ticks", "latest", "both"),
+                        default=app.DYNAMODB_WRITE_MODE)
+    parser.add_argument("--analytics-mode", choices=("auto", "scalar", "vectorized"),
+                        default=app.ANALYTICS_MODE)
+    parser.add_argument("--archive-format", choices=("parquet", "json"),
+                        default=app.S3_ARCHIVE_FORMAT)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench-handler.json",
+                        help="where to write the JSON results")
+    parser.add_argument("--compare", help="earlier --output file to compare against")
+    args = parser.parse_args()
+
+    results = run(args)
+    report = {
+        "benchmark": "processor-handler",
+        "commit": git_commit(),
+        "recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "results": results,
+    }
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+
+    latency = results["invocation_ms"]
+    print(f"{results['invocations']} invocations x {args.batch_size} records "
+          f"({results['quotes']} quotes, {results['failed_records']} failed records)")
+    print(f"  throughput   {results['records_per_sec']:>10} records/s"
+          f"  {results['quotes_per_sec']:>10} quotes/s")
+    print(f"  invocation   p50 {latency['p50']} ms  p95 {latency['p95']} ms"
+          f"  p99 {latency['p99']} ms  max {latency['max']} ms")
+    for stage, value in results["stage_mean_ms"].items():
+        print(f"  {stage:<13} {value:>10} ms mean")
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(results, json.load(baseline))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Per-shard record checkpoints, so retried and replayed records are skipped.
+
+Kinesis delivers at least once. With ReportBatchItemFailures, Lambda resends
+a batch from its lowest failed record, so records after that one which
+already succeeded come round again. Processing them again would repeat
+their writes and fold their prices into the indicator windows twice.
+
+Each shard keeps a high-water mark: every record up to and including it
+has been processed. A record at or below the mark is skipped before it is
+decoded. Records above the mark that succeeded while an earlier one failed
+go into a Bloom filter, and are skipped when they come back. The filter is
+emptied once the mark passes the newest record in it. A false positive
+would skip a record that was never processed, so the filter is sized for a
+one-in-a-million rate. Once it holds ``capacity`` records, it stops taking
+more; records that do not fit are simply processed again.
+
+Checkpoints live in the warm container and are saved after every batch as
+one item per shard (``symbol`` ``#shard#<shard id>``, sort key
+``CHECKPOINT``). A save only succeeds if the stored mark is not newer, so a
+container that lost the shard cannot move it back. Sequence numbers only
+increase within a shard, so this relies on the event source mapping's
+ParallelizationFactor being 1.
+"""
+import hashlib
+import math
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+CHECKPOINT_SORT_KEY = "CHECKPOINT"
+# Kinesis sequence numbers have up to 56 digits; padded, they compare as strings
+SEQUENCE_WIDTH = 64
+
+
+def shard_key(shard_id: str) -> str:
+    return f"#shard#{shard_id}"
+
+
+def shard_of(event_id: str) -> str:
+    """Shard id of a Kinesis eventID (``<shard id>:<sequence number>``)."""
+    return event_id.rsplit(":", 1)[0]
+
+
+def record_position(record: Dict[str, Any]) -> Tuple[str, int]:
+    """``(shard id, sequence number)`` of a Kinesis event record."""
+    return shard_of(record["eventID"]), int(record["kinesis"]["sequenceNumber"])
+
+
+class BloomFilter:
+    """Bit-array Bloom filter over sequence numbers."""
+
+    def __init__(self, capacity: int, error_rate: float = 1e-6,
+                 bits: Optional[bytes] = None, count: int = 0):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(bits) if bits is not None else bytearray((self.size + 7) // 8)
+        self.count = count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, sequence: int) -> bool:
+        return all(self.bits[bit >> 3] & (1 << (bit & 7)) for bit in self._bits(sequence))
+
+    def add(self, sequence: int) -> bool:
+        """Add ``sequence``; False when the filter is full."""
+        if self.count >= self.capacity:
+            return False
+        for bit in self._bits(sequence):
+            self.bits[bit >> 3] |= 1 << (bit & 7)
+        self.count += 1
+        return True
+
+    def clear(self):
+        self.bits = bytearray(len(self.bits))
+        self.count = 0
+
+    def _bits(self, sequence: int):
+        digest = hashlib.blake2b(str(sequence).encode("ascii"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:], "big") | 1
+        return ((first + index * second) % self.size for index in range(self.hashes))
+
+
+class ShardCheckpoint:
+    """High-water mark and out-of-order filter of one shard."""
+
+    def __init__(self, shard_id: str, capacity: int, high_water: int = -1,
+                 filter_max: int = -1, bloom: Optional[BloomFilter] = None):
+        self.shard_id = shard_id
+        self.high_water = high_water
+        self.filter_max = filter_max
+        self.bloom = bloom or BloomFilter(capacity)
+        self.changed = False
+
+    def seen(self, sequence: int) -> bool:
+        return sequence <= self.high_water or (
+            sequence <= self.filter_max and sequence in self.bloom
+        )
+
+    def advance(self, succeeded: Iterable[int], failed: Iterable[int]):
+        """Record a batch's outcome: the sequence numbers that were processed
+        (or skipped as seen) and those that failed."""
+        failed = sorted(failed)
+        first_failed = failed[0] if failed else None
+        for sequence in sorted(succeeded):
+            if first_failed is None or sequence < first_failed:
+                if sequence > self.high_water:
+                    self.high_water = sequence
+                    self.changed = True
+            elif not self.seen(sequence) and self.bloom.add(sequence):
+                self.filter_max = max(self.filter_max, sequence)
+                self.changed = True
+        if self.filter_max >= 0 and self.high_water >= self.filter_max:
+            self.bloom.clear()
+            self.filter_max = -1
+
+    def item(self) -> Dict[str, Any]:
+        item = {
+            "symbol": shard_key(self.shard_id),
+            "timestamp": CHECKPOINT_SORT_KEY,
+            "high_water": _padded(self.high_water),
+            "filter_max": _padded(self.filter_max),
+            "filter_count": self.bloom.count,
+        }
+        # The filter is only non-empty while a batch is being retried, so
+        # saves after clean batches stay small
+        if self.bloom.count:
+            item["filter"] = bytes(self.bloom.bits)
+        return item
+
+
+class CheckpointStore:
+    """Loads and saves shard checkpoints through a DynamoDB resource."""
+
+    def __init__(self, table_name: str, capacity: int = 10000):
+        self.table_name = table_name
+        self.capacity = capacity
+        self.shards: Dict[str, ShardCheckpoint] = {}
+
+    def get(self, dynamodb, shard_id: str) -> ShardCheckpoint:
+        """The shard's checkpoint, read from the table on first use.
+
+        Errors from the read propagate; the caller decides whether to carry
+        on without one.
+        """
+        checkpoint = self.shards.get(shard_id)
+        if checkpoint is None:
+            item = dynamodb.Table(self.table_name).get_item(
+                Key={"symbol": shard_key(shard_id), "timestamp": CHECKPOINT_SORT_KEY},
+                ConsistentRead=True,
+            ).get("Item")
+            checkpoint = self.shards[shard_id] = (
+                self._from_item(shard_id, item) if item
+                else ShardCheckpoint(shard_id, self.capacity)
+            )
+        return checkpoint
+
+    def save(self, dynamodb, checkpoint: ShardCheckpoint) -> bool:
+        """Write the checkpoint if it changed; False if the stored one is newer."""
+        if not checkpoint.changed:
+            return True
+        item = checkpoint.item()
+        try:
+            dynamodb.Table(self.table_name).put_item(
+                Item=item,
+                ConditionExpression="attribute_not_exists(#hw) OR #hw <= :hw",
+                ExpressionAttributeNames={"#hw": "high_water"},
+                ExpressionAttributeValues={":hw": item["high_water"]},
+            )
+        except ClientError as err:
+            if err.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+                # Another container has moved on; ours is stale
+                del self.shards[checkpoint.shard_id]
+                return False
+            raise
+        checkpoint.changed = False
+        return True
+
+    def clear(self):
+        self.shards.clear()
+
+    def _from_item(self, shard_id: str, item: Dict[str, Any]) -> ShardCheckpoint:
+        bloom = BloomFilter(self.capacity)
+        stored = item.get("filter")
+        # The DynamoDB resource hands binary attributes back wrapped in Binary
+        stored = bytes(getattr(stored, "value", stored)) if stored is not None else b""
+        if not stored:
+            filter_max = -1
+        elif len(stored) == len(bloom.bits):
+            bloom = BloomFilter(self.capacity, bits=stored, count=int(item["filter_count"]))
+            filter_max = int(item["filter_max"])
+        else:
+            # Saved with another capacity; out-of-order records get reprocessed
+            filter_max = -1
+        return ShardCheckpoint(shard_id, self.capacity, int(item["high_water"]), filter_max, bloom)
+
+
+def _padded(sequence: int) -> str:
+    return str(sequence).zfill(SEQUENCE_WIDTH) if sequence >= 0 else "-1"
@@ -0,0 +1,61 @@
+"""Fast decode path for Kinesis quote records.
+
+The reference path base64-decodes each record, decodes the bytes to a ``str``,
+parses it with ``json`` and then parses the timestamp with
+``datetime.fromisoformat(timestamp.replace("Z", "+00:00"))``. The fast path
+instead:
+
+* base64-decodes with ``binascii.a2b_base64``, skipping ``base64``'s
+  argument normalisation;
+* parses the bytes directly, with no intermediate ``str``, using ``orjson``
+  when it is installed;
+* parses timestamps with ``datetime.fromisoformat`` directly, without the
+  ``replace``: it accepts "Z" natively from Python 3.11.
+
+Both paths produce the same quotes and datetimes; the tests check this, and
+``benchmarks/bench_decode.py`` compares their speed.
+"""
+import base64
+import binascii
+import json
+import sys
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+from quote_codec import decode_quotes, is_binary
+
+try:
+    import orjson
+    json_loads: Callable[[bytes], Any] = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:  # pragma: no cover - depends on the layer contents
+    json_loads = json.loads
+    JSON_BACKEND = "json"
+
+
+def decode_record(record: Dict[str, Any]) -> List[Dict[str, Any]]:
+    payload = binascii.a2b_base64(record["kinesis"]["data"])
+    if is_binary(payload):
+        return decode_quotes(payload)
+    return [json_loads(payload)]
+
+
+if sys.version_info >= (3, 11):
+    parse_timestamp: Callable[[str], datetime] = datetime.fromisoformat
+else:  # pragma: no cover - Lambda runs 3.11
+    def parse_timestamp(value: str) -> datetime:
+        if value.endswith("Z"):
+            value = value[:-1] + "+00:00"
+        return datetime.fromisoformat(value)
+
+
+def decode_record_reference(record: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """The original copying decode path, kept for equivalence tests and benchmarks."""
+    payload = base64.b64decode(record["kinesis"]["data"])
+    if is_binary(payload):
+        return decode_quotes(payload)
+    return [json.loads(payload.decode("utf-8"))]
+
+
+def parse_timestamp_reference(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
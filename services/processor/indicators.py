@@ -0,0 +1,271 @@
+"""Incremental per-symbol indicators.
+
+Every indicator keeps running state, so a tick costs the same whatever the
+window sizes are:
+
+* SMA and VWAP keep running sums over their windows.
+* EMA keeps the previous value.
+* Rolling variance / standard deviation use Welford's method, with the
+  sliding-window update when the oldest price leaves the window.
+
+Prices and volumes are kept in a fixed-size ring buffer sized for the largest
+window, so each windowed accumulator can find the value it has to drop. The
+running sums are rebuilt from the ring each time it wraps, which stops float
+drift at an amortised O(1) cost. The rings are ``array`` buffers of unboxed
+doubles and 64-bit volumes rather than lists of Python objects.
+
+``IndicatorEngine`` keeps symbols in least-recently-used order and, when
+given ``max_symbols``, evicts the coldest ones at the end of each batch, so a
+warm container's memory stays bounded however many symbols the feed carries.
+"""
+import math
+import sys
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# (prices, volumes, count, ema) of a symbol's window, oldest tick first
+WindowState = Tuple[List[float], List[int], int, Optional[float]]
+
+
+@dataclass(frozen=True)
+class IndicatorConfig:
+    sma_window: int = 5
+    ema_span: int = 10
+    vwap_window: int = 20
+    volatility_window: int = 20
+
+    def __post_init__(self):
+        for name in ("sma_window", "ema_span", "vwap_window", "volatility_window"):
+            if getattr(self, name) < 1:
+                raise ValueError(f"{name} must be at least 1")
+
+    @property
+    def capacity(self) -> int:
+        return max(self.sma_window, self.vwap_window, self.volatility_window)
+
+    @property
+    def ema_alpha(self) -> float:
+        return 2.0 / (self.ema_span + 1)
+
+
+class SymbolIndicators:
+    """Running indicator state for one symbol."""
+
+    __slots__ = (
+        "config", "prices", "volumes", "count", "position",
+        "sma_sum", "ema", "pv_sum", "volume_sum", "mean", "m2",
+    )
+
+    def __init__(self, config: IndicatorConfig):
+        self.config = config
+        self.prices = array("d", bytes(8 * config.capacity))
+        self.volumes = array("q", bytes(8 * config.capacity))
+        self.count = 0
+        self.position = 0
+        self.sma_sum = 0.0
+        self.ema: Optional[float] = None
+        self.pv_sum = 0.0
+        self.volume_sum = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, price: float, volume: int):
+        config = self.config
+        capacity = config.capacity
+        position = self.position
+        count = self.count
+
+        # Values leaving each window have to be read before the ring slot at
+        # `position` is overwritten (it holds the oldest value once full).
+        self.sma_sum += price
+        if count >= config.sma_window:
+            self.sma_sum -= self.prices[(position - config.sma_window) % capacity]
+
+        self.pv_sum += price * volume
+        self.volume_sum += volume
+        if count >= config.vwap_window:
+            old = (position - config.vwap_window) % capacity
+            self.pv_sum -= self.prices[old] * self.volumes[old]
+            self.volume_sum -= self.volumes[old]
+
+        window = config.volatility_window
+        if count < window:
+            n = count + 1
+            delta = price - self.mean
+            self.mean += delta / n
+            self.m2 += delta * (price - self.mean)
+        else:
+            old_price = self.prices[(position - window) % capacity]
+            old_mean = self.mean
+            self.mean = old_mean + (price - old_price) / window
+            self.m2 += (price - old_price) * (price - self.mean + old_price - old_mean)
+            if self.m2 < 0.0:
+                self.m2 = 0.0
+
+        if self.ema is None:
+            self.ema = price
+        else:
+            self.ema += config.ema_alpha * (price - self.ema)
+
+        self.prices[position] = price
+        self.volumes[position] = volume
+        self.count = count + 1
+        self.position = (position + 1) % capacity
+        if self.position == 0:
+            self._reanchor()
+
+    def window(self) -> Tuple[List[float], List[int]]:
+        """The prices and volumes still held in the ring, oldest first."""
+        pairs = list(self._window(self.config.capacity))
+        return [p for p, _ in pairs], [v for _, v in pairs]
+
+    def load(self, prices: List[float], volumes: List[int], count: int,
+             ema: Optional[float]):
+        """Replace the state with an externally computed one.
+
+        `prices` and `volumes` are the most recent ticks, oldest first (only
+        the last `capacity` are kept) and `count` is the total number of
+        ticks the state has seen.
+        """
+        capacity = self.config.capacity
+        prices = list(prices[-capacity:])
+        volumes = list(volumes[-capacity:])
+        held = len(prices)
+        self.prices = array("d", prices + [0.0] * (capacity - held))
+        self.volumes = array("q", volumes + [0] * (capacity - held))
+        self.position = held % capacity
+        self.count = count
+        self.ema = ema
+        if held:
+            self._reanchor()
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by this state, in bytes."""
+        return (sys.getsizeof(self) + sys.getsizeof(self.prices)
+                + sys.getsizeof(self.volumes))
+
+    def _window(self, size: int):
+        """Yield the last `size` (price, volume) pairs, oldest first."""
+        n = min(self.count, size)
+        capacity = self.config.capacity
+        for offset in range(n, 0, -1):
+            index = (self.position - offset) % capacity
+            yield self.prices[index], self.volumes[index]
+
+    def _reanchor(self):
+        config = self.config
+        self.sma_sum = math.fsum(p for p, _ in self._window(config.sma_window))
+        vwap = list(self._window(config.vwap_window))
+        self.pv_sum = math.fsum(p * v for p, v in vwap)
+        self.volume_sum = sum(v for _, v in vwap)
+        prices = [p for p, _ in self._window(config.volatility_window)]
+        self.mean = math.fsum(prices) / len(prices)
+        self.m2 = math.fsum((p - self.mean) ** 2 for p in prices)
+
+    @property
+    def sma(self) -> float:
+        return self.sma_sum / min(self.count, self.config.sma_window)
+
+    @property
+    def vwap(self) -> Optional[float]:
+        if self.volume_sum <= 0:
+            return None
+        return self.pv_sum / self.volume_sum
+
+    @property
+    def variance(self) -> float:
+        n = min(self.count, self.config.volatility_window)
+        if n < 2:
+            return 0.0
+        return self.m2 / (n - 1)
+
+    @property
+    def stddev(self) -> float:
+        return math.sqrt(self.variance)
+
+    def snapshot(self) -> Dict[str, float]:
+        """Current indicator values, rounded for storage."""
+        sma, ema, stddev, vwap = self.rounded()
+        values = {"moving_average": sma, "ema": ema, "stddev": stddev}
+        if vwap == vwap:
+            values["vwap"] = vwap
+        return values
+
+    def rounded(self) -> Tuple[float, float, float, float]:
+        """``(sma, ema, stddev, vwap)`` as ``snapshot`` rounds them, with a NaN
+        VWAP while the window has no volume; no dict per tick."""
+        vwap = self.vwap
+        return (round(self.sma, 2), round(self.ema, 2), round(self.stddev, 4),
+                math.nan if vwap is None else round(vwap, 2))
+
+
+class IndicatorEngine:
+    """Per-symbol indicator state for a warm container, in LRU order."""
+
+    def __init__(self, config: IndicatorConfig, max_symbols: Optional[int] = None):
+        self.config = config
+        self.max_symbols = max_symbols
+        self.symbols: "OrderedDict[str, SymbolIndicators]" = OrderedDict()
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def state(self, symbol: str) -> SymbolIndicators:
+        state = self.symbols.get(symbol)
+        if state is None:
+            state = self.symbols[symbol] = SymbolIndicators(self.config)
+        else:
+            self.symbols.move_to_end(symbol)
+        return state
+
+    def update(self, symbol: str, price: float, volume: int) -> Dict[str, float]:
+        state = self.state(symbol)
+        state.update(price, volume)
+        return state.snapshot()
+
+    def save(self, symbols: Iterable[str]) -> Dict[str, Optional[WindowState]]:
+        """The current state of ``symbols``, for ``restore``.
+
+        Symbols the engine does not hold are saved as None.
+        """
+        saved: Dict[str, Optional[WindowState]] = {}
+        for symbol in symbols:
+            state = self.symbols.get(symbol)
+            saved[symbol] = None if state is None else (*state.window(), state.count, state.ema)
+        return saved
+
+    def restore(self, symbol: str, saved: Optional[WindowState]):
+        """Put a symbol back to a state returned by ``save``."""
+        if saved is None:
+            self.symbols.pop(symbol, None)
+        else:
+            self.state(symbol).load(*saved)
+
+    def evict(self) -> List[str]:
+        """Drop the least recently used symbols above ``max_symbols``.
+
+        Called between batches rather than from ``state``, so a batch with
+        more symbols than the limit never loses state it is still using.
+        Returns the evicted symbols.
+        """
+        if self.max_symbols is None:
+            return []
+        evicted = []
+        while len(self.symbols) > self.max_symbols:
+            symbol, _ = self.symbols.popitem(last=False)
+            evicted.append(symbol)
+        self.evictions += len(evicted)
+        return evicted
+
+    def footprint(self) -> int:
+        """Approximate memory held by all symbol state, in bytes."""
+        return sys.getsizeof(self.symbols) + sum(
+            sys.getsizeof(symbol) + state.nbytes for symbol, state in self.symbols.items()
+        )
+
+    def clear(self):
+        self.symbols.clear()
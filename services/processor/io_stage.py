@@ -0,0 +1,46 @@
+"""Bounded-concurrency I/O stage for the processor's writes.
+
+A batch's DynamoDB chunks and S3 objects are independent network calls, so
+they run on a shared thread pool instead of one after another. Tasks that
+share an ordering key (for example a symbol) still run sequentially, in the
+order they were submitted, on a single worker.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+Task = Tuple[Optional[str], Callable[[], Any]]
+
+
+class IOStage:
+    """Runs a batch of write tasks on a warm, bounded thread pool."""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="io-stage"
+        )
+
+    def run(self, tasks: List[Task]) -> List[Any]:
+        """Run ``(ordering_key, fn)`` tasks and wait for all of them.
+
+        Returns one entry per task, in submission order: the task's return
+        value, or the exception it raised. A failing task does not stop the
+        tasks queued behind it under the same key.
+        """
+        results: List[Any] = [None] * len(tasks)
+        lanes: Dict[Any, List[int]] = {}
+        for index, (key, _) in enumerate(tasks):
+            # Unkeyed tasks have no ordering constraint and get a lane each
+            lanes.setdefault(key if key is not None else ("task", index), []).append(index)
+
+        def run_lane(indexes: List[int]):
+            for index in indexes:
+                try:
+                    results[index] = tasks[index][1]()
+                except Exception as err:
+                    results[index] = err
+
+        futures = [self._executor.submit(run_lane, indexes) for indexes in lanes.values()]
+        for future in futures:
+            future.result()
+        return results
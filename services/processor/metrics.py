@@ -0,0 +1,129 @@
+"""Per-invocation metrics, emitted in CloudWatch Embedded Metric Format.
+
+Counters, gauges, failure counts by type and timings are accumulated in memory while
+a batch is processed (writes report from I/O stage threads, hence the lock)
+and written out once per invocation as EMF documents. CloudWatch turns those
+into metrics without any log parsing.
+"""
+import json
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, TextIO, Tuple
+
+# EMF caps a document at 100 metrics and 100 values per metric
+MAX_VALUES_PER_METRIC = 100
+
+
+class InvocationMetrics:
+    def __init__(self, namespace: str, dimensions: Dict[str, str],
+                 stream: Optional[TextIO] = None):
+        self.namespace = namespace
+        self.dimensions = dimensions
+        self._stream = stream
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters: Counter = Counter()
+            self.failures: Counter = Counter()
+            self.timings: Dict[str, List[float]] = defaultdict(list)
+            self.gauges: Dict[str, Tuple[float, str]] = {}
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def failure(self, error_type: str, value: int = 1):
+        with self._lock:
+            self.failures[error_type] += value
+
+    def gauge(self, name: str, value: float, unit: str = "None"):
+        """A point-in-time value; the last one set wins."""
+        with self._lock:
+            self.gauges[name] = (value, unit)
+
+    def timing(self, name: str, milliseconds: float):
+        with self._lock:
+            self.timings[name].append(round(milliseconds, 3))
+
+    @contextmanager
+    def timer(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timing(name, (time.perf_counter() - started) * 1000)
+
+    def summary(self) -> Dict[str, Any]:
+        """Aggregated values, for the per-invocation log line."""
+        with self._lock:
+            summary: Dict[str, Any] = dict(self.counters)
+            summary.update((name, value) for name, (value, _) in self.gauges.items())
+            summary["failures_by_type"] = dict(self.failures)
+            for name, values in self.timings.items():
+                summary[f"{name}_ms"] = {
+                    "count": len(values),
+                    "sum": round(sum(values), 3),
+                    "max": max(values),
+                }
+            return summary
+
+    def documents(self, timestamp_ms: Optional[int] = None) -> List[Dict[str, Any]]:
+        """EMF documents for everything recorded since the last reset."""
+        timestamp_ms = timestamp_ms or int(time.time() * 1000)
+        with self._lock:
+            values: Dict[str, Any] = dict(self.counters)
+            units = {name: "Count" for name in self.counters}
+            for name, (value, unit) in self.gauges.items():
+                values[name] = value
+                units[name] = unit
+            for name, samples in self.timings.items():
+                values[name] = _downsample(samples)
+                units[name] = "Milliseconds"
+
+            documents = [self._document(timestamp_ms, self.dimensions, values, units)]
+            for error_type, count in self.failures.items():
+                documents.append(self._document(
+                    timestamp_ms,
+                    {**self.dimensions, "ErrorType": error_type},
+                    {"RecordsFailedByType": count},
+                    {"RecordsFailedByType": "Count"},
+                ))
+            return documents
+
+    def flush(self):
+        """Write the EMF documents to stdout and start over."""
+        stream = self._stream or sys.stdout
+        for document in self.documents():
+            stream.write(json.dumps(document, separators=(",", ":")) + "\n")
+        stream.flush()
+        self.reset()
+
+    def _document(self, timestamp_ms, dimensions, values, units):
+        return {
+            "_aws": {
+                "Timestamp": timestamp_ms,
+                "CloudWatchMetrics": [{
+                    "Namespace": self.namespace,
+                    "Dimensions": [list(dimensions)],
+                    "Metrics": [{"Name": name, "Unit": units[name]} for name in values],
+                }],
+            },
+            **dimensions,
+            **values,
+        }
+
+
+def _downsample(samples: List[float]) -> Any:
+    if len(samples) == 1:
+        return samples[0]
+    if len(samples) <= MAX_VALUES_PER_METRIC:
+        return samples
+    # Keep the distribution's shape (including the max) within the EMF limit
+    ordered = sorted(samples)
+    step = (len(ordered) - 1) / (MAX_VALUES_PER_METRIC - 1)
+    return [ordered[round(index * step)] for index in range(MAX_VALUES_PER_METRIC)]
@@ -0,0 +1,150 @@
+"""Column-wise container for the quotes of one processor invocation.
+
+Prices, volumes, event times (epoch nanoseconds) and indicator values are
+kept in ``array`` buffers, one per field, and symbols are interned. A quote
+is a row index. Writers build dicts per row with ``item`` only when they
+need them, and the NumPy analytics read and write the buffers in place
+through ``column``.
+"""
+import math
+import sys
+from array import array
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Container, Dict, Iterable, List, Optional, Set
+
+INDICATORS = ("moving_average", "ema", "stddev", "vwap")
+NS_PER_MS = 1_000_000
+NS_PER_US = 1_000
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_NAN = float("nan")
+
+
+def epoch_ns(moment: datetime) -> int:
+    """Exact epoch nanoseconds of a datetime; naive times are UTC."""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    delta = moment - _EPOCH
+    return ((delta.days * 86_400 + delta.seconds) * 1_000_000 + delta.microseconds) * NS_PER_US
+
+
+class QuoteBatch:
+    """The quotes of a batch, stored column-wise."""
+
+    __slots__ = (
+        "record_ids", "symbols", "timestamps", "prices", "volumes", "event_ns",
+        "moving_average", "ema", "stddev", "vwap", "sources",
+    )
+
+    def __init__(self, keep_sources: bool = False):
+        self.record_ids: List[str] = []
+        self.symbols: List[str] = []
+        self.timestamps: List[str] = []
+        self.prices = array("d")
+        self.volumes = array("q")
+        self.event_ns = array("q")
+        # Filled by the analytics stage, one value per row
+        self.moving_average = array("d")
+        self.ema = array("d")
+        self.stddev = array("d")
+        self.vwap = array("d")
+        # The decoded documents, only kept for writers that need them whole
+        self.sources: Optional[List[Dict[str, Any]]] = [] if keep_sources else None
+
+    def __len__(self) -> int:
+        return len(self.record_ids)
+
+    def append(self, record_id: str, symbol: str, price: float, volume: int,
+               timestamp: str, event_ns: int, source: Optional[Dict[str, Any]] = None):
+        self.record_ids.append(record_id)
+        self.symbols.append(sys.intern(symbol))
+        self.timestamps.append(timestamp)
+        self.prices.append(price)
+        self.volumes.append(volume)
+        self.event_ns.append(event_ns)
+        if self.sources is not None:
+            self.sources.append(source)
+
+    # =====================================================
+    # Indicators
+    # =====================================================
+    def reset_indicators(self):
+        """Size the indicator columns to the batch, all NaN."""
+        blank = array("d", [_NAN]) * len(self)
+        for name in INDICATORS:
+            setattr(self, name, array("d", blank))
+
+    def set_indicators(self, row: int, values):
+        """``values`` is ``(moving_average, ema, stddev, vwap)``; vwap may be NaN."""
+        self.moving_average[row], self.ema[row], self.stddev[row], self.vwap[row] = values
+
+    def column(self, name: str):
+        """A writable NumPy view of a numeric column, without copying.
+
+        The column cannot grow while the view is alive.
+        """
+        import numpy as np
+        buffer = getattr(self, name)
+        return np.frombuffer(buffer, dtype=np.float64 if buffer.typecode == "d" else np.int64)
+
+    # =====================================================
+    # Access
+    # =====================================================
+    def symbol_set(self) -> Set[str]:
+        return set(self.symbols)
+
+    def rows_by_symbol(self, rows: Optional[Iterable[int]] = None) -> Dict[str, List[int]]:
+        """Row indexes per symbol, in the order of ``rows`` (default: batch order)."""
+        grouped: Dict[str, List[int]] = defaultdict(list)
+        symbols = self.symbols
+        for row in range(len(self)) if rows is None else rows:
+            grouped[symbols[row]].append(row)
+        return grouped
+
+    def event_ms(self, row: int) -> int:
+        return self.event_ns[row] // NS_PER_MS
+
+    def event_time(self, row: int) -> datetime:
+        """Event time of a row as an aware UTC datetime."""
+        return _EPOCH + timedelta(microseconds=self.event_ns[row] // NS_PER_US)
+
+    def item(self, row: int) -> Dict[str, Any]:
+        """The processed item of a row, as stored in DynamoDB."""
+        item = {
+            "symbol": self.symbols[row],
+            "timestamp": self.timestamps[row],
+            "price": self.prices[row],
+            "volume": self.volumes[row],
+        }
+        if len(self.moving_average) > row:
+            item["moving_average"] = self.moving_average[row]
+            item["ema"] = self.ema[row]
+            item["stddev"] = self.stddev[row]
+            vwap = self.vwap[row]
+            if not math.isnan(vwap):
+                item["vwap"] = vwap
+        return item
+
+    # =====================================================
+    # Filtering
+    # =====================================================
+    def select(self, keep: Callable[[str], bool]) -> "QuoteBatch":
+        """A new batch of the rows whose eventID ``keep`` accepts."""
+        rows = [row for row, record_id in enumerate(self.record_ids) if keep(record_id)]
+        if len(rows) == len(self):
+            return self
+        batch = QuoteBatch(keep_sources=self.sources is not None)
+        batch.record_ids = [self.record_ids[row] for row in rows]
+        batch.symbols = [self.symbols[row] for row in rows]
+        batch.timestamps = [self.timestamps[row] for row in rows]
+        for name in ("prices", "volumes", "event_ns") + INDICATORS:
+            column = getattr(self, name)
+            if len(column) == len(self):
+                setattr(batch, name, array(column.typecode, [column[row] for row in rows]))
+        if self.sources is not None:
+            batch.sources = [self.sources[row] for row in rows]
+        return batch
+
+    def without(self, record_ids: Container[str]) -> "QuoteBatch":
+        return self.select(lambda record_id: record_id not in record_ids)
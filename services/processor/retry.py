@@ -0,0 +1,208 @@
+"""Adaptive retries for the processor's AWS calls.
+
+Every DynamoDB and S3 call of an invocation goes through one
+``AdaptiveRetry``. Throttles, 5xx responses and connection errors are
+retried with full-jitter exponential backoff, and an AIMD limiter caps how
+many calls are in flight: each success raises the limit by ``increase``
+over one window of calls, each throttle halves it. Under throttling the
+I/O stage's workers queue on the limiter instead of piling more requests
+onto a table that is already shedding them.
+
+Retries stop at the invocation's deadline: the Lambda timeout less a
+reserve for reporting. An attempt is only started while there is time left
+for it to run to its connect and read timeouts (``attempt_timeout``) before
+the deadline. A call that would have to start or sleep past that point
+raises ``DeadlineExceeded`` instead, so the handler can fail the records it
+did not get to and return, rather than being killed and having the whole
+batch redelivered.
+
+botocore's own retries are turned off for clients used this way (see
+``app._io_config``); otherwise each attempt here would hide several more.
+"""
+import random
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from botocore.exceptions import ClientError, HTTPClientError
+from botocore.exceptions import ConnectionError as BotoConnectionError
+
+THROTTLE_CODES = frozenset({
+    "ProvisionedThroughputExceededException",
+    "RequestLimitExceeded",
+    "ThrottlingException",
+    "Throttling",
+    "ThrottledException",
+    "TooManyRequestsException",
+    "SlowDown",
+})
+TRANSIENT_CODES = frozenset({
+    "InternalError",
+    "InternalServerError",
+    "ServiceUnavailable",
+    "RequestTimeout",
+    "RequestTimeoutException",
+    "TransactionInProgressException",
+})
+
+
+class DeadlineExceeded(Exception):
+    """The invocation has no time left for another attempt."""
+
+
+class Throttled(Exception):
+    """Raised by a call that got a partial result, such as BatchWriteItem
+    leaving UnprocessedItems, to have the rest retried as a throttle."""
+
+
+def error_code(err: BaseException) -> Optional[str]:
+    if isinstance(err, ClientError):
+        return err.response.get("Error", {}).get("Code")
+    return None
+
+
+def is_throttle(err: BaseException) -> bool:
+    return isinstance(err, Throttled) or error_code(err) in THROTTLE_CODES
+
+
+def is_retryable(err: BaseException) -> bool:
+    """Throttles, 5xx responses and connection errors.
+
+    Other client errors, such as a failed condition or a validation error,
+    would fail the same way again.
+    """
+    if is_throttle(err):
+        return True
+    if isinstance(err, ClientError):
+        status = err.response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+        return error_code(err) in TRANSIENT_CODES or status >= 500
+    # ParamValidationError and friends are BotoCoreErrors too
+    return isinstance(err, (BotoConnectionError, HTTPClientError))
+
+
+class Deadline:
+    """When an invocation has to stop starting AWS calls.
+
+    ``context`` is the Lambda context; without ``get_remaining_time_in_millis``
+    (tests, local tools) there is no deadline.
+    """
+
+    def __init__(self, context: Any = None, reserve_ms: int = 0,
+                 clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        remaining_ms = getattr(context, "get_remaining_time_in_millis", None)
+        self.expires_at = (
+            None if remaining_ms is None
+            else clock() + (remaining_ms() - reserve_ms) / 1000
+        )
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None without a deadline."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - self._clock())
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and self._clock() >= self.expires_at
+
+
+class AIMDLimiter:
+    """Concurrency limit with additive increase and multiplicative decrease."""
+
+    def __init__(self, limit: int, minimum: int = 1, maximum: Optional[int] = None,
+                 increase: float = 1.0, decrease: float = 0.5):
+        self.minimum = minimum
+        self.maximum = maximum or limit
+        self.increase = increase
+        self.decrease = decrease
+        self.limit = float(min(max(limit, minimum), self.maximum))
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Wait for a slot; False if none freed up within ``timeout`` seconds."""
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: self.in_flight < max(self.minimum, int(self.limit)), timeout
+            ):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, throttled: bool = False, succeeded: bool = True):
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+            elif succeeded:
+                # +increase once a whole window of calls has succeeded
+                self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+            self._condition.notify_all()
+
+
+class AdaptiveRetry:
+    """Runs calls under an AIMD limiter, retrying transient errors with backoff."""
+
+    def __init__(self, limiter: AIMDLimiter, max_attempts: int = 6,
+                 backoff_base: float = 0.05, backoff_cap: float = 5.0,
+                 on_retry: Optional[Callable[[BaseException, int], None]] = None,
+                 attempt_timeout: float = 0.0):
+        self.limiter = limiter
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.on_retry = on_retry
+        # Longest one attempt can take, in seconds
+        self.attempt_timeout = attempt_timeout
+        self.deadline = Deadline()
+
+    def time_left(self) -> Optional[float]:
+        """Seconds left to start attempts in, or None without a deadline."""
+        remaining = self.deadline.remaining()
+        if remaining is None:
+            return None
+        return max(0.0, remaining - self.attempt_timeout)
+
+    def out_of_time(self) -> bool:
+        """True once no attempt may be started before the deadline."""
+        left = self.time_left()
+        return left is not None and left <= 0.0
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """``fn(*args, **kwargs)``, retried while its errors are transient.
+
+        Raises the last error once attempts run out, or ``DeadlineExceeded``
+        (chained to it) when the next attempt could not finish before the
+        deadline.
+        """
+        last_error: Optional[BaseException] = None
+        attempt = 0
+        while True:
+            if attempt:
+                delay = self._backoff_delay(attempt)
+                left = self.time_left()
+                if left is not None and delay >= left:
+                    raise DeadlineExceeded(f"no time left for attempt {attempt + 1}") from last_error
+                time.sleep(delay)
+            if self.out_of_time() or not self.limiter.acquire(self.time_left()):
+                raise DeadlineExceeded("deadline passed before the call started") from last_error
+
+            throttled = succeeded = False
+            try:
+                result = fn(*args, **kwargs)
+                succeeded = True
+                return result
+            except Exception as err:
+                throttled = is_throttle(err)
+                if not is_retryable(err) or attempt + 1 == self.max_attempts:
+                    raise
+                last_error = err
+                if self.on_retry:
+                    self.on_retry(err, attempt + 1)
+            finally:
+                self.limiter.release(throttled, succeeded)
+            attempt += 1
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff."""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
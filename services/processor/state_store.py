@@ -0,0 +1,185 @@
+"""Rolling-window indicator state persisted to DynamoDB.
+
+``IndicatorEngine`` state only lives as long as a warm container. So that a
+cold start, or another container taking over a shard, carries on the same
+windows, every symbol a batch touched is snapshotted at the end of the batch
+(one item per symbol, sort key ``STATE``), and a symbol the engine does not
+hold yet is hydrated from its snapshot before its first tick is processed.
+Both directions are batched: one BatchGetItem per 100 unknown symbols, one
+BatchWriteItem per 25 changed ones. Unprocessed keys and items raise
+``Throttled`` so the caller's retry policy (``call``) retries them; the
+store has no retry loop of its own.
+
+A warm window is only current if no other container has processed the
+symbol since. Each batch ``claim``s its shard (one item per shard, sort key
+``STATE_OWNER``), which says whether this container also processed the
+shard's previous batch. If it did not, the symbols it holds are passed to
+``hydrate`` as ``refresh`` and their snapshots re-read. The snapshot's tick
+``count`` is its version: a warm window is replaced by a snapshot that has
+seen more ticks.
+
+The window travels as a packed binary attribute, so prices round-trip
+exactly and the item stays small::
+
+    version:u8  held:u16  count:i64  ema:f64 (NaN when unset)
+    price:f64 * held  volume:i64 * held
+"""
+import math
+import struct
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from checkpoints import shard_key
+from indicators import IndicatorEngine, SymbolIndicators, WindowState
+from retry import Throttled
+
+# Sorts after every ISO-8601 tick timestamp, next to the LATEST item
+STATE_SORT_KEY = "STATE"
+# Sort key of the per-shard item naming the container that processed it last
+OWNER_SORT_KEY = "STATE_OWNER"
+FORMAT_VERSION = 1
+
+# BatchGetItem reads at most 100 keys and BatchWriteItem 25 items per call
+READ_BATCH_SIZE = 100
+WRITE_BATCH_SIZE = 25
+
+_HEADER = struct.Struct(">BHqd")
+
+
+def encode_state(state: SymbolIndicators) -> bytes:
+    prices, volumes = state.window()
+    ema = state.ema if state.ema is not None else math.nan
+    return (
+        _HEADER.pack(FORMAT_VERSION, len(prices), state.count, ema)
+        + struct.pack(f">{len(prices)}d{len(volumes)}q", *prices, *volumes)
+    )
+
+
+def decode_state(payload: bytes) -> WindowState:
+    """Return ``(prices, volumes, count, ema)`` from an encoded snapshot."""
+    version, held, count, ema = _HEADER.unpack_from(payload)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported state snapshot version {version}")
+    values = struct.unpack_from(f">{held}d{held}q", payload, _HEADER.size)
+    return (list(values[:held]), list(values[held:]), count,
+            None if math.isnan(ema) else ema)
+
+
+class IndicatorStateStore:
+    """Reads and writes ``STATE`` snapshots through a DynamoDB resource."""
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+
+    def claim(self, dynamodb, shard_id: str, owner: str,
+              call: Optional[Callable[..., Any]] = None) -> bool:
+        """Record ``owner`` as the container processing ``shard_id``.
+
+        Returns True when ``owner`` was also the last to process the shard,
+        so its warm windows for the shard's symbols are still current.
+        """
+        response = (call or _once)(
+            dynamodb.Table(self.table_name).update_item,
+            Key={"symbol": shard_key(shard_id), "timestamp": OWNER_SORT_KEY},
+            UpdateExpression="SET #owner = :owner",
+            ExpressionAttributeNames={"#owner": "owner"},
+            ExpressionAttributeValues={":owner": owner},
+            ReturnValues="ALL_OLD",
+        )
+        return response.get("Attributes", {}).get("owner") == owner
+
+    def hydrate(self, dynamodb, engine: IndicatorEngine, symbols: Iterable[str],
+                call: Optional[Callable[..., Any]] = None,
+                refresh: Iterable[str] = ()) -> List[str]:
+        """Load snapshots for the symbols ``engine`` does not hold yet.
+
+        Snapshots of the ``refresh`` symbols are read even if the engine
+        holds them, and replace the warm window when they have seen more
+        ticks. Returns the symbols that were loaded. Symbols without a
+        snapshot are left alone and start empty, as they always did.
+        ``call`` wraps each BatchGetItem round; ``Throttled`` propagates if
+        keys are still unprocessed when it gives up, since a missing snapshot
+        must not be mistaken for an empty one.
+        """
+        wanted = sorted({symbol for symbol in symbols if symbol not in engine.symbols}
+                        | set(refresh))
+        loaded = []
+        for start in range(0, len(wanted), READ_BATCH_SIZE):
+            chunk = wanted[start:start + READ_BATCH_SIZE]
+            for item in self._batch_get(dynamodb, chunk, call or _once):
+                symbol, saved = item["symbol"], decode_state(_binary(item["window"]))
+                warm = engine.symbols.get(symbol)
+                if warm is not None and warm.count >= saved[2]:
+                    continue
+                engine.state(symbol).load(*saved)
+                loaded.append(symbol)
+        return loaded
+
+    def items(self, engine: IndicatorEngine,
+              symbols: Iterable[str]) -> List[Dict[str, Any]]:
+        """Snapshot items for ``symbols``, for ``write``."""
+        updated_at = datetime.now(timezone.utc).isoformat()
+        return [
+            {
+                "symbol": symbol,
+                "timestamp": STATE_SORT_KEY,
+                "window": encode_state(engine.symbols[symbol]),
+                "updated_at": updated_at,
+            }
+            for symbol in sorted(set(symbols))
+            if symbol in engine.symbols
+        ]
+
+    def write(self, dynamodb, items: List[Dict[str, Any]],
+              call: Optional[Callable[..., Any]] = None) -> List[str]:
+        """BatchWriteItem up to 25 snapshot items.
+
+        ``call`` wraps each round, which raises ``Throttled`` while items are
+        left unprocessed. Returns the symbols whose snapshot could not be
+        written; errors from the request itself propagate.
+        """
+        pending = [{"PutRequest": {"Item": item}} for item in items]
+
+        def write():
+            nonlocal pending
+            response = dynamodb.batch_write_item(RequestItems={self.table_name: pending})
+            pending = response.get("UnprocessedItems", {}).get(self.table_name, [])
+            if pending:
+                raise Throttled(f"{len(pending)} unprocessed state items")
+
+        try:
+            (call or _once)(write)
+        except Throttled:
+            return [request["PutRequest"]["Item"]["symbol"] for request in pending]
+        return []
+
+    def _batch_get(self, dynamodb, symbols: List[str],
+                   call: Callable[..., Any]) -> List[Dict[str, Any]]:
+        request = {
+            self.table_name: {
+                "Keys": [{"symbol": symbol, "timestamp": STATE_SORT_KEY} for symbol in symbols],
+                "ProjectionExpression": "#symbol, #window",
+                "ExpressionAttributeNames": {"#symbol": "symbol", "#window": "window"},
+            }
+        }
+        found: List[Dict[str, Any]] = []
+
+        def read():
+            nonlocal request
+            response = dynamodb.batch_get_item(RequestItems=request)
+            found.extend(response.get("Responses", {}).get(self.table_name, []))
+            request = response.get("UnprocessedKeys") or {}
+            if request:
+                raise Throttled("unprocessed state keys")
+
+        call(read)
+        return found
+
+
+def _once(fn: Callable[..., Any], *args, **kwargs):
+    return fn(*args, **kwargs)
+
+
+def _binary(value) -> bytes:
+    # The DynamoDB resource hands binary attributes back wrapped in Binary
+    return bytes(getattr(value, "value", value))
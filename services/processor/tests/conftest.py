@@ -0,0 +1,12 @@
+import os
+import sys
+
+# Modules shared with the producer are packaged next to app.py at deploy time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "common"))
+# Local tools, which are not packaged
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "tools"))
+
+# Required by the processor handler
+os.environ.setdefault("DYNAMODB_TABLE", "test-table")
+os.environ.setdefault("S3_BUCKET", "test-bucket")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
@@ -1,13 +1,19 @@
 import base64
 import json
 import os
+from datetime import datetime
+from decimal import Decimal
 from unittest.mock import MagicMock, patch
 
 import boto3
 import pytest
+from botocore.exceptions import ClientError
 from moto import mock_aws
 
+import app
 from app import handler
+from archive import read_parquet
+from quote_codec import encode_quotes
 
 
 @pytest.fixture
@@ -46,58 +52,202 @@ def create_kinesis_event(records):
     return {
         "Records": [
             {
+                "eventID": f"shardId-000000000000:{index}",
                 "kinesis": {
+                    "sequenceNumber": str(index),
                     "data": base64.b64encode(json.dumps(record).encode("utf-8")).decode(
                         "utf-8"
                     )
                 }
             }
-            for record in records
+            for index, record in enumerate(records)
         ]
     }
 
 
-def test_handler_success(dynamodb_table, s3_bucket):
-    # Sample Kinesis event data
-    stock_data = {"symbol": "GOOG", "price": 2800.0, "timestamp": "2024-01-01T00:00:00Z"}
+def make_quotes(count, symbol="GOOG"):
+    return [
+        {
+            "symbol": symbol,
+            "price": 100.0 + index,
+            "volume": 10,
+            "timestamp": f"2024-01-01T00:{index // 60:02d}:{index % 60:02d}Z",
+        }
+        for index in range(count)
+    ]
+
+
+def micros(timestamp):
+    return int(datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp() * 1_000_000)
+
+
+@pytest.fixture
+def mock_aws_clients():
+    mock_dynamodb, mock_s3, mock_table = MagicMock(), MagicMock(), MagicMock()
+    with patch("app.get_dynamodb", return_value=mock_dynamodb), patch(
+        "app.get_s3", return_value=mock_s3
+    ), patch("app.get_table", return_value=mock_table), patch(
+        "app.get_secret", return_value={}
+    ), patch("app.time.sleep"), patch("app.PERSIST_INDICATOR_STATE", False), patch(
+        "app.BAR_INTERVALS", {}
+    ), patch("app.DEDUPE_RECORDS", False):
+        mock_dynamodb.batch_write_item.return_value = {"UnprocessedItems": {}}
+        app.indicator_engine.clear()
+        yield mock_dynamodb, mock_s3
+
+
+def test_handler_success(mock_aws_clients):
+    mock_dynamodb, mock_s3 = mock_aws_clients
+    stock_data = {
+        "symbol": "GOOG",
+        "price": 2800.0,
+        "volume": 100,
+        "timestamp": "2024-01-01T00:00:00Z",
+    }
     event = create_kinesis_event([stock_data])
 
-    with patch("boto3.resource") as mock_boto_resource, patch(
-        "boto3.client"
-    ) as mock_boto_client:
-        # Mock DynamoDB and S3
-        mock_dynamodb = MagicMock()
-        mock_s3 = MagicMock()
-        mock_boto_resource.side_effect = [mock_dynamodb, mock_s3]
+    result = handler(event, {})
 
-        mock_table = MagicMock()
-        mock_dynamodb.Table.return_value = mock_table
+    assert result == {"batchItemFailures": []}
 
-        # Set environment variables
-        os.environ["DYNAMODB_TABLE_NAME"] = dynamodb_table
-        os.environ["S3_BUCKET_NAME"] = s3_bucket
+    # Assert DynamoDB was called correctly
+    mock_dynamodb.batch_write_item.assert_called_once()
+    requests = mock_dynamodb.batch_write_item.call_args[1]["RequestItems"]["test-table"]
+    item_put = requests[0]["PutRequest"]["Item"]
+    assert item_put["symbol"] == "GOOG"
+    assert item_put["price"] == Decimal("2800.0")
+    assert item_put["moving_average"] == Decimal("2800.0")
+    assert item_put["vwap"] == Decimal("2800.0")
 
-        # Call the handler
-        handler(event, {})
+    # Assert S3 was called correctly
+    mock_s3.put_object.assert_called_once()
+    s3_args = mock_s3.put_object.call_args[1]
+    assert s3_args["Bucket"] == "test-bucket"
+    assert "year=" in s3_args["Key"]
+    assert "month=" in s3_args["Key"]
+    assert "day=" in s3_args["Key"]
+
+
+def test_dynamodb_writes_are_chunked(mock_aws_clients):
+    mock_dynamodb, _ = mock_aws_clients
+    event = create_kinesis_event(make_quotes(60))
+
+    result = handler(event, {})
 
-        # Assert DynamoDB was called correctly
-        mock_table.put_item.assert_called_once()
-        item_put = mock_table.put_item.call_args[1]["Item"]
-        assert item_put["symbol"] == "GOOG"
-        assert item_put["price"] == 2800.0
+    assert result == {"batchItemFailures": []}
+    chunk_sizes = [
+        len(call[1]["RequestItems"]["test-table"])
+        for call in mock_dynamodb.batch_write_item.call_args_list
+    ]
+    assert chunk_sizes == [25, 25, 10]
 
-        # Assert S3 was called correctly
-        mock_s3.put_object.assert_called_once()
-        s3_args = mock_s3.put_object.call_args[1]
-        assert s3_args["Bucket"] == s3_bucket
-        assert "year=" in s3_args["Key"]
-        assert "month=" in s3_args["Key"]
-        assert "day=" in s3_args["Key"]
+
+def test_unprocessed_items_are_retried(mock_aws_clients):
+    mock_dynamodb, _ = mock_aws_clients
+    quotes = make_quotes(3)
+
+    def batch_write_item(RequestItems):
+        requests = RequestItems["test-table"]
+        if mock_dynamodb.batch_write_item.call_count == 1:
+            return {"UnprocessedItems": {"test-table": requests[1:]}}
+        return {"UnprocessedItems": {}}
+
+    mock_dynamodb.batch_write_item.side_effect = batch_write_item
+
+    result = handler(create_kinesis_event(quotes), {})
+
+    assert result == {"batchItemFailures": []}
+    assert mock_dynamodb.batch_write_item.call_count == 2
+    retried = mock_dynamodb.batch_write_item.call_args[1]["RequestItems"]["test-table"]
+    assert len(retried) == 2
+
+
+def test_unprocessed_items_map_to_failed_event_ids(mock_aws_clients):
+    mock_dynamodb, mock_s3 = mock_aws_clients
+    quotes = make_quotes(3)
+
+    def batch_write_item(RequestItems):
+        requests = RequestItems["test-table"]
+        stuck = [r for r in requests if r["PutRequest"]["Item"]["timestamp"] == quotes[1]["timestamp"]]
+        return {"UnprocessedItems": {"test-table": stuck}}
+
+    mock_dynamodb.batch_write_item.side_effect = batch_write_item
+
+    result = handler(create_kinesis_event(quotes), {})
+
+    assert result == {
+        "batchItemFailures": [{"itemIdentifier": "shardId-000000000000:1"}]
+    }
+    assert mock_dynamodb.batch_write_item.call_count == app.AWS_MAX_RETRIES + 1
+    # The archive is written concurrently with DynamoDB, so it holds the
+    # whole batch; the failed record is archived again when it is retried.
+    mock_s3.put_object.assert_called_once()
+    archived = read_parquet(mock_s3.put_object.call_args[1]["Body"])
+    assert archived["price"] == [100.0, 101.0, 102.0]
+
+
+class LambdaContext:
+    aws_request_id = "request-1"
+
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+def test_records_fail_fast_when_the_deadline_is_already_close(mock_aws_clients):
+    mock_dynamodb, mock_s3 = mock_aws_clients
+    event = create_kinesis_event(make_quotes(3))
+
+    with patch("app.log") as mock_log:
+        result = handler(event, LambdaContext(app.DEADLINE_RESERVE_MS - 1))
+
+    assert [failure["itemIdentifier"] for failure in result["batchItemFailures"]] == [
+        record["eventID"] for record in event["Records"]
+    ]
+    mock_dynamodb.batch_write_item.assert_not_called()
+    mock_s3.put_object.assert_not_called()
+    completed = mock_log.call_args_list[-1].kwargs
+    assert completed["metrics"]["failures_by_type"] == {"DeadlineExceeded": 3}
+
+
+def test_no_write_starts_unless_it_can_run_to_its_timeouts(mock_aws_clients):
+    mock_dynamodb, _ = mock_aws_clients
+    attempt_ms = int(app.retrier.attempt_timeout * 1000)
+
+    result = handler(create_kinesis_event(make_quotes(2)),
+                     LambdaContext(app.DEADLINE_RESERVE_MS + attempt_ms - 1))
+
+    assert len(result["batchItemFailures"]) == 2
+    mock_dynamodb.batch_write_item.assert_not_called()
+
+
+def test_throttled_writes_give_up_at_the_deadline(mock_aws_clients):
+    mock_dynamodb, _ = mock_aws_clients
+    quotes = make_quotes(3)
+
+    def batch_write_item(RequestItems):
+        if mock_dynamodb.batch_write_item.call_count == 2:
+            # The invocation runs out of time while the table is throttling
+            app.retrier.deadline.expires_at = 0
+        raise ClientError({"Error": {"Code": "ProvisionedThroughputExceededException",
+                                     "Message": "slow down"}}, "BatchWriteItem")
+
+    mock_dynamodb.batch_write_item.side_effect = batch_write_item
+
+    result = handler(create_kinesis_event(quotes), LambdaContext(60_000))
+
+    assert len(result["batchItemFailures"]) == 3
+    assert mock_dynamodb.batch_write_item.call_count == 2 < app.AWS_MAX_RETRIES + 1
 
 
 def test_handler_bad_record():
     # A record that is not valid JSON
-    bad_record = {"kinesis": {"data": base64.b64encode(b"not-json").decode("utf-8")}}
+    bad_record = {
+        "eventID": "shardId-000000000000:0",
+        "kinesis": {"data": base64.b64encode(b"not-json").decode("utf-8")},
+    }
     event = {"Records": [bad_record]}
 
     # The handler should log an error and not raise an exception
@@ -106,3 +256,589 @@ def test_handler_bad_record():
     except Exception as e:
         pytest.fail(f"Handler raised an unexpected exception: {e}")
 
+
+
+def test_s3_archive_writes_one_parquet_file_per_partition(mock_aws_clients):
+    _, mock_s3 = mock_aws_clients
+    quotes = make_quotes(3)
+    quotes[2]["timestamp"] = "2024-01-02T09:30:00Z"
+
+    result = handler(create_kinesis_event(quotes), {})
+
+    assert result == {"batchItemFailures": []}
+    assert mock_s3.put_object.call_count == 2
+    keys = sorted(call[1]["Key"] for call in mock_s3.put_object.call_args_list)
+    assert keys[0].startswith("year=2024/month=01/day=01/")
+    assert keys[1].startswith("year=2024/month=01/day=02/")
+    assert all(key.endswith(".parquet") for key in keys)
+
+    first_day = next(
+        call[1] for call in mock_s3.put_object.call_args_list
+        if call[1]["Key"] == keys[0]
+    )
+    columns = read_parquet(first_day["Body"])
+    assert columns["symbol"] == ["GOOG", "GOOG"]
+    assert columns["price"] == [100.0, 101.0]
+    assert columns["event_time"][0] == datetime(2024, 1, 1, 0, 0, 0)
+
+
+def test_s3_partition_failure_maps_to_its_records(mock_aws_clients):
+    _, mock_s3 = mock_aws_clients
+    quotes = make_quotes(3)
+    quotes[2]["timestamp"] = "2024-01-02T09:30:00Z"
+
+    def put_object(**kwargs):
+        if "day=02" in kwargs["Key"]:
+            raise ClientError({"Error": {"Code": "InternalError"}}, "PutObject")
+
+    mock_s3.put_object.side_effect = put_object
+
+    result = handler(create_kinesis_event(quotes), {})
+
+    assert result == {
+        "batchItemFailures": [{"itemIdentifier": "shardId-000000000000:2"}]
+    }
+
+
+def test_json_archive_format_writes_one_object_per_event(mock_aws_clients):
+    _, mock_s3 = mock_aws_clients
+
+    with patch("app.S3_ARCHIVE_FORMAT", "json"):
+        result = handler(create_kinesis_event(make_quotes(3)), {})
+
+    assert result == {"batchItemFailures": []}
+    assert mock_s3.put_object.call_count == 3
+    assert all(
+        call[1]["Key"].endswith(".json") for call in mock_s3.put_object.call_args_list
+    )
+
+
+def test_indicators_carry_across_records(mock_aws_clients):
+    mock_dynamodb, _ = mock_aws_clients
+
+    handler(create_kinesis_event(make_quotes(2)), {})
+
+    requests = mock_dynamodb.batch_write_item.call_args[1]["RequestItems"]["test-table"]
+    second = requests[1]["PutRequest"]["Item"]
+    assert second["moving_average"] == Decimal("100.5")
+    assert second["stddev"] == Decimal(str(round(0.5 ** 0.5, 4)))
+
+
+@pytest.mark.parametrize("mode", ["scalar", "vectorized"])
+def test_ticks_of_failed_writes_are_not_counted_twice_on_retry(mock_aws_clients, mode):
+    mock_dynamodb, _ = mock_aws_clients
+    quotes = make_quotes(2)
+    event = create_kinesis_event(quotes)
+
+    def batch_write_item(RequestItems):
+        requests = RequestItems["test-table"]
+        stuck = [r for r in requests if r["PutRequest"]["Item"]["timestamp"] == quotes[1]["timestamp"]]
+        return {"UnprocessedItems": {"test-table": stuck}}
+
+    mock_dynamodb.batch_write_item.side_effect = batch_write_item
+    with patch("app.ANALYTICS_MODE", mode):
+        assert handler(event, {}) == {
+            "batchItemFailures": [{"itemIdentifier": "shardId-000000000000:1"}]
+        }
+        mock_dynamodb.batch_write_item.side_effect = None
+        # Lambda resends the failed record
+        assert handler({"Records": event["Records"][1:]}, {}) == {"batchItemFailures": []}
+
+    prices, _ = app.indicator_engine.symbols["GOOG"].window()
+    assert prices == [100.0, 101.0]
+    [request] = mock_dynamodb.batch_write_item.call_args[1]["RequestItems"]["test-table"]
+    assert request["PutRequest"]["Item"]["moving_average"] == Decimal("100.5")
+
+
+def test_vectorized_analytics_follow_sequence_order(mock_aws_clients):
+    mock_dynamodb, _ = mock_aws_clients
+    event = create_kinesis_event(make_quotes(3))
+    # Delivered out of order: the 102.0 tick has the lowest sequence number
+    event["Records"][2]["kinesis"]["sequenceNumber"] = "-1"
+
+    with patch("app.ANALYTICS_MODE", "vectorized"):
+        result = handler(event, {})
+
+    assert result == {"batchItemFailures": []}
+    requests = mock_dynamodb.batch_write_item.call_args[1]["RequestItems"]["test-table"]
+    averages = {
+        request["PutRequest"]["Item"]["price"]: request["PutRequest"]["Item"]["moving_average"]
+        for request in requests
+    }
+    assert averages == {
+        Decimal("102.0"): Decimal("102.0"),
+        Decimal("100.0"): Decimal("101.0"),
+        Decimal("101.0"): Decimal("101.0"),
+    }
+
+
+def test_latest_mode_upserts_newest_tick_per_symbol(mock_aws_clients):
+    mock_dynamodb, _ = mock_aws_clients
+    quotes = make_quotes(3) + make_quotes(2, symbol="MSFT")
+
+    with patch("app.DYNAMODB_WRITE_MODE", "latest"):
+        result = handler(create_kinesis_event(quotes), {})
+
+    assert result == {"batchItemFailures": []}
+    mock_dynamodb.batch_write_item.assert_not_called()
+    updates = {
+        call[1]["Key"]["symbol"]: call[1] for call in app.get_table().update_item.call_args_list
+    }
+    assert set(updates) == {"GOOG", "MSFT"}
+    goog = updates["GOOG"]
+    assert goog["Key"]["timestamp"] == "LATEST"
+    assert goog["ExpressionAttributeValues"][":quote_timestamp"] == quotes[2]["timestamp"]
+    assert goog["ExpressionAttributeValues"][":quote_time_us"] == micros(quotes[2]["timestamp"])
+    assert goog["ExpressionAttributeValues"][":price"] == Decimal("102.0")
+
+
+def test_latest_quote_failure_fails_every_record_of_the_symbol(mock_aws_clients):
+    quotes = make_quotes(2) + make_quotes(1, symbol="MSFT")
+
+    def update_item(**kwargs):
+        if kwargs["Key"]["symbol"] == "GOOG":
+            raise ClientError({"Error": {"Code": "InternalServerError"}}, "UpdateItem")
+
+    app.get_table().update_item.side_effect = update_item
+
+    with patch("app.DYNAMODB_WRITE_MODE", "latest"):
+        result = handler(create_kinesis_event(quotes), {})
+
+    assert result == {"batchItemFailures": [
+        {"itemIdentifier": "shardId-000000000000:0"},
+        {"itemIdentifier": "shardId-000000000000:1"},
+    ]}
+
+
+@pytest.mark.parametrize("first, second, newest", [
+    ("2024-01-01T00:00:05Z", "2024-01-01T00:00:01Z", "2024-01-01T00:00:05Z"),
+    # Compared as strings, "...01.500Z" sorts before "...01Z"
+    ("2024-01-01T00:00:01Z", "2024-01-01T00:00:01.500Z", "2024-01-01T00:00:01.500Z"),
+    ("2024-01-01T00:00:02+01:00", "2024-01-01T00:00:01Z", "2024-01-01T00:00:01Z"),
+])
+def test_latest_quote_never_overwrites_newer_data(aws_credentials, first, second, newest):
+    with mock_aws():
+        dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+        table = dynamodb.create_table(
+            TableName="test-table",
+            KeySchema=[
+                {"AttributeName": "symbol", "KeyType": "HASH"},
+                {"AttributeName": "timestamp", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "symbol", "AttributeType": "S"},
+                {"AttributeName": "timestamp", "AttributeType": "S"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+
+        with patch("app.get_table", return_value=table):
+            for timestamp in (first, second):
+                app.write_latest_quote({"symbol": "AAPL", "timestamp": timestamp,
+                                        "price": 150.0, "volume": 5}, micros(timestamp))
+
+        item = table.get_item(Key={"symbol": "AAPL", "timestamp": "LATEST"})["Item"]
+        assert item["quote_timestamp"] == newest
+        assert item["quote_time_us"] == micros(newest)
+
+
+def create_binary_record(index, quotes):
+    return {
+        "eventID": f"shardId-000000000000:{index}",
+        "kinesis": {
+            "sequenceNumber": str(index),
+            "data": base64.b64encode(encode_quotes(quotes)).decode("utf-8"),
+        },
+    }
+
+
+def test_binary_aggregates_and_legacy_json_are_both_accepted(mock_aws_clients):
+    mock_dynamodb, _ = mock_aws_clients
+    event = create_kinesis_event(make_quotes(1, symbol="MSFT"))
+    event["Records"].append(create_binary_record(1, make_quotes(3)))
+
+    result = handler(event, {})
+
+    assert result == {"batchItemFailures": []}
+    requests = mock_dynamodb.batch_write_item.call_args[1]["RequestItems"]["test-table"]
+    assert sorted(r["PutRequest"]["Item"]["symbol"] for r in requests) == [
+        "GOOG", "GOOG", "GOOG", "MSFT"
+    ]
+
+
+def test_corrupt_binary_record_fails_only_itself(mock_aws_clients):
+    event = create_kinesis_event(make_quotes(1))
+    corrupt = encode_quotes(make_quotes(2, symbol="MSFT"))[:-4]
+    event["Records"].append({
+        "eventID": "shardId-000000000000:1",
+        "kinesis": {"sequenceNumber": "1", "data": base64.b64encode(corrupt).decode("utf-8")},
+    })
+
+    result = handler(event, {})
+
+    assert result == {"batchItemFailures": [{"itemIdentifier": "shardId-000000000000:1"}]}
+
+
+@pytest.fixture
+def dead_letter_queue():
+    sqs = MagicMock()
+    sqs.send_message_batch.return_value = {"Successful": [], "Failed": []}
+    with patch("app.DLQ_URL", "https://sqs.us-east-1.amazonaws.com/123456789012/processor-dlq"), \
+            patch("app.get_sqs", return_value=sqs):
+        yield sqs
+
+
+def test_invalid_records_are_dead_lettered_in_one_batch(mock_aws_clients, dead_letter_queue):
+    mock_dynamodb, _ = mock_aws_clients
+    quotes = make_quotes(3)
+    mixed = make_quotes(2, symbol="MSFT")
+    mixed[1]["price"] = 0.0
+    event = create_kinesis_event(quotes)
+    event["Records"][1]["kinesis"]["data"] = base64.b64encode(b"not-json").decode("utf-8")
+    event["Records"].append({
+        "eventID": "shardId-000000000000:3",
+        "kinesis": {"sequenceNumber": "3", "data": base64.b64encode(encode_quotes(mixed)).decode("utf-8")},
+    })
+
+    with patch("app.log") as mock_log:
+        result = handler(event, {})
+
+    assert result == {"batchItemFailures": []}
+    dead_letter_queue.send_message_batch.assert_called_once()
+    letters = [json.loads(entry["MessageBody"])
+               for entry in dead_letter_queue.send_message_batch.call_args[1]["Entries"]]
+    assert [(letter["record_id"], letter["reason"]) for letter in letters] == [
+        ("shardId-000000000000:1", "undecodable record"),
+        ("shardId-000000000000:3", "price must be > 0"),
+    ]
+    assert letters[0]["data"] == event["Records"][1]["kinesis"]["data"]
+    assert letters[1]["quotes"][0]["quote"]["price"] == 0.0
+    # The good quote of the mixed record is still written
+    written = [request["PutRequest"]["Item"]["symbol"]
+               for call in mock_dynamodb.batch_write_item.call_args_list
+               for request in call[1]["RequestItems"]["test-table"]]
+    assert sorted(written) == ["GOOG", "GOOG", "MSFT"]
+    rejected = [call for call in mock_log.call_args_list if call.args[0] == "Invalid quotes rejected"]
+    assert len(rejected) == 1
+    assert rejected[0].kwargs["reasons"] == {"undecodable record": 1, "price must be > 0": 1}
+
+
+def test_volumes_too_large_to_store_are_dead_lettered(mock_aws_clients, dead_letter_queue):
+    quotes = make_quotes(2)
+    quotes[0]["volume"] = 1e20
+
+    result = handler(create_kinesis_event(quotes), {})
+
+    # Rejected by the schema, not an OverflowError that fails the whole batch
+    assert result == {"batchItemFailures": []}
+    [entry] = dead_letter_queue.send_message_batch.call_args[1]["Entries"]
+    letter = json.loads(entry["MessageBody"])
+    assert letter["record_id"] == "shardId-000000000000:0"
+    assert letter["reason"] == "volume must be <= 9223372036854775807"
+
+
+def test_records_fail_when_they_cannot_be_dead_lettered(mock_aws_clients, dead_letter_queue):
+    dead_letter_queue.send_message_batch.side_effect = ClientError(
+        {"Error": {"Code": "AccessDenied", "Message": "no"}}, "SendMessageBatch")
+    quotes = make_quotes(2)
+    quotes[0]["volume"] = -5
+
+    result = handler(create_kinesis_event(quotes), {})
+
+    assert result == {"batchItemFailures": [{"itemIdentifier": "shardId-000000000000:0"}]}
+
+
+def test_invocation_emits_emf_metrics_with_failures_by_type(mock_aws_clients, capsys):
+    event = create_kinesis_event(make_quotes(2))
+    event["Records"].append({
+        "eventID": "shardId-000000000000:2",
+        "kinesis": {"sequenceNumber": "2", "data": base64.b64encode(b"{}").decode("utf-8")},
+    })
+
+    handler(event, {})
+
+    documents = [
+        json.loads(line) for line in capsys.readouterr().out.splitlines()
+        if line.startswith('{"_aws"')
+    ]
+    main, by_type = documents
+    assert main["RecordsReceived"] == 3
+    assert main["QuotesProcessed"] == 2
+    assert main["RecordsFailed"] == 1
+    assert {"DecodeTime", "AnalyticsTime", "WriteTime", "S3WriteLatency"} <= set(main)
+    assert main["StateSymbols"] == 1
+    assert main["StateEvictions"] == 0
+    assert main["StateBytes"] > 0
+    assert by_type["ErrorType"] == "InvalidRecord"
+    assert by_type["RecordsFailedByType"] == 1
+
+
+@patch("app.LOG_RECORD_SAMPLE_RATE", 0.0)
+def test_success_logs_are_sampled_but_failures_are_not(mock_aws_clients):
+    mock_dynamodb, _ = mock_aws_clients
+    mock_dynamodb.batch_write_item.side_effect = ClientError(
+        {"Error": {"Code": "InternalServerError", "Message": "boom"}}, "BatchWriteItem"
+    )
+    event = create_kinesis_event(make_quotes(3))
+
+    with patch("app.log") as mock_log:
+        result = handler(event, {})
+
+    messages = [call.args[0] for call in mock_log.call_args_list]
+    assert len(result["batchItemFailures"]) == 3
+    assert "Record processed successfully" not in messages
+    assert "DynamoDB batch write failed" in messages
+    completed = mock_log.call_args_list[-1].kwargs
+    assert completed["metrics"]["failures_by_type"] == {"WriteFailed": 3}
+
+
+def test_clients_are_created_on_first_use_and_reused(aws_credentials):
+    with patch.dict(app._clients, clear=True):
+        assert app._clients == {}
+
+        s3 = app.get_s3()
+
+        assert app.get_s3() is s3
+        assert set(app._clients) == {"s3"}
+
+
+def test_handler_reports_missing_configuration():
+    with patch("app.S3_BUCKET", ""), pytest.raises(RuntimeError, match="S3_BUCKET"):
+        handler(create_kinesis_event(make_quotes(1)), {})
+
+
+def create_tick_table(dynamodb):
+    return dynamodb.create_table(
+        TableName="test-table",
+        KeySchema=[
+            {"AttributeName": "symbol", "KeyType": "HASH"},
+            {"AttributeName": "timestamp", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "symbol", "AttributeType": "S"},
+            {"AttributeName": "timestamp", "AttributeType": "S"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+
+
+def test_indicator_windows_survive_a_cold_start(mock_aws_clients, aws_credentials):
+    quotes = make_quotes(8)
+    with mock_aws():
+        dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+        create_tick_table(dynamodb)
+        with patch("app.get_dynamodb", return_value=dynamodb), patch(
+            "app.PERSIST_INDICATOR_STATE", True
+        ):
+            handler(create_kinesis_event(quotes[:6]), {})
+            app.indicator_engine.clear()  # a new container takes over the shard
+
+            handler(create_kinesis_event(quotes[6:]), {})
+
+        resumed = dynamodb.Table("test-table").get_item(
+            Key={"symbol": "GOOG", "timestamp": quotes[-1]["timestamp"]}
+        )["Item"]
+
+    # SMA over the last 5 ticks, not just the 2 seen since the cold start
+    assert resumed["moving_average"] == Decimal("105.0")
+
+
+def test_warm_windows_are_replaced_after_the_shard_was_processed_elsewhere(
+        mock_aws_clients, aws_credentials):
+    quotes = make_quotes(8)
+    with mock_aws():
+        dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+        create_tick_table(dynamodb)
+        with patch("app.get_dynamodb", return_value=dynamodb), patch(
+            "app.PERSIST_INDICATOR_STATE", True
+        ):
+            handler(create_kinesis_event(quotes[:3]), {})
+            # Another container takes the shard for a while, then hands it back
+            with patch("app.indicator_engine", app.IndicatorEngine(app.indicator_engine.config)), \
+                    patch("app.CONTAINER_ID", "other-container"):
+                handler(create_kinesis_event(quotes[3:6]), {})
+
+            handler(create_kinesis_event(quotes[6:]), {})
+
+        resumed = dynamodb.Table("test-table").get_item(
+            Key={"symbol": "GOOG", "timestamp": quotes[-1]["timestamp"]}
+        )["Item"]
+
+    # SMA over ticks 3-7, not this container's stale 0-2 followed by 6-7
+    assert resumed["moving_average"] == Decimal("105.0")
+    assert app.indicator_engine.symbols["GOOG"].count == 8
+
+
+def test_stale_windows_are_dropped_when_their_snapshots_cannot_be_read(mock_aws_clients):
+    mock_dynamodb, _ = mock_aws_clients
+    app.indicator_engine.update("GOOG", 1.0, 1)
+    mock_dynamodb.Table.return_value.update_item.return_value = {
+        "Attributes": {"owner": "other-container"}}
+    mock_dynamodb.batch_get_item.side_effect = ClientError(
+        {"Error": {"Code": "InternalServerError", "Message": "no"}}, "BatchGetItem")
+
+    with patch("app.PERSIST_INDICATOR_STATE", True):
+        result = handler(create_kinesis_event(make_quotes(1)), {})
+
+    assert result == {"batchItemFailures": [{"itemIdentifier": "shardId-000000000000:0"}]}
+    # So the retry hydrates it even though this container now holds the claim
+    assert "GOOG" not in app.indicator_engine.symbols
+
+
+def test_records_fail_when_indicator_state_cannot_be_loaded(mock_aws_clients):
+    mock_dynamodb, _ = mock_aws_clients
+    mock_dynamodb.batch_get_item.side_effect = ClientError(
+        {"Error": {"Code": "ProvisionedThroughputExceededException", "Message": "slow down"}},
+        "BatchGetItem",
+    )
+    event = create_kinesis_event(make_quotes(2))
+
+    with patch("app.PERSIST_INDICATOR_STATE", True):
+        result = handler(event, {})
+
+    assert result == {"batchItemFailures": [
+        {"itemIdentifier": "shardId-000000000000:0"},
+        {"itemIdentifier": "shardId-000000000000:1"},
+    ]}
+    mock_dynamodb.batch_write_item.assert_not_called()
+    assert "GOOG" not in app.indicator_engine.symbols
+
+
+def test_symbols_over_the_limit_are_evicted_after_the_batch(mock_aws_clients):
+    event = create_kinesis_event(
+        make_quotes(1, symbol="AAPL") + make_quotes(1, symbol="MSFT") + make_quotes(1, symbol="GOOG")
+    )
+
+    with patch.object(app.indicator_engine, "max_symbols", 2):
+        result = handler(event, {})
+
+    assert result == {"batchItemFailures": []}
+    assert list(app.indicator_engine.symbols) == ["MSFT", "GOOG"]
+
+
+@pytest.fixture
+def bars_enabled():
+    with patch("app.BAR_INTERVALS", {"1m": 60_000}), patch("app.BARS_TABLE", "bars-table"), patch(
+        "app.bar_aggregator", app.BarAggregator({"1m": 60_000}, 10_000)
+    ), patch.dict("app.pending_bars", {"dynamodb": [], "s3": []}):
+        yield
+
+
+def test_closed_bars_are_written_to_the_rollup_table_and_s3(mock_aws_clients, bars_enabled):
+    mock_dynamodb, mock_s3 = mock_aws_clients
+    # 00:00:00 to 00:01:19; the first minute closes at 00:01:10
+    result = handler(create_kinesis_event(make_quotes(80)), {})
+
+    assert result == {"batchItemFailures": []}
+    bar_writes = [call for call in mock_dynamodb.batch_write_item.call_args_list
+                  if "bars-table" in call[1]["RequestItems"]]
+    assert len(bar_writes) == 1
+    [request] = bar_writes[0][1]["RequestItems"]["bars-table"]
+    bar = request["PutRequest"]["Item"]
+    assert bar["timestamp"] == "1m#2024-01-01T00:00:00.000Z"
+    assert (bar["open"], bar["high"], bar["low"], bar["close"]) == (
+        Decimal("100.0"), Decimal("159.0"), Decimal("100.0"), Decimal("159.0"))
+    assert (bar["volume"], bar["trades"]) == (600, 60)
+
+    [bar_object] = [call[1] for call in mock_s3.put_object.call_args_list
+                    if call[1]["Key"].startswith("bars/")]
+    assert bar_object["Key"].startswith("bars/bar_interval=1m/year=2024/month=01/day=01/")
+    columns = read_parquet(bar_object["Body"])
+    assert columns["symbol"] == ["GOOG"]
+    assert columns["bar_start"] == [datetime(2024, 1, 1)]
+    assert columns["vwap"] == [129.5]
+
+
+def test_bars_a_new_container_joined_partway_are_not_written(mock_aws_clients, bars_enabled):
+    mock_dynamodb, _ = mock_aws_clients
+    # The previous container saw 00:00:00 to 00:00:29
+    result = handler(create_kinesis_event(make_quotes(80)[30:]), {})
+
+    assert result == {"batchItemFailures": []}
+    assert all("bars-table" not in call[1]["RequestItems"]
+               for call in mock_dynamodb.batch_write_item.call_args_list)
+
+
+def test_bars_of_a_shard_this_container_lost_are_not_written(mock_aws_clients, bars_enabled):
+    mock_dynamodb, _ = mock_aws_clients
+    handler(create_kinesis_event(make_quotes(30)), {})
+    # GOOG's shard moved away mid-bar; another shard's ticks move event time on
+    handler(create_kinesis_event(make_quotes(400, symbol="MSFT")), {})
+
+    written = [request["PutRequest"]["Item"]["symbol"]
+               for call in mock_dynamodb.batch_write_item.call_args_list
+               for request in call[1]["RequestItems"].get("bars-table", [])]
+    assert "GOOG" not in written and "MSFT" in written
+    assert all(symbol != "GOOG" for symbol, _, _ in app.bar_aggregator.bars)
+
+
+def test_failed_bar_writes_are_retried_with_the_next_batch(mock_aws_clients, bars_enabled):
+    mock_dynamodb, _ = mock_aws_clients
+    quotes = make_quotes(80)
+
+    def batch_write_item(RequestItems):
+        if "bars-table" in RequestItems:
+            raise ClientError({"Error": {"Code": "InternalServerError", "Message": "boom"}},
+                              "BatchWriteItem")
+        return {"UnprocessedItems": {}}
+
+    mock_dynamodb.batch_write_item.side_effect = batch_write_item
+    assert handler(create_kinesis_event(quotes[:75]), {}) == {"batchItemFailures": []}
+    assert len(app.pending_bars["dynamodb"]) == 1
+
+    mock_dynamodb.batch_write_item.side_effect = None
+    handler(create_kinesis_event(quotes[75:]), {})
+
+    assert app.pending_bars["dynamodb"] == []
+    written = [request["PutRequest"]["Item"]["timestamp"]
+               for call in mock_dynamodb.batch_write_item.call_args_list
+               for request in call[1]["RequestItems"].get("bars-table", [])]
+    # Every attempt of the first batch, then the write with the next batch
+    assert written == ["1m#2024-01-01T00:00:00.000Z"] * (app.AWS_MAX_RETRIES + 2)
+
+
+def test_bars_are_kept_for_the_next_batch_when_time_runs_out(mock_aws_clients, bars_enabled):
+    mock_dynamodb, _ = mock_aws_clients
+    close = app.bar_aggregator.close
+
+    def close_out_of_time():
+        # The tick writes are done, but the invocation is out of time
+        app.retrier.deadline.expires_at = 0
+        return close()
+
+    with patch.object(app.bar_aggregator, "close", close_out_of_time):
+        result = handler(create_kinesis_event(make_quotes(80)), LambdaContext(60_000))
+
+    assert result == {"batchItemFailures": []}
+    assert [bar.symbol for bar in app.pending_bars["dynamodb"]] == ["GOOG"]
+    assert all("bars-table" not in call[1]["RequestItems"]
+               for call in mock_dynamodb.batch_write_item.call_args_list)
+
+
+def test_retried_records_that_already_succeeded_are_skipped(mock_aws_clients):
+    mock_dynamodb, _ = mock_aws_clients
+    mock_dynamodb.Table.return_value.get_item.return_value = {}
+    quotes = make_quotes(4)
+    first = create_kinesis_event(quotes)
+    broken = dict(quotes[1])
+    del broken["price"]
+    first["Records"][1]["kinesis"]["data"] = base64.b64encode(json.dumps(broken).encode()).decode()
+
+    with patch("app.DEDUPE_RECORDS", True), patch.object(
+        app, "checkpoint_store", app.CheckpointStore("test-table")
+    ):
+        assert handler(first, {}) == {"batchItemFailures": [{"itemIdentifier": "shardId-000000000000:1"}]}
+        # Lambda resends from the failed record on
+        result = handler({"Records": create_kinesis_event(quotes)["Records"][1:]}, {})
+        replayed = handler(create_kinesis_event(quotes), {})
+
+    assert result == replayed == {"batchItemFailures": []}
+    assert app.indicator_engine.symbols["GOOG"].count == 4
+    written = [request["PutRequest"]["Item"]["timestamp"]
+               for call in mock_dynamodb.batch_write_item.call_args_list
+               for request in call[1]["RequestItems"]["test-table"]]
+    assert sorted(written) == [quote["timestamp"] for quote in quotes]
+    saved = mock_dynamodb.Table.return_value.put_item.call_args[1]["Item"]
+    assert saved["symbol"] == "#shard#shardId-000000000000"
+    assert int(saved["high_water"]) == 3
+    assert "filter" not in saved
@@ -0,0 +1,66 @@
+import io
+from datetime import datetime, timedelta, timezone
+
+import pyarrow.parquet as pq
+
+from archive import ParquetArchiveWriter, archive_schema, read_parquet
+
+
+def test_parquet_matches_athena_schema():
+    writer = ParquetArchiveWriter()
+    writer.add("id-1", "AAPL", 150.5, 1000,
+               datetime(2024, 3, 4, 15, 0, tzinfo=timezone.utc))
+    s3 = _RecordingS3()
+
+    assert writer.flush(s3, "bucket") == []
+
+    (key, body), = s3.objects.items()
+    parquet = pq.ParquetFile(io.BytesIO(body))
+    assert parquet.schema_arrow.equals(archive_schema())
+    assert parquet.metadata.row_group(0).column(0).compression == "SNAPPY"
+    assert key.startswith("year=2024/month=03/day=04/")
+
+
+def test_event_time_is_normalised_to_utc():
+    writer = ParquetArchiveWriter()
+    eastern = timezone(timedelta(hours=-5))
+    writer.add("id-1", "AAPL", 150.5, 1000, datetime(2024, 3, 4, 22, 0, tzinfo=eastern))
+    s3 = _RecordingS3()
+
+    writer.flush(s3, "bucket")
+
+    (key, body), = s3.objects.items()
+    assert key.startswith("year=2024/month=03/day=05/")
+    assert read_parquet(body)["event_time"] == [datetime(2024, 3, 5, 3, 0)]
+
+
+def test_epoch_milliseconds_archive_like_datetimes():
+    moment = datetime(2024, 2, 29, 23, 59, 59, 123000, tzinfo=timezone.utc)
+    by_datetime, by_ms = ParquetArchiveWriter(), ParquetArchiveWriter()
+    by_datetime.add("id-1", "AAPL", 150.5, 1000, moment)
+    by_ms.add_ms("id-1", "AAPL", 150.5, 1000, 1709251199123)
+    first, second = _RecordingS3(), _RecordingS3()
+
+    by_datetime.flush(first, "bucket")
+    by_ms.flush(second, "bucket")
+
+    assert first.objects == second.objects
+    (key, body), = second.objects.items()
+    assert key.startswith("year=2024/month=02/day=29/")
+    assert read_parquet(body)["event_time"] == [datetime(2024, 2, 29, 23, 59, 59, 123000)]
+
+
+def test_object_key_is_stable_for_batches_retried_whole():
+    partition = (2024, 1, 1)
+    first = ParquetArchiveWriter.object_key(partition, ["a", "b"])
+
+    assert first == ParquetArchiveWriter.object_key(partition, ["a", "b"])
+    assert first != ParquetArchiveWriter.object_key(partition, ["a", "c"])
+
+
+class _RecordingS3:
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, ContentType):
+        self.objects[Key] = Body
@@ -0,0 +1,121 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from archive import read_parquet
+from bars import BarAggregator, bar_partitions, encode_bars, parse_intervals
+
+START = int(datetime(2024, 1, 2, 14, 30, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def test_parse_intervals():
+    assert parse_intervals("1m, 5m,30s,1h") == {"1m": 60_000, "5m": 300_000, "30s": 30_000, "1h": 3_600_000}
+    assert parse_intervals("") == {}
+    with pytest.raises(ValueError):
+        parse_intervals("1d")
+
+
+def test_ticks_build_ohlcv_and_vwap_bars_per_interval():
+    aggregator = BarAggregator({"1m": 60_000, "5m": 300_000})
+    for offset, price, volume in ((0, 10.0, 1), (20_000, 12.0, 3), (40_000, 9.0, 1), (61_000, 11.0, 2)):
+        aggregator.add("AAPL", START + offset, price, volume)
+
+    [bar] = aggregator.close()
+
+    assert (bar.interval, bar.start_ms) == ("1m", START)
+    assert (bar.open, bar.high, bar.low, bar.close) == (10.0, 12.0, 9.0, 9.0)
+    assert (bar.volume, bar.trades) == (5, 3)
+    assert bar.vwap == pytest.approx((10 + 36 + 9) / 5)
+    assert len(aggregator) == 2
+
+
+def test_late_ticks_land_in_their_bar_within_the_allowed_lateness():
+    aggregator = BarAggregator({"1m": 60_000}, allowed_lateness_ms=5_000)
+    aggregator.add("AAPL", START + 30_000, 10.0, 1)
+    aggregator.add("AAPL", START + 63_000, 11.0, 1)
+    assert aggregator.close() == []
+
+    # Out of order but in time: becomes the bar's open
+    assert aggregator.add("AAPL", START + 1_000, 8.0, 1)
+    aggregator.add("AAPL", START + 66_000, 12.0, 1)
+    [bar] = aggregator.close()
+    assert (bar.open, bar.close, bar.trades) == (8.0, 10.0, 2)
+
+    # Its bar is written already
+    assert not aggregator.add("AAPL", START + 2_000, 7.0, 1)
+    assert aggregator.close() == []
+
+
+def test_bars_started_before_the_first_tick_of_their_symbol_are_partial():
+    aggregator = BarAggregator({"1m": 60_000})
+    # A new container takes over mid-bar for AAPL; MSFT starts on a boundary
+    aggregator.add("AAPL", START + 30_000, 10.0, 1)
+    aggregator.add("MSFT", START, 20.0, 1)
+    aggregator.add("AAPL", START + 5_000, 9.0, 1)
+    aggregator.add("AAPL", START + 61_000, 11.0, 1)
+    aggregator.add("MSFT", START + 62_000, 21.0, 1)
+    aggregator.add("AAPL", START + 121_000, 12.0, 1)
+
+    closed = aggregator.close()
+
+    assert [(bar.symbol, bar.start_ms - START, bar.partial) for bar in closed] == [
+        ("AAPL", 0, True), ("MSFT", 0, False), ("AAPL", 60_000, False)]
+
+
+def test_bars_whose_symbol_stopped_ticking_close_partial_after_the_idle_timeout():
+    aggregator = BarAggregator({"1m": 60_000}, idle_timeout_ms=120_000)
+    # MSFT's shard moves away after 00:30; AAPL keeps the watermark going
+    aggregator.add("MSFT", START + 30_000, 20.0, 1)
+    for offset in range(0, 240_000, 30_000):
+        aggregator.add("AAPL", START + offset, 10.0, 1)
+        if offset == 120_000:
+            assert [bar.symbol for bar in aggregator.close()] == ["AAPL", "AAPL"]
+
+    [msft] = [bar for bar in aggregator.close() if bar.symbol == "MSFT"]
+
+    assert (msft.start_ms, msft.partial) == (START, True)
+
+
+def test_a_quiet_symbol_still_open_takes_late_ticks_and_closes_complete():
+    aggregator = BarAggregator({"1m": 60_000}, allowed_lateness_ms=5_000)
+    aggregator.add("MSFT", START, 20.0, 1)
+    aggregator.add("AAPL", START + 70_000, 10.0, 1)
+    assert aggregator.close() == []
+
+    assert aggregator.add("MSFT", START + 50_000, 21.0, 1)
+    aggregator.add("MSFT", START + 80_000, 22.0, 1)
+    [bar] = aggregator.close()
+
+    assert (bar.symbol, bar.trades, bar.close, bar.partial) == ("MSFT", 2, 21.0, False)
+
+
+def test_forgotten_symbols_close_their_open_bars_partial():
+    aggregator = BarAggregator({"1m": 60_000}, idle_timeout_ms=60_000)
+    aggregator.add("MSFT", START, 20.0, 1)
+    aggregator.add("MSFT", START + 61_000, 20.0, 1)
+    assert [bar.partial for bar in aggregator.close()] == [False]
+    aggregator.forget(["MSFT"])
+    aggregator.add("AAPL", START + 180_000, 10.0, 1)
+
+    assert [(bar.start_ms - START, bar.partial) for bar in aggregator.close()] == [(60_000, True)]
+    assert "MSFT" not in aggregator.first_seen_ms and "MSFT" not in aggregator.last_seen_ms
+
+
+def test_bars_are_grouped_into_daily_parquet_partitions():
+    aggregator = BarAggregator({"1m": 60_000})
+    aggregator.add("AAPL", START, 10.0, 2)
+    aggregator.add("MSFT", START, 20.0, 0)
+    aggregator.add("AAPL", START + 60_000, 11.0, 1)
+    aggregator.add("MSFT", START + 60_000, 21.0, 1)
+    bars = aggregator.close()
+
+    [(key, members)] = bar_partitions("bars/", bars)
+
+    assert key.startswith("bars/bar_interval=1m/year=2024/month=01/day=02/bars-")
+    assert bar_partitions("bars/", bars)[0][0] == key
+    columns = read_parquet(encode_bars(members))
+    assert columns["symbol"] == ["AAPL", "MSFT"]
+    assert columns["bar_start"] == [datetime(2024, 1, 2, 14, 30)] * 2
+    assert columns["vwap"] == [10.0, None]
+    assert bars[0].item()["timestamp"] == "1m#2024-01-02T14:30:00.000Z"
+    assert "vwap" not in bars[1].item()
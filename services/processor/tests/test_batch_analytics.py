@@ -0,0 +1,72 @@
+import random
+
+import numpy as np
+import pytest
+
+from batch_analytics import compute_batch, exponential_moving_average
+from indicators import IndicatorConfig, IndicatorEngine
+
+
+def random_batch(rng, symbols, size):
+    ticks = {symbol: ([], []) for symbol in symbols}
+    for _ in range(size):
+        prices, volumes = ticks[rng.choice(symbols)]
+        prices.append(round(rng.uniform(50, 500), 2))
+        volumes.append(rng.choice([0, rng.randint(1, 10_000)]))
+    return ticks
+
+
+@pytest.mark.parametrize("config", [
+    IndicatorConfig(),
+    IndicatorConfig(sma_window=1, ema_span=1, vwap_window=1, volatility_window=2),
+    IndicatorConfig(sma_window=7, ema_span=30, vwap_window=64, volatility_window=3),
+])
+def test_vectorized_batches_match_the_scalar_engine(config):
+    rng = random.Random(7)
+    symbols = ["AAPL", "MSFT", "GOOGL", "TSLA"]
+    scalar = IndicatorEngine(config)
+    vectorized = IndicatorEngine(config)
+
+    for size in (1, 10, 500, 3, 1000):
+        ticks = random_batch(rng, symbols, size)
+        results = compute_batch(vectorized, ticks)
+
+        for symbol, (prices, volumes) in ticks.items():
+            expected = [
+                scalar.update(symbol, price, volume)
+                for price, volume in zip(prices, volumes)
+            ]
+            assert len(results[symbol]) == len(expected)
+            for got, want in zip(results[symbol], expected):
+                assert got.keys() == want.keys()
+                for name in want:
+                    assert got[name] == pytest.approx(want[name], abs=0.011)
+
+
+def test_engine_state_continues_after_a_vectorized_batch():
+    config = IndicatorConfig(sma_window=3, ema_span=4, vwap_window=5, volatility_window=4)
+    scalar = IndicatorEngine(config)
+    vectorized = IndicatorEngine(config)
+    prices = [10.0, 11.0, 12.5, 9.0, 10.5, 13.0, 12.0]
+
+    compute_batch(vectorized, {"AAPL": (prices, [1] * len(prices))})
+    for price in prices:
+        scalar.update("AAPL", price, 1)
+
+    assert vectorized.update("AAPL", 11.0, 2) == scalar.update("AAPL", 11.0, 2)
+
+
+def test_exponential_moving_average_matches_the_recursion():
+    rng = np.random.default_rng(3)
+    prices = rng.uniform(90, 110, size=200)
+    alpha = 2 / 11
+
+    expected = []
+    ema = 100.0
+    for price in prices:
+        ema += alpha * (price - ema)
+        expected.append(ema)
+
+    np.testing.assert_allclose(
+        exponential_moving_average(prices, alpha, previous=100.0), expected
+    )
@@ -0,0 +1,88 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+from checkpoints import BloomFilter, CheckpointStore, ShardCheckpoint, record_position
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        resource = boto3.resource("dynamodb", region_name="us-east-1")
+        resource.create_table(
+            TableName="ticks",
+            KeySchema=[
+                {"AttributeName": "symbol", "KeyType": "HASH"},
+                {"AttributeName": "timestamp", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "symbol", "AttributeType": "S"},
+                {"AttributeName": "timestamp", "AttributeType": "S"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        yield resource
+
+
+# Real Kinesis sequence numbers are wider than DynamoDB numbers
+SEQUENCE = 49590338271490256608559692538361571095921575989136588898
+
+
+def test_record_position():
+    record = {"eventID": f"shardId-000000000003:{SEQUENCE}",
+              "kinesis": {"sequenceNumber": str(SEQUENCE)}}
+    assert record_position(record) == ("shardId-000000000003", SEQUENCE)
+
+
+def test_bloom_filter_has_no_false_negatives_and_stops_when_full():
+    bloom = BloomFilter(1000)
+    added = [SEQUENCE + 7 * index for index in range(1000)]
+    assert all(bloom.add(sequence) for sequence in added)
+
+    assert all(sequence in bloom for sequence in added)
+    assert sum(SEQUENCE + 7 * index + 1 in bloom for index in range(10000)) == 0
+    assert not bloom.add(SEQUENCE - 1)
+
+
+def test_mark_stops_at_the_first_failure_and_later_successes_are_filtered():
+    checkpoint = ShardCheckpoint("shard", capacity=100)
+
+    checkpoint.advance(succeeded=[1, 2, 4, 5], failed=[3])
+
+    assert checkpoint.high_water == 2
+    assert [sequence for sequence in range(1, 7) if checkpoint.seen(sequence)] == [1, 2, 4, 5]
+
+    # The retry: 4 and 5 were skipped as seen, 3 now succeeds
+    checkpoint.advance(succeeded=[3, 4, 5], failed=[])
+
+    assert checkpoint.high_water == 5
+    assert len(checkpoint.bloom) == 0
+    assert checkpoint.filter_max == -1
+
+
+def test_checkpoints_survive_a_cold_start(dynamodb):
+    store = CheckpointStore("ticks", capacity=100)
+    checkpoint = store.get(dynamodb, "shard-1")
+    checkpoint.advance(succeeded=[SEQUENCE, SEQUENCE + 2], failed=[SEQUENCE + 1])
+    assert store.save(dynamodb, checkpoint)
+
+    restored = CheckpointStore("ticks", capacity=100).get(dynamodb, "shard-1")
+
+    assert restored.high_water == SEQUENCE
+    assert restored.seen(SEQUENCE + 2)
+    assert not restored.seen(SEQUENCE + 1)
+
+
+def test_a_stale_container_cannot_move_the_mark_back(dynamodb):
+    ahead, behind = CheckpointStore("ticks"), CheckpointStore("ticks")
+    stale = behind.get(dynamodb, "shard-1")
+    current = ahead.get(dynamodb, "shard-1")
+    current.advance(succeeded=[SEQUENCE + 10], failed=[])
+    assert ahead.save(dynamodb, current)
+
+    stale.advance(succeeded=[SEQUENCE], failed=[])
+
+    assert not behind.save(dynamodb, stale)
+    assert behind.get(dynamodb, "shard-1").high_water == SEQUENCE + 10
@@ -0,0 +1,176 @@
+import io
+import json
+from datetime import date, datetime, timedelta
+
+import boto3
+import pyarrow.parquet as pq
+import pytest
+from moto import mock_aws
+
+import compact
+from archive import ParquetArchiveWriter, put_partition
+from compact import MANIFEST, commit_in_place, compact_partition
+
+DAY = date(2024, 1, 2)
+PARTITION = "year=2024/month=01/day=02/"
+START = datetime(2024, 1, 2, 14, 30)
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="archive")
+        yield s3, boto3.client("glue", region_name="us-east-1")
+
+
+def archive_ticks(s3):
+    """30 ticks over three symbols, out of order: legacy JSON objects for the
+    first ten, Parquet batches for the rest, one of them archived twice."""
+    ticks = [(symbol, START + timedelta(seconds=index), 100.0 + index, 10 + index)
+             for index, symbol in enumerate(["MSFT", "AAPL", "GOOG"] * 10)]
+    for symbol, moment, price, volume in reversed(ticks[:10]):
+        timestamp = moment.isoformat(timespec="milliseconds") + "Z"
+        s3.put_object(Bucket="archive", Key=f"{PARTITION}{symbol}-{timestamp}.json", Body=json.dumps(
+            {"symbol": symbol, "price": price, "volume": volume, "timestamp": timestamp}))
+    for copy, batch in enumerate((ticks[10:20], ticks[20:], ticks[20:])):
+        writer = ParquetArchiveWriter()
+        for index, (symbol, moment, price, volume) in enumerate(batch):
+            writer.add(f"{copy}-{index}", symbol, price, volume, moment)
+        for key, _, columns in writer.drain():
+            put_partition(s3, "archive", key, columns)
+    return sorted(ticks)
+
+
+def keys(s3, prefix=""):
+    return sorted(obj["Key"] for obj in
+                  s3.list_objects_v2(Bucket="archive", Prefix=prefix).get("Contents", []))
+
+
+def read_rows(s3, keys):
+    rows, files = [], []
+    for key in keys:
+        parquet = pq.ParquetFile(io.BytesIO(s3.get_object(Bucket="archive", Key=key)["Body"].read()))
+        files.append(parquet)
+        columns = parquet.read().to_pydict()
+        rows += zip(columns["symbol"], columns["event_time"], columns["price"], columns["volume"])
+    return rows, files
+
+
+def test_partition_is_rewritten_as_sorted_deduplicated_parquet(aws):
+    s3, _ = aws
+    ticks = archive_ticks(s3)
+
+    # Small runs and row groups so the rows are spilled and merged
+    stats = compact_partition(s3, "archive", DAY, run_rows=7, rows_per_file=20, row_group_rows=5)
+
+    assert stats["objects"] == 13
+    assert stats["runs"] > 1
+    assert stats["duplicates"] == 10
+    assert stats["rows"] == 30
+    compacted = keys(s3)
+    assert compacted == stats["files"]
+    assert len(compacted) == 2
+
+    rows, files = read_rows(s3, compacted)
+    assert rows == ticks
+    # Sorted by symbol, so each row group covers a narrow range of symbols
+    groups = [files[0].metadata.row_group(index) for index in range(files[0].metadata.num_row_groups)]
+    assert len(groups) == 4
+    statistics = groups[0].column(0).statistics
+    assert (statistics.min, statistics.max) == ("AAPL", "AAPL")
+
+
+def test_sources_are_fetched_a_few_objects_ahead_and_large_ones_via_disk(aws, tmp_path, monkeypatch):
+    s3, _ = aws
+    ticks = archive_ticks(s3)
+    downloaded = []
+    download_file = s3.download_file
+    monkeypatch.setattr(s3, "download_file", lambda bucket, key, path: (
+        downloaded.append(key), download_file(bucket, key, path)))
+    listed = io.StringIO()
+
+    stream = compact.stream_sources(s3, "archive", [PARTITION], 2, listed, str(tmp_path),
+                                    spill_bytes=0)
+    objects = [next(stream)]
+    # The object being read plus two fetched ahead, not the whole page
+    assert len(listed.getvalue().splitlines()) == 3
+    objects += list(stream)
+    rows = [row for batches in objects for rows in batches for row in rows]
+
+    assert len(objects) == 13
+    assert len(downloaded) == 3 and all(key.endswith(".parquet") for key in downloaded)
+    epoch = datetime(1970, 1, 1)
+    assert sorted(set(rows)) == [
+        (symbol, int((moment - epoch).total_seconds() * 1000), price, volume)
+        for symbol, moment, price, volume in ticks
+    ]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_compacting_twice_keeps_the_rows(aws):
+    s3, _ = aws
+    ticks = archive_ticks(s3)
+
+    compact_partition(s3, "archive", DAY)
+    stats = compact_partition(s3, "archive", DAY)
+
+    assert stats["objects"] == 1
+    assert read_rows(s3, keys(s3))[0] == ticks
+
+
+def test_unfinished_swap_is_rolled_forward_first(aws, monkeypatch):
+    s3, _ = aws
+    ticks = archive_ticks(s3)
+    sources = keys(s3)
+
+    monkeypatch.setattr(compact, "commit_in_place", lambda *args: None)
+    compact_partition(s3, "archive", DAY)
+    assert sorted(set(keys(s3)) - set(sources))[-1] == PARTITION + MANIFEST
+    monkeypatch.setattr(compact, "commit_in_place", commit_in_place)
+
+    stats = compact_partition(s3, "archive", DAY)
+
+    assert "resumed_run" in stats
+    assert stats["objects"] == 1
+    remaining = keys(s3)
+    assert not any("_compaction" in key for key in remaining)
+    assert read_rows(s3, remaining)[0] == ticks
+
+
+def test_glue_partition_location_is_swapped(aws):
+    s3, glue = aws
+    ticks = archive_ticks(s3)
+    storage = {
+        "Columns": [{"Name": "symbol", "Type": "string"}, {"Name": "price", "Type": "double"},
+                    {"Name": "volume", "Type": "bigint"}, {"Name": "event_time", "Type": "timestamp"}],
+        "Location": "s3://archive/",
+    }
+    glue.create_database(DatabaseInput={"Name": "stocks"})
+    glue.create_table(DatabaseName="stocks", TableInput={
+        "Name": "stock_market_data", "StorageDescriptor": storage,
+        "PartitionKeys": [{"Name": name, "Type": "string"} for name in ("year", "month", "day")],
+    })
+    glue.create_partition(DatabaseName="stocks", TableName="stock_market_data", PartitionInput={
+        "Values": ["2024", "01", "02"], "StorageDescriptor": {**storage, "Location": "s3://archive/" + PARTITION},
+    })
+
+    stats = compact_partition(s3, "archive", DAY, glue=glue, glue_database="stocks")
+
+    partition = glue.get_partition(DatabaseName="stocks", TableName="stock_market_data",
+                                   PartitionValues=["2024", "01", "02"])["Partition"]
+    assert partition["StorageDescriptor"]["Location"] == stats["location"]
+    assert stats["location"].startswith("s3://archive/compacted/" + PARTITION + "run=")
+    assert keys(s3, PARTITION) == []
+    assert read_rows(s3, keys(s3))[0] == ticks
+
+    # A late tick lands in the original partition; the next run folds it in
+    s3.put_object(Bucket="archive", Key=PARTITION + "late.json", Body=json.dumps(
+        {"symbol": "AAPL", "price": 1.0, "volume": 1, "timestamp": "2024-01-02T23:00:00.000Z"}))
+    stats = compact_partition(s3, "archive", DAY, glue=glue, glue_database="stocks")
+
+    assert stats["objects"] == 2
+    assert keys(s3) == stats["files"]
+    assert len(read_rows(s3, keys(s3))[0]) == 31
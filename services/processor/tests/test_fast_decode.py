@@ -0,0 +1,73 @@
+import base64
+import json
+
+import pytest
+
+import fast_decode
+from fast_decode import (
+    decode_record, decode_record_reference, parse_timestamp, parse_timestamp_reference,
+)
+from quote_codec import encode_quotes
+
+
+def kinesis_record(payload: bytes):
+    return {"kinesis": {"data": base64.b64encode(payload).decode("ascii")}}
+
+
+JSON_DOCUMENTS = [
+    {"symbol": "AAPL", "price": 189.25, "volume": 1200, "timestamp": "2024-01-02T14:30:00Z"},
+    {"symbol": "BRK.B", "price": "412.10", "volume": "7", "timestamp": "2024-01-02T14:30:00.123Z"},
+    {"symbol": "Ünïcode", "price": 1e-5, "volume": 2 ** 40, "timestamp": "2024-01-02T09:30:00-05:00",
+     "extra": {"nested": [1, 2.5, None, True]}},
+]
+
+
+@pytest.mark.parametrize("document", JSON_DOCUMENTS)
+def test_json_records_decode_identically(document):
+    record = kinesis_record(json.dumps(document).encode("utf-8"))
+
+    assert decode_record(record) == decode_record_reference(record)
+
+
+def test_binary_records_decode_identically():
+    record = kinesis_record(encode_quotes(JSON_DOCUMENTS[:1] * 10, request_id="r"))
+
+    assert decode_record(record) == decode_record_reference(record)
+
+
+@pytest.mark.parametrize("payload", [b"not-json", b"{\"symbol\": ", b"\xff\xfe"])
+def test_invalid_payloads_raise_value_error_on_both_paths(payload):
+    record = kinesis_record(payload)
+
+    with pytest.raises(ValueError):
+        decode_record_reference(record)
+    with pytest.raises(ValueError):
+        decode_record(record)
+
+
+@pytest.mark.parametrize("value", [
+    "2024-01-02T14:30:00Z",
+    "2024-01-02T14:30:00.123Z",
+    "2024-01-02T14:30:00.123456Z",
+    "2024-01-02T14:30:00+00:00",
+    "2024-01-02T09:30:00-05:00",
+    "2024-01-02T14:30:00",
+])
+def test_timestamps_parse_identically(value):
+    parsed = parse_timestamp(value)
+    expected = parse_timestamp_reference(value)
+
+    assert parsed == expected
+    assert parsed.utcoffset() == expected.utcoffset()
+
+
+@pytest.mark.parametrize("value", ["", "yesterday", "2024-13-01T00:00:00Z"])
+def test_invalid_timestamps_raise_value_error(value):
+    with pytest.raises(ValueError):
+        parse_timestamp_reference(value)
+    with pytest.raises(ValueError):
+        parse_timestamp(value)
+
+
+def test_json_backend_is_reported():
+    assert fast_decode.JSON_BACKEND in ("orjson", "json")
@@ -0,0 +1,125 @@
+import random
+import statistics
+
+import pytest
+
+from indicators import IndicatorConfig, IndicatorEngine, SymbolIndicators
+
+
+def naive(prices, volumes, config):
+    sma = prices[-config.sma_window:]
+    vwap_p = prices[-config.vwap_window:]
+    vwap_v = volumes[-config.vwap_window:]
+    vol = prices[-config.volatility_window:]
+    ema = prices[0]
+    for price in prices[1:]:
+        ema += config.ema_alpha * (price - ema)
+    return {
+        "sma": sum(sma) / len(sma),
+        "ema": ema,
+        "vwap": sum(p * v for p, v in zip(vwap_p, vwap_v)) / sum(vwap_v),
+        "stddev": statistics.stdev(vol) if len(vol) > 1 else 0.0,
+    }
+
+
+@pytest.mark.parametrize("config", [
+    IndicatorConfig(),
+    IndicatorConfig(sma_window=1, ema_span=1, vwap_window=3, volatility_window=2),
+    IndicatorConfig(sma_window=50, ema_span=7, vwap_window=5, volatility_window=30),
+])
+def test_incremental_state_matches_full_recomputation(config):
+    rng = random.Random(42)
+    state = SymbolIndicators(config)
+    prices, volumes = [], []
+
+    for _ in range(500):
+        price = round(rng.uniform(90, 110), 2)
+        volume = rng.randint(1, 1000)
+        prices.append(price)
+        volumes.append(volume)
+        state.update(price, volume)
+
+        expected = naive(prices, volumes, config)
+        assert state.sma == pytest.approx(expected["sma"])
+        assert state.ema == pytest.approx(expected["ema"])
+        assert state.vwap == pytest.approx(expected["vwap"])
+        assert state.stddev == pytest.approx(expected["stddev"], abs=1e-9)
+
+
+def test_first_tick_returns_the_price():
+    engine = IndicatorEngine(IndicatorConfig())
+
+    assert engine.update("AAPL", 150.0, 10) == {
+        "moving_average": 150.0,
+        "ema": 150.0,
+        "vwap": 150.0,
+        "stddev": 0.0,
+    }
+
+
+def test_vwap_is_omitted_without_volume():
+    engine = IndicatorEngine(IndicatorConfig())
+
+    assert "vwap" not in engine.update("AAPL", 150.0, 0)
+
+
+def test_symbols_are_independent():
+    engine = IndicatorEngine(IndicatorConfig(sma_window=2))
+    engine.update("AAPL", 100.0, 1)
+    engine.update("MSFT", 300.0, 1)
+
+    assert engine.update("AAPL", 102.0, 1)["moving_average"] == 101.0
+    assert len(engine) == 2
+
+
+def test_windows_must_be_positive():
+    with pytest.raises(ValueError):
+        IndicatorConfig(sma_window=0)
+
+
+def test_least_recently_used_symbols_are_evicted_between_batches():
+    engine = IndicatorEngine(IndicatorConfig(), max_symbols=2)
+    for symbol in ("AAPL", "MSFT", "GOOG"):
+        engine.update(symbol, 100.0, 1)
+    engine.update("AAPL", 101.0, 1)
+
+    # Over the limit until the batch is done, so no state in use is lost
+    assert len(engine) == 3
+    assert engine.evict() == ["MSFT"]
+    assert list(engine.symbols) == ["GOOG", "AAPL"]
+    assert engine.evictions == 1
+
+
+def test_restore_returns_symbols_to_their_saved_state():
+    engine = IndicatorEngine(IndicatorConfig(sma_window=2))
+    engine.update("AAPL", 100.0, 1)
+    saved = engine.save(["AAPL", "MSFT"])
+    engine.update("AAPL", 200.0, 1)
+    engine.update("MSFT", 50.0, 1)
+
+    for symbol, state in saved.items():
+        engine.restore(symbol, state)
+
+    assert "MSFT" not in engine.symbols
+    assert engine.update("AAPL", 102.0, 1)["moving_average"] == 101.0
+
+
+def test_unbounded_engine_never_evicts():
+    engine = IndicatorEngine(IndicatorConfig())
+    for index in range(50):
+        engine.update(f"S{index}", 1.0, 1)
+
+    assert engine.evict() == []
+    assert len(engine) == 50
+
+
+def test_footprint_grows_with_symbols_and_stays_compact():
+    engine = IndicatorEngine(IndicatorConfig(vwap_window=100))
+    engine.update("AAPL", 1.0, 1)
+    one = engine.footprint()
+    for index in range(99):
+        engine.update(f"S{index}", 1.0, 1)
+
+    assert engine.footprint() > one
+    # Two 100-slot arrays of 8-byte values plus object overhead per symbol
+    assert engine.footprint() / len(engine) < 2 * 100 * 8 + 600
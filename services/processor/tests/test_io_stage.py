@@ -0,0 +1,47 @@
+import threading
+import time
+
+from io_stage import IOStage
+
+
+def test_results_are_returned_in_submission_order():
+    stage = IOStage(max_workers=4)
+
+    results = stage.run([(None, lambda value=value: value) for value in range(10)])
+
+    assert results == list(range(10))
+
+
+def test_unkeyed_tasks_run_concurrently():
+    stage = IOStage(max_workers=2)
+    barrier = threading.Barrier(2, timeout=5)
+
+    # Deadlocks (and the barrier times out) unless both run at the same time
+    results = stage.run([(None, barrier.wait), (None, barrier.wait)])
+
+    assert not any(isinstance(result, Exception) for result in results)
+
+
+def test_tasks_sharing_a_key_run_in_order():
+    stage = IOStage(max_workers=8)
+    seen = []
+
+    def append(value):
+        time.sleep(0.001 * (5 - value))
+        seen.append(value)
+
+    stage.run([("AAPL", lambda value=value: append(value)) for value in range(5)])
+
+    assert seen == [0, 1, 2, 3, 4]
+
+
+def test_exceptions_are_returned_without_stopping_the_lane():
+    stage = IOStage(max_workers=2)
+    error = RuntimeError("boom")
+
+    def fail():
+        raise error
+
+    results = stage.run([("AAPL", fail), ("AAPL", lambda: "ok")])
+
+    assert results == [error, "ok"]
@@ -0,0 +1,82 @@
+import io
+import json
+
+from metrics import MAX_VALUES_PER_METRIC, InvocationMetrics
+
+
+def make_metrics(stream=None):
+    return InvocationMetrics("StockPipeline", {"FunctionName": "processor"}, stream=stream)
+
+
+def test_documents_follow_embedded_metric_format():
+    metrics = make_metrics()
+    metrics.count("RecordsReceived", 3)
+    metrics.timing("WriteTime", 12.5)
+    metrics.failure("InvalidRecord")
+
+    main, by_type = metrics.documents(timestamp_ms=1700000000000)
+
+    directive = main["_aws"]["CloudWatchMetrics"][0]
+    assert main["_aws"]["Timestamp"] == 1700000000000
+    assert directive["Namespace"] == "StockPipeline"
+    assert directive["Dimensions"] == [["FunctionName"]]
+    assert {"Name": "RecordsReceived", "Unit": "Count"} in directive["Metrics"]
+    assert {"Name": "WriteTime", "Unit": "Milliseconds"} in directive["Metrics"]
+    assert main["FunctionName"] == "processor"
+    assert main["RecordsReceived"] == 3
+    assert main["WriteTime"] == 12.5
+
+    assert by_type["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [["FunctionName", "ErrorType"]]
+    assert by_type["ErrorType"] == "InvalidRecord"
+    assert by_type["RecordsFailedByType"] == 1
+
+
+def test_timings_are_downsampled_to_the_emf_limit_keeping_the_extremes():
+    metrics = make_metrics()
+    for value in range(1000):
+        metrics.timing("DynamoDBWriteLatency", float(value))
+
+    samples = metrics.documents()[0]["DynamoDBWriteLatency"]
+
+    assert len(samples) == MAX_VALUES_PER_METRIC
+    assert samples[0] == 0.0
+    assert samples[-1] == 999.0
+
+
+def test_flush_writes_one_line_per_document_and_resets():
+    stream = io.StringIO()
+    metrics = make_metrics(stream)
+    metrics.count("RecordsReceived")
+    metrics.failure("WriteFailed", 2)
+
+    metrics.flush()
+
+    lines = stream.getvalue().splitlines()
+    assert [json.loads(line)["_aws"]["CloudWatchMetrics"][0]["Namespace"] for line in lines] == [
+        "StockPipeline", "StockPipeline"
+    ]
+    assert metrics.summary() == {"failures_by_type": {}}
+
+
+def test_summary_aggregates_timings():
+    metrics = make_metrics()
+    with metrics.timer("DecodeTime"):
+        pass
+    metrics.timing("DecodeTime", 5.0)
+
+    summary = metrics.summary()["DecodeTime_ms"]
+
+    assert summary["count"] == 2
+    assert summary["max"] == 5.0
+
+
+def test_gauges_keep_the_last_value_and_their_unit():
+    metrics = make_metrics()
+    metrics.gauge("StateBytes", 100, "Bytes")
+    metrics.gauge("StateBytes", 250, "Bytes")
+
+    main = metrics.documents()[0]
+
+    assert main["StateBytes"] == 250
+    assert {"Name": "StateBytes", "Unit": "Bytes"} in main["_aws"]["CloudWatchMetrics"][0]["Metrics"]
+    assert metrics.summary()["StateBytes"] == 250
@@ -0,0 +1,70 @@
+import math
+from datetime import datetime, timedelta, timezone
+
+from quote_batch import QuoteBatch, epoch_ns
+
+
+def make_batch(rows, keep_sources=False):
+    batch = QuoteBatch(keep_sources=keep_sources)
+    for index, (symbol, price, volume) in enumerate(rows):
+        moment = datetime(2024, 1, 2, 15, 0, index, tzinfo=timezone.utc)
+        batch.append(f"id-{index}", symbol, price, volume, moment.isoformat(),
+                     epoch_ns(moment), {"symbol": symbol} if keep_sources else None)
+    return batch
+
+
+def test_columns_are_typed_buffers_and_symbols_are_shared():
+    batch = make_batch([("AAPL", 150.5, 100), ("".join(["AA", "PL"]), 151.0, 200)])
+
+    assert batch.prices.typecode == "d" and batch.volumes.typecode == "q"
+    assert batch.symbols[0] is batch.symbols[1]
+    assert batch.sources is None
+    assert not hasattr(batch, "__dict__")
+
+
+def test_epoch_ns_round_trips_through_event_time():
+    moment = datetime(2024, 1, 2, 15, 0, 1, 123456, tzinfo=timezone.utc)
+    batch = QuoteBatch()
+    batch.append("id-1", "AAPL", 150.5, 100, moment.isoformat(), epoch_ns(moment))
+
+    assert epoch_ns(moment.replace(tzinfo=None)) == epoch_ns(moment)
+    assert epoch_ns(moment.astimezone(timezone(timedelta(hours=-5)))) == epoch_ns(moment)
+    assert batch.event_time(0) == moment
+    assert batch.event_ms(0) == 1704207601123
+
+
+def test_items_carry_indicators_once_computed():
+    batch = make_batch([("AAPL", 150.5, 100), ("MSFT", 400.0, 0)])
+    assert "moving_average" not in batch.item(0)
+
+    batch.reset_indicators()
+    batch.set_indicators(0, (150.5, 150.5, 0.0, 150.5))
+    batch.set_indicators(1, (400.0, 400.0, 0.0, math.nan))
+
+    assert batch.item(0) == {
+        "symbol": "AAPL", "timestamp": "2024-01-02T15:00:00+00:00", "price": 150.5,
+        "volume": 100, "moving_average": 150.5, "ema": 150.5, "stddev": 0.0, "vwap": 150.5,
+    }
+    assert "vwap" not in batch.item(1)
+
+
+def test_column_views_write_through_to_the_batch():
+    batch = make_batch([("AAPL", 1.0, 1), ("AAPL", 2.0, 2)])
+    batch.reset_indicators()
+
+    batch.column("ema")[:] = batch.column("prices") * 2
+
+    assert list(batch.ema) == [2.0, 4.0]
+
+
+def test_without_drops_rows_from_every_column():
+    batch = make_batch([("AAPL", 1.0, 1), ("MSFT", 2.0, 2), ("AAPL", 3.0, 3)], keep_sources=True)
+    batch.reset_indicators()
+
+    kept = batch.without({"id-1"})
+
+    assert kept.record_ids == ["id-0", "id-2"]
+    assert list(kept.prices) == [1.0, 3.0] and list(kept.volumes) == [1, 3]
+    assert len(kept.vwap) == 2 and kept.sources == [{"symbol": "AAPL"}] * 2
+    assert kept.rows_by_symbol() == {"AAPL": [0, 1]}
+    assert batch.without(set()) is batch
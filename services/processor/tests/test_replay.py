@@ -0,0 +1,98 @@
+import json
+from datetime import date, datetime, timedelta
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from archive import ParquetArchiveWriter, put_partition, read_parquet
+from indicators import IndicatorConfig, IndicatorEngine
+from replay import load_progress, replay
+
+CONFIG = IndicatorConfig(sma_window=3, ema_span=4, vwap_window=4, volatility_window=4)
+START = datetime(2024, 1, 1, 23, 59, 50)
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="archive")
+        dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+        dynamodb.create_table(
+            TableName="ticks",
+            KeySchema=[
+                {"AttributeName": "symbol", "KeyType": "HASH"},
+                {"AttributeName": "timestamp", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "symbol", "AttributeType": "S"},
+                {"AttributeName": "timestamp", "AttributeType": "S"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        yield s3, dynamodb
+
+
+def archive_ticks(s3):
+    """20 AAPL ticks over midnight: the first half as legacy JSON objects, the
+    rest as a Parquet batch (archived twice, as a retried batch would be)."""
+    ticks = [(START + timedelta(seconds=index), 100.0 + index * (-1) ** index, 10 + index)
+             for index in range(20)]
+    for moment, price, volume in ticks[:10]:
+        timestamp = moment.isoformat(timespec="milliseconds") + "Z"
+        s3.put_object(
+            Bucket="archive",
+            Key=f"year={moment.year}/month={moment.month:02d}/day={moment.day:02d}/AAPL-{timestamp}.json",
+            Body=json.dumps({"symbol": "AAPL", "price": price, "volume": volume, "timestamp": timestamp}),
+        )
+    for copy in ("a", "b"):
+        writer = ParquetArchiveWriter()
+        for index, (moment, price, volume) in enumerate(ticks[10:]):
+            writer.add(f"{copy}{index}", "AAPL", price, volume, moment)
+        for key, _, columns in writer.drain():
+            put_partition(s3, "archive", key, columns)
+    return ticks
+
+
+def expected_averages(ticks):
+    engine = IndicatorEngine(CONFIG)
+    return [engine.update("AAPL", price, volume)["moving_average"] for _, price, volume in ticks]
+
+
+def test_replay_rebuilds_history_across_days_and_formats(aws, tmp_path):
+    s3, dynamodb = aws
+    ticks = archive_ticks(s3)
+
+    totals = replay(s3, dynamodb, "archive", date(2024, 1, 1), date(2024, 1, 3),
+                    table_name="ticks", parquet_output=str(tmp_path), config=CONFIG)
+
+    assert totals["ticks"] == 20
+    assert totals["unwritten"] == 0
+    items = dynamodb.Table("ticks").scan()["Items"]
+    averages = [float(item["moving_average"]) for item in sorted(items, key=lambda item: item["timestamp"])]
+    assert averages == expected_averages(ticks)
+
+    day_two = tmp_path / "year=2024" / "month=01" / "day=02" / "replay.parquet"
+    assert read_parquet(day_two.read_bytes())["moving_average"] == expected_averages(ticks)[10:]
+
+
+def test_interrupted_replay_resumes_with_the_same_windows(aws, tmp_path):
+    s3, dynamodb = aws
+    ticks = archive_ticks(s3)
+    progress = str(tmp_path / "progress.json")
+
+    replay(s3, dynamodb, "archive", date(2024, 1, 1), date(2024, 1, 1),
+           table_name="ticks", progress_path=progress, config=CONFIG)
+    assert load_progress(progress, IndicatorEngine(CONFIG)) == ["2024-01-01"]
+
+    totals = replay(s3, dynamodb, "archive", date(2024, 1, 1), date(2024, 1, 2),
+                    table_name="ticks", progress_path=progress, config=CONFIG)
+
+    assert totals["skipped_days"] == 1
+    assert totals["ticks"] == 10
+    items = dynamodb.Table("ticks").scan()["Items"]
+    averages = [float(item["moving_average"]) for item in sorted(items, key=lambda item: item["timestamp"])]
+    assert averages == expected_averages(ticks)
@@ -0,0 +1,148 @@
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError, ParamValidationError
+
+from retry import AdaptiveRetry, AIMDLimiter, Deadline, DeadlineExceeded, Throttled, is_retryable
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Context:
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+def client_error(code, status=400):
+    return ClientError({"Error": {"Code": code, "Message": code},
+                        "ResponseMetadata": {"HTTPStatusCode": status}}, "Op")
+
+
+@pytest.fixture(autouse=True)
+def no_sleep():
+    with patch("retry.time.sleep") as sleep:
+        yield sleep
+
+
+def test_only_transient_errors_are_retryable():
+    assert is_retryable(client_error("ProvisionedThroughputExceededException"))
+    assert is_retryable(client_error("SlowDown", 503))
+    assert is_retryable(client_error("SomethingNew", 502))
+    assert is_retryable(EndpointConnectionError(endpoint_url="https://dynamodb"))
+    assert is_retryable(Throttled())
+    assert not is_retryable(client_error("ConditionalCheckFailedException"))
+    assert not is_retryable(client_error("ValidationException"))
+    assert not is_retryable(ParamValidationError(report="bad"))
+
+
+def test_throttles_are_retried_until_the_call_succeeds():
+    retries = []
+    retrier = AdaptiveRetry(AIMDLimiter(4), max_attempts=4, on_retry=lambda err, attempt: retries.append(attempt))
+    fn = MagicMock(side_effect=[client_error("ThrottlingException"), client_error("InternalError", 500), "ok"])
+
+    assert retrier.call(fn, 1, key="value") == "ok"
+    assert fn.call_count == 3
+    fn.assert_called_with(1, key="value")
+    assert retries == [1, 2]
+
+
+def test_the_last_error_is_raised_once_attempts_run_out():
+    retrier = AdaptiveRetry(AIMDLimiter(4), max_attempts=3)
+    fn = MagicMock(side_effect=client_error("InternalServerError", 500))
+
+    with pytest.raises(ClientError):
+        retrier.call(fn)
+
+    assert fn.call_count == 3
+    assert retrier.limiter.in_flight == 0
+
+
+def test_permanent_errors_are_not_retried():
+    retrier = AdaptiveRetry(AIMDLimiter(4), max_attempts=3)
+    fn = MagicMock(side_effect=client_error("ConditionalCheckFailedException"))
+
+    with pytest.raises(ClientError):
+        retrier.call(fn)
+
+    assert fn.call_count == 1
+
+
+def test_limit_halves_on_throttles_and_grows_back_one_per_window():
+    limiter = AIMDLimiter(8)
+
+    limiter.acquire()
+    limiter.release(throttled=True)
+    assert limiter.limit == 4
+    for _ in range(4):
+        limiter.acquire()
+        limiter.release()
+    assert 4.9 < limiter.limit < 5
+    for _ in range(100):
+        limiter.acquire()
+        limiter.release()
+    assert limiter.limit == 8
+
+
+def test_limiter_makes_callers_wait_for_a_free_slot():
+    limiter = AIMDLimiter(1)
+    limiter.acquire()
+
+    assert not limiter.acquire(timeout=0.01)
+    threading.Timer(0.05, limiter.release).start()
+    assert limiter.acquire(timeout=5)
+
+
+def test_deadline_follows_the_remaining_time_less_the_reserve():
+    clock = Clock()
+    deadline = Deadline(Context(5000), reserve_ms=3000, clock=clock)
+
+    assert deadline.remaining() == 2.0
+    clock.now = 2.0
+    assert deadline.expired()
+    assert Deadline(None).remaining() is None
+    assert not Deadline({}).expired()
+
+
+def test_no_attempt_is_started_or_slept_on_past_the_deadline(no_sleep):
+    clock = Clock()
+    retrier = AdaptiveRetry(AIMDLimiter(4), max_attempts=10, backoff_base=1.0)
+    retrier.deadline = Deadline(Context(1000), clock=clock)
+    fn = MagicMock(side_effect=client_error("ThrottlingException"))
+    # Every backoff takes the longest delay it may
+    with patch("retry.random.uniform", side_effect=lambda low, high: high):
+        with pytest.raises(DeadlineExceeded) as raised:
+            retrier.call(fn)
+
+    assert fn.call_count == 1
+    no_sleep.assert_not_called()
+    assert isinstance(raised.value.__cause__, ClientError)
+
+    clock.now = 1.0
+    with pytest.raises(DeadlineExceeded):
+        retrier.call(fn)
+    assert fn.call_count == 1
+
+
+def test_attempts_need_time_to_run_to_their_timeouts():
+    clock = Clock()
+    retrier = AdaptiveRetry(AIMDLimiter(4), attempt_timeout=2.0)
+    retrier.deadline = Deadline(Context(3000), clock=clock)
+    fn = MagicMock(return_value="ok")
+
+    assert retrier.time_left() == 1.0
+    assert retrier.call(fn) == "ok"
+    clock.now = 1.0
+    assert retrier.out_of_time()
+    with pytest.raises(DeadlineExceeded):
+        retrier.call(fn)
+    assert fn.call_count == 1
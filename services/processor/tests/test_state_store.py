@@ -0,0 +1,171 @@
+import math
+from unittest.mock import MagicMock, patch
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from indicators import IndicatorConfig, IndicatorEngine
+from retry import AdaptiveRetry, AIMDLimiter, Throttled
+from state_store import IndicatorStateStore, decode_state, encode_state
+
+CONFIG = IndicatorConfig(sma_window=3, ema_span=4, vwap_window=4, volatility_window=4)
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        resource = boto3.resource("dynamodb", region_name="us-east-1")
+        resource.create_table(
+            TableName="state-table",
+            KeySchema=[
+                {"AttributeName": "symbol", "KeyType": "HASH"},
+                {"AttributeName": "timestamp", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "symbol", "AttributeType": "S"},
+                {"AttributeName": "timestamp", "AttributeType": "S"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        yield resource
+
+
+def feed(engine, symbol, prices):
+    for index, price in enumerate(prices):
+        engine.state(symbol).update(price, 10 + index)
+
+
+def test_encoding_round_trips_the_window_exactly():
+    engine = IndicatorEngine(CONFIG)
+    feed(engine, "AAPL", [0.1, 0.2, 0.3, 1 / 3, 1e-9, 12345.678])
+    state = engine.state("AAPL")
+
+    prices, volumes, count, ema = decode_state(encode_state(state))
+
+    assert (prices, volumes) == state.window()
+    assert count == 6
+    assert ema == state.ema
+
+
+def test_empty_state_round_trips_without_ema():
+    prices, volumes, count, ema = decode_state(encode_state(IndicatorEngine(CONFIG).state("X")))
+
+    assert (prices, volumes, count, ema) == ([], [], 0, None)
+
+
+def test_hydrated_state_continues_like_a_warm_one(dynamodb):
+    store = IndicatorStateStore("state-table")
+    warm = IndicatorEngine(CONFIG)
+    feed(warm, "AAPL", [100.0, 101.5, 99.0, 102.0, 103.25])
+    feed(warm, "MSFT", [300.0, 301.0])
+    assert store.write(dynamodb, store.items(warm, ["AAPL", "MSFT"])) == []
+
+    cold = IndicatorEngine(CONFIG)
+    assert sorted(store.hydrate(dynamodb, cold, ["AAPL", "MSFT", "NEW"])) == ["AAPL", "MSFT"]
+    assert "NEW" not in cold.symbols
+
+    for engine in (warm, cold):
+        engine.state("AAPL").update(104.0, 50)
+    assert cold.state("AAPL").snapshot() == warm.state("AAPL").snapshot()
+    assert cold.state("AAPL").count == 6
+
+
+def test_hydrate_only_reads_symbols_the_engine_does_not_hold():
+    dynamodb = MagicMock()
+    dynamodb.batch_get_item.return_value = {"Responses": {}}
+    engine = IndicatorEngine(CONFIG)
+    feed(engine, "AAPL", [1.0])
+
+    IndicatorStateStore("state-table").hydrate(dynamodb, engine, ["AAPL", "MSFT"])
+
+    keys = dynamodb.batch_get_item.call_args.kwargs["RequestItems"]["state-table"]["Keys"]
+    assert keys == [{"symbol": "MSFT", "timestamp": "STATE"}]
+
+
+def test_refreshed_symbols_take_snapshots_that_saw_more_ticks(dynamodb):
+    store = IndicatorStateStore("state-table")
+    newer = IndicatorEngine(CONFIG)
+    feed(newer, "AAPL", [100.0, 101.0, 102.0, 103.0])
+    feed(newer, "MSFT", [300.0])
+    store.write(dynamodb, store.items(newer, ["AAPL", "MSFT"]))
+
+    stale = IndicatorEngine(CONFIG)
+    feed(stale, "AAPL", [100.0, 101.0])
+    # Processed here after its snapshot was written
+    feed(stale, "MSFT", [300.0, 301.0])
+
+    assert store.hydrate(dynamodb, stale, [], refresh=["AAPL", "MSFT"]) == ["AAPL"]
+    assert stale.state("AAPL").snapshot() == newer.state("AAPL").snapshot()
+    assert stale.state("MSFT").count == 2
+
+
+def test_claim_says_whether_the_shard_was_last_processed_here(dynamodb):
+    store = IndicatorStateStore("state-table")
+
+    assert not store.claim(dynamodb, "shardId-000000000000", "a")
+    assert store.claim(dynamodb, "shardId-000000000000", "a")
+    assert not store.claim(dynamodb, "shardId-000000000000", "b")
+    assert not store.claim(dynamodb, "shardId-000000000000", "a")
+    assert not store.claim(dynamodb, "shardId-000000000001", "a")
+
+
+def test_hydrate_reads_in_batches_of_100_and_retries_unprocessed_keys():
+    dynamodb = MagicMock()
+    retry = {"state-table": {"Keys": [{"symbol": "S000", "timestamp": "STATE"}]}}
+    dynamodb.batch_get_item.side_effect = [
+        {"Responses": {"state-table": []}, "UnprocessedKeys": retry},
+        {"Responses": {"state-table": []}},
+        {"Responses": {"state-table": []}},
+    ]
+    symbols = [f"S{index:03d}" for index in range(150)]
+
+    retrier = AdaptiveRetry(AIMDLimiter(4), max_attempts=3)
+
+    with patch("retry.time.sleep"):
+        IndicatorStateStore("state-table").hydrate(
+            dynamodb, IndicatorEngine(CONFIG), symbols, call=retrier.call)
+
+    calls = dynamodb.batch_get_item.call_args_list
+    assert [len(call.kwargs["RequestItems"]["state-table"]["Keys"]) for call in calls] == [100, 1, 50]
+
+
+def test_hydrate_fails_when_keys_stay_unprocessed():
+    dynamodb = MagicMock()
+    dynamodb.batch_get_item.return_value = {
+        "Responses": {"state-table": []},
+        "UnprocessedKeys": {"state-table": {"Keys": [{"symbol": "AAPL", "timestamp": "STATE"}]}},
+    }
+
+    with pytest.raises(Throttled):
+        IndicatorStateStore("state-table").hydrate(dynamodb, IndicatorEngine(CONFIG), ["AAPL"])
+    assert dynamodb.batch_get_item.call_count == 1
+
+
+def test_write_reports_items_left_unprocessed():
+    dynamodb = MagicMock()
+    engine = IndicatorEngine(CONFIG)
+    feed(engine, "AAPL", [1.0])
+    store = IndicatorStateStore("state-table")
+    items = store.items(engine, ["AAPL"])
+    dynamodb.batch_write_item.return_value = {
+        "UnprocessedItems": {"state-table": [{"PutRequest": {"Item": items[0]}}]}
+    }
+    retrier = AdaptiveRetry(AIMDLimiter(4), max_attempts=3)
+
+    with patch("retry.time.sleep"):
+        assert store.write(dynamodb, items, call=retrier.call) == ["AAPL"]
+    assert dynamodb.batch_write_item.call_count == 3
+
+
+def test_items_skip_symbols_without_state():
+    engine = IndicatorEngine(CONFIG)
+    feed(engine, "AAPL", [1.0])
+
+    items = IndicatorStateStore("state-table").items(engine, ["AAPL", "GONE"])
+
+    assert [item["symbol"] for item in items] == ["AAPL"]
+    assert items[0]["timestamp"] == "STATE"
+    assert not math.isnan(decode_state(items[0]["window"])[3])
@@ -0,0 +1,74 @@
+import json
+
+from stream_runner import (
+    partition, read_checkpoint, read_quotes, run, shard_for, synthetic_quotes,
+)
+
+
+def runner_options(checkpoint_dir=None, **overrides):
+    options = {
+        "batch_size": 50,
+        "max_retries": 2,
+        "checkpoint_dir": checkpoint_dir,
+        "aws": False,
+        "verbose": False,
+        "environment": {
+            "DYNAMODB_TABLE": "local-ticks",
+            "S3_BUCKET": "local-archive",
+            "AWS_DEFAULT_REGION": "us-east-1",
+            "EMIT_METRICS": "false",
+        },
+    }
+    options.update(overrides)
+    return options
+
+
+def test_partitioning_keeps_each_symbol_on_one_shard_in_order():
+    quotes = synthetic_quotes(500, symbols=20, seed=1)
+
+    streams = partition(quotes, 4)
+
+    assert sum(len(stream) for stream in streams) == 500
+    for shard, stream in enumerate(streams):
+        assert all(shard_for(quote["symbol"], 4) == shard for quote in stream)
+        for symbol in {quote["symbol"] for quote in stream}:
+            expected = [quote for quote in quotes if quote["symbol"] == symbol]
+            assert [quote for quote in stream if quote["symbol"] == symbol] == expected
+
+
+def test_recorded_events_and_plain_quotes_are_both_read(tmp_path):
+    import base64
+
+    quote = {"symbol": "AAPL", "price": 1.5, "volume": 3, "timestamp": "2024-01-01T00:00:00Z"}
+    event = {"Records": [{"kinesis": {"data": base64.b64encode(json.dumps(quote).encode()).decode()}}]}
+    path = tmp_path / "stream.jsonl"
+    path.write_text(json.dumps(quote) + "\n\n" + json.dumps(event) + "\n")
+
+    assert [q["symbol"] for q in read_quotes(str(path))] == ["AAPL", "AAPL"]
+
+
+def test_shards_match_a_sequential_run_and_resume_from_checkpoints(tmp_path):
+    quotes = synthetic_quotes(600, symbols=30, seed=7)
+    checkpoints = str(tmp_path / "checkpoints")
+
+    summary = run(quotes, 2, runner_options(checkpoints))
+
+    assert summary["records"] == 600
+    assert summary["mismatched_ticks"] == 0
+    for result in summary["shard_results"]:
+        assert read_checkpoint(checkpoints, result["shard"]) == result["checkpoint"]
+
+    resumed = run(quotes, 2, runner_options(checkpoints))
+    assert resumed["records"] == 0
+
+
+def test_records_failing_every_retry_are_skipped(tmp_path):
+    quotes = synthetic_quotes(120, symbols=1, seed=3)
+    del quotes[60]["price"]
+
+    summary = run(quotes, 1, runner_options(str(tmp_path)))
+
+    (result,) = summary["shard_results"]
+    assert result["skipped"] == [61]
+    assert result["checkpoint"] == 120
+    assert result["retries"] == 3
@@ -0,0 +1,445 @@
+"""Compact one day partition of the S3 archive into sorted Parquet files.
+
+Run from services/processor:
+
+    python tools/compact.py --bucket BUCKET --day 2026-01-18
+        [--prefix PREFIX] [--glue-database DB --glue-table TABLE]
+        [--run-rows N] [--rows-per-file N] [--row-group-rows N] [--keep-sources]
+
+Streams every object of the ``year=/month=/day=`` partition (legacy
+per-event JSON, the processor's Parquet batches and earlier compaction
+output alike), a few objects at a time and each in row batches. It writes them into a few large Snappy Parquet
+files sorted by ``symbol`` then ``event_time``, with duplicate ticks dropped.
+Sorted files give tight per-row-group min/max statistics, so Athena can skip
+most row groups for ``symbol = ...`` and ``event_time`` predicates. Memory
+stays bounded: rows are buffered up to ``--run-rows``, sorted and spilled to
+local run files, which are then k-way merged into the output.
+
+The new files replace the old objects in one of two ways:
+
+* With ``--glue-database`` (atomic): the files are written under
+  ``compacted/year=/month=/day=/run=<id>/`` and the partition's location in
+  the Glue catalog is switched to them in a single UpdatePartition call.
+  Queries see either the old objects or the new files, never both.
+* Without a catalog: the files are staged under ``_compaction/`` in the
+  partition (Athena ignores ``_`` paths), a manifest is written, and they
+  are then promoted and the sources deleted. If the job dies part-way, the
+  next run finds the manifest and finishes the swap before anything else.
+
+Compact only days that are closed. Objects that arrive after the listing
+are left in place and not deleted.
+"""
+import argparse
+import heapq
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, datetime, timezone
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, ".."), os.path.join(HERE, "..", "..", "common")]
+
+import pyarrow as pa  # noqa: E402
+import pyarrow.parquet as pq  # noqa: E402
+from botocore.exceptions import ClientError  # noqa: E402
+
+from archive import archive_schema, partition_prefix  # noqa: E402
+from quote_codec import iso_to_micros  # noqa: E402
+
+# (symbol, event time in epoch milliseconds, price, volume)
+Row = Tuple[str, int, float, int]
+
+STAGING = "_compaction/"
+MANIFEST = STAGING + "manifest.json"
+# DeleteObjects removes at most 1000 keys per call
+DELETE_BATCH_SIZE = 1000
+# Larger source objects are read from a local copy rather than from memory
+SPILL_OBJECT_BYTES = 16 * 1024 * 1024
+
+
+def day_prefix(prefix: str, day: date) -> str:
+    return prefix + partition_prefix((day.year, day.month, day.day))
+
+
+def is_hidden(key: str, partition: str) -> bool:
+    """Whether Athena skips the object: a path part starting with _ or ."""
+    return any(part[:1] in ("_", ".") for part in key[len(partition):].split("/"))
+
+
+# =====================================================
+# Read
+# =====================================================
+def decode_object(key: str, body, batch_rows: int = 65_536) -> Iterator[List[Row]]:
+    """The rows of one object, ``batch_rows`` at a time.
+
+    ``body`` is the object's bytes, or the path of a local copy of it.
+    """
+    if key.endswith(".parquet"):
+        source = io.BytesIO(body) if isinstance(body, bytes) else body
+        for batch in pq.ParquetFile(source).iter_batches(
+            batch_size=batch_rows, columns=["symbol", "price", "volume", "event_time"]
+        ):
+            columns = batch.to_pydict()
+            yield [
+                (symbol, _millis(event_time), float(price), int(volume))
+                for symbol, price, volume, event_time in zip(
+                    columns["symbol"], columns["price"], columns["volume"], columns["event_time"]
+                )
+            ]
+        return
+    quote = json.loads(body)
+    yield [(quote["symbol"], iso_to_micros(quote["timestamp"]) // 1000,
+            float(quote["price"]), int(quote["volume"]))]
+
+
+def _millis(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+
+def stream_sources(s3, bucket: str, prefixes: List[str], workers: int,
+                   sources_file, workdir: str,
+                   spill_bytes: int = SPILL_OBJECT_BYTES) -> Iterator[Iterator[List[Row]]]:
+    """Yield the rows of every object under ``prefixes``, each object as an
+    iterator of row batches.
+
+    At most ``workers`` objects are fetched ahead of the one being read.
+    Parquet objects over ``spill_bytes``, such as an earlier compaction's
+    files, are downloaded to ``workdir`` instead of into memory. Every key read is
+    appended to ``sources_file`` as it is listed.
+    """
+    def fetch(key: str, size: int):
+        if size <= spill_bytes or not key.endswith(".parquet"):
+            return s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+        path = os.path.join(workdir, f"object-{uuid.uuid4().hex}")
+        s3.download_file(bucket, key, path)
+        return path
+
+    def rows(key: str, fetched: Future) -> Iterator[List[Row]]:
+        body = fetched.result()
+        try:
+            yield from decode_object(key, body)
+        finally:
+            if isinstance(body, str):
+                os.remove(body)
+
+    paginator = s3.get_paginator("list_objects_v2")
+    window: Deque[Tuple[str, Future]] = deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for prefix in prefixes:
+            for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+                for obj in page.get("Contents", []):
+                    if is_hidden(obj["Key"], prefix):
+                        continue
+                    sources_file.write(obj["Key"] + "\n")
+                    window.append((obj["Key"], pool.submit(fetch, obj["Key"], obj["Size"])))
+                    if len(window) > workers:
+                        yield rows(*window.popleft())
+        while window:
+            yield rows(*window.popleft())
+
+
+# =====================================================
+# Sort and write
+# =====================================================
+def write_run(rows: List[Row], path: str):
+    rows.sort()
+    pq.write_table(_table(rows), path, compression="snappy")
+
+
+def read_run(path: str, batch_rows: int = 65_536) -> Iterator[Row]:
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_rows):
+        columns = batch.to_pydict()
+        yield from zip(columns["symbol"], columns["event_time"], columns["price"], columns["volume"])
+
+
+def _table(rows: List[Row]) -> pa.Table:
+    symbols, times, prices, volumes = zip(*rows) if rows else ((), (), (), ())
+    return pa.Table.from_arrays(
+        [pa.array(symbols, pa.string()), pa.array(prices, pa.float64()),
+         pa.array(volumes, pa.int64()), pa.array(times, pa.timestamp("ms"))],
+        schema=archive_schema(),
+    )
+
+
+class PartWriter:
+    """Writes sorted rows into part files of at most ``rows_per_file`` rows."""
+
+    def __init__(self, directory: str, rows_per_file: int, row_group_rows: int):
+        self.directory = directory
+        self.rows_per_file = rows_per_file
+        self.row_group_rows = row_group_rows
+        self.paths: List[str] = []
+        self.rows = 0
+        self._writer: Optional[pq.ParquetWriter] = None
+        self._in_file = 0
+        self._group: List[Row] = []
+
+    def add(self, row: Row):
+        self._group.append(row)
+        if len(self._group) >= self.row_group_rows:
+            self._write_group()
+
+    def close(self):
+        self._write_group()
+        self.close_file()
+
+    def _write_group(self):
+        if not self._group:
+            return
+        if self._writer is None or self._in_file >= self.rows_per_file:
+            self.close_file()
+            path = os.path.join(self.directory, f"part-{len(self.paths):05d}.parquet")
+            self.paths.append(path)
+            self._writer = pq.ParquetWriter(path, archive_schema(), compression="snappy",
+                                            write_statistics=True, **_sorting_metadata())
+            self._in_file = 0
+        self._writer.write_table(_table(self._group), row_group_size=self.row_group_rows)
+        self._in_file += len(self._group)
+        self.rows += len(self._group)
+        self._group = []
+
+    def close_file(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def _sorting_metadata() -> Dict[str, Any]:
+    # Recorded in the footer on pyarrow versions that support it
+    if not hasattr(pq, "SortingColumn"):
+        return {}
+    names = archive_schema().names
+    return {"sorting_columns": [pq.SortingColumn(names.index("symbol")),
+                                pq.SortingColumn(names.index("event_time"))]}
+
+
+def merge_runs(run_paths: List[str], parts: PartWriter) -> int:
+    """k-way merge sorted runs into ``parts``, dropping duplicate rows."""
+    previous = None
+    duplicates = 0
+    for row in heapq.merge(*(read_run(path) for path in run_paths)):
+        if row == previous:
+            duplicates += 1
+            continue
+        parts.add(row)
+        previous = row
+    parts.close()
+    return duplicates
+
+
+# =====================================================
+# Swap
+# =====================================================
+def upload_parts(s3, bucket: str, prefix: str, paths: List[str]) -> List[str]:
+    keys = []
+    for path in paths:
+        key = prefix + os.path.basename(path)
+        s3.upload_file(path, bucket, key, ExtraArgs={"ContentType": "application/vnd.apache.parquet"})
+        keys.append(key)
+    return keys
+
+
+def delete_keys(s3, bucket: str, keys: List[str]):
+    for start in range(0, len(keys), DELETE_BATCH_SIZE):
+        s3.delete_objects(Bucket=bucket, Delete={
+            "Objects": [{"Key": key} for key in keys[start:start + DELETE_BATCH_SIZE]],
+            "Quiet": True,
+        })
+
+
+def glue_partition_values(day: date) -> List[str]:
+    return [str(day.year), f"{day.month:02d}", f"{day.day:02d}"]
+
+
+def glue_location_prefix(glue, database: str, table: str, day: date,
+                         bucket: str) -> Optional[str]:
+    """Key prefix of the partition's current location, if it is in ``bucket``."""
+    try:
+        partition = glue.get_partition(DatabaseName=database, TableName=table,
+                                       PartitionValues=glue_partition_values(day))["Partition"]
+    except glue.exceptions.EntityNotFoundException:
+        return None
+    location = partition["StorageDescriptor"]["Location"]
+    root = f"s3://{bucket}/"
+    if not location.startswith(root):
+        return None
+    return location[len(root):].rstrip("/") + "/"
+
+
+def swap_glue_partition(glue, database: str, table: str, day: date, location: str):
+    """Point the partition at ``location`` (creating it if it is missing)."""
+    values = glue_partition_values(day)
+    try:
+        partition = glue.get_partition(DatabaseName=database, TableName=table,
+                                       PartitionValues=values)["Partition"]
+    except glue.exceptions.EntityNotFoundException:
+        storage = glue.get_table(DatabaseName=database, Name=table)["Table"]["StorageDescriptor"]
+        glue.create_partition(DatabaseName=database, TableName=table, PartitionInput={
+            "Values": values, "StorageDescriptor": {**storage, "Location": location},
+        })
+        return
+    storage = {**partition["StorageDescriptor"], "Location": location}
+    glue.update_partition(DatabaseName=database, TableName=table, PartitionValueList=values,
+                          PartitionInput={"Values": values, "StorageDescriptor": storage})
+
+
+def read_manifest(s3, bucket: str, partition: str) -> Optional[Dict[str, Any]]:
+    try:
+        body = s3.get_object(Bucket=bucket, Key=partition + MANIFEST)["Body"].read()
+    except s3.exceptions.NoSuchKey:
+        return None
+    return json.loads(body)
+
+
+def commit_in_place(s3, bucket: str, partition: str, manifest: Dict[str, Any]):
+    """Promote staged parts and delete the sources; safe to repeat."""
+    for staged, final in zip(manifest["staged"], manifest["final"]):
+        try:
+            s3.copy_object(Bucket=bucket, Key=final, CopySource={"Bucket": bucket, "Key": staged})
+        except ClientError as err:
+            # Already promoted and cleaned up by an earlier attempt
+            if err.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+                raise
+    sources = s3.get_object(Bucket=bucket, Key=manifest["sources"])["Body"].read().decode("utf-8")
+    finals = set(manifest["final"])
+    delete_keys(s3, bucket, [key for key in sources.splitlines() if key and key not in finals])
+    delete_keys(s3, bucket, manifest["staged"] + [manifest["sources"], partition + MANIFEST])
+
+
+# =====================================================
+# Compaction
+# =====================================================
+def compact_partition(s3, bucket: str, day: date, prefix: str = "",
+                      glue=None, glue_database: Optional[str] = None,
+                      glue_table: str = "stock_market_data",
+                      run_rows: int = 1_000_000, rows_per_file: int = 5_000_000,
+                      row_group_rows: int = 128_000, workers: int = 32,
+                      delete_sources: bool = True,
+                      workdir: Optional[str] = None) -> Dict[str, Any]:
+    partition = day_prefix(prefix, day)
+    started = time.perf_counter()
+    stats: Dict[str, Any] = {"partition": partition}
+
+    prefixes = [partition]
+    if glue_database is None:
+        pending = read_manifest(s3, bucket, partition)
+        if pending is not None:
+            # An earlier run staged its files but did not finish the swap
+            commit_in_place(s3, bucket, partition, pending)
+            stats["resumed_run"] = pending["run"]
+    else:
+        # An earlier compaction's files, plus anything archived since, which
+        # the catalog stopped pointing at when it moved the partition
+        current = glue_location_prefix(glue, glue_database, glue_table, day, bucket)
+        if current and current != partition:
+            prefixes.insert(0, current)
+
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ") + "-" + uuid.uuid4().hex[:8]
+    scratch = tempfile.mkdtemp(prefix="compact-", dir=workdir)
+    try:
+        sources_path = os.path.join(scratch, "sources.txt")
+        run_paths: List[str] = []
+        buffer: List[Row] = []
+        objects = 0
+        with open(sources_path, "w") as sources_file:
+            for batches in stream_sources(s3, bucket, prefixes, workers, sources_file, scratch):
+                objects += 1
+                for rows in batches:
+                    buffer.extend(rows)
+                    if len(buffer) >= run_rows:
+                        run_paths.append(os.path.join(scratch, f"run-{len(run_paths):05d}.parquet"))
+                        write_run(buffer, run_paths[-1])
+                        buffer = []
+        if buffer:
+            run_paths.append(os.path.join(scratch, f"run-{len(run_paths):05d}.parquet"))
+            write_run(buffer, run_paths[-1])
+            buffer = []
+
+        stats.update(objects=objects, runs=len(run_paths))
+        if not objects:
+            stats.update(rows=0, parts=0, seconds=round(time.perf_counter() - started, 3))
+            return stats
+
+        parts_dir = os.path.join(scratch, "parts")
+        os.makedirs(parts_dir)
+        parts = PartWriter(parts_dir, rows_per_file, row_group_rows)
+        stats["duplicates"] = merge_runs(run_paths, parts)
+        stats.update(rows=parts.rows, parts=len(parts.paths),
+                     bytes=sum(os.path.getsize(path) for path in parts.paths))
+        with open(sources_path) as sources_file:
+            sources = sources_file.read().splitlines()
+
+        if glue_database is not None:
+            location = (f"{prefix}compacted/"
+                        f"{partition_prefix((day.year, day.month, day.day))}run={run_id}/")
+            stats["files"] = upload_parts(s3, bucket, location, parts.paths)
+            swap_glue_partition(glue, glue_database, glue_table, day, f"s3://{bucket}/{location}")
+            stats["location"] = f"s3://{bucket}/{location}"
+            if delete_sources:
+                delete_keys(s3, bucket, sources)
+        else:
+            staging = f"{partition}{STAGING}{run_id}/"
+            staged = upload_parts(s3, bucket, staging, parts.paths)
+            sources_key = staging + "sources.txt"
+            s3.upload_file(sources_path, bucket, sources_key)
+            manifest = {
+                "run": run_id,
+                "staged": staged,
+                "final": [f"{partition}compacted-{run_id}-{index:05d}.parquet"
+                          for index in range(len(staged))],
+                "sources": sources_key,
+            }
+            s3.put_object(Bucket=bucket, Key=partition + MANIFEST, Body=json.dumps(manifest))
+            commit_in_place(s3, bucket, partition, manifest)
+            stats["files"] = manifest["final"]
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bucket", required=True)
+    parser.add_argument("--day", required=True, type=date.fromisoformat)
+    parser.add_argument("--prefix", default="", help="key prefix above the year= partitions")
+    parser.add_argument("--glue-database", help="swap the partition location in this Glue database")
+    parser.add_argument("--glue-table", default="stock_market_data")
+    parser.add_argument("--run-rows", type=int, default=1_000_000,
+                        help="rows sorted in memory before spilling a run to disk")
+    parser.add_argument("--rows-per-file", type=int, default=5_000_000)
+    parser.add_argument("--row-group-rows", type=int, default=128_000)
+    parser.add_argument("--workers", type=int, default=32, help="parallel S3 GETs")
+    parser.add_argument("--keep-sources", action="store_true",
+                        help="with --glue-database, leave the old objects in place")
+    parser.add_argument("--workdir", help="where to spill sorted runs (default: system temp)")
+    args = parser.parse_args()
+
+    import boto3
+    from botocore.config import Config
+
+    s3 = boto3.client("s3", config=Config(max_pool_connections=args.workers))
+    stats = compact_partition(
+        s3, args.bucket, args.day, prefix=args.prefix,
+        glue=boto3.client("glue") if args.glue_database else None,
+        glue_database=args.glue_database, glue_table=args.glue_table,
+        run_rows=args.run_rows, rows_per_file=args.rows_per_file,
+        row_group_rows=args.row_group_rows, workers=args.workers,
+        delete_sources=not args.keep_sources, workdir=args.workdir,
+    )
+    print(json.dumps({key: value for key, value in stats.items() if key != "files"}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""In-memory stand-ins for the DynamoDB and S3 calls the processor makes.
+
+Used by the local tools and benchmarks in place of AWS. Each call can sleep
+for a fixed latency, and with ``keep=True`` the written items and objects are
+kept so a run can be inspected afterwards. Only the call shapes app.py uses
+are supported.
+"""
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+
+class FakeService:
+    """Counts calls and sleeps for a fixed latency on each one."""
+
+    def __init__(self, latency_ms: float = 0.0, keep: bool = False):
+        self.latency = latency_ms / 1000
+        self.keep = keep
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _call(self):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+
+class FakeTable(FakeService):
+    def __init__(self, latency_ms: float = 0.0, keep: bool = False):
+        super().__init__(latency_ms, keep)
+        self.items: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeNames,
+                    ExpressionAttributeValues, **kwargs):
+        # Stores the SET values; the "only if newer" condition is not applied
+        self._call()
+        if self.keep:
+            item = {
+                ExpressionAttributeNames[name.strip()]: ExpressionAttributeValues[value.strip()]
+                for name, value in (
+                    assignment.split("=")
+                    for assignment in UpdateExpression[len("SET "):].split(",")
+                )
+            }
+            with self._lock:
+                self.items[(Key["symbol"], Key["timestamp"])] = {**Key, **item}
+        return {}
+
+    def put_item(self, Item, **kwargs):
+        # The condition is not applied either
+        self._call()
+        if self.keep:
+            with self._lock:
+                self.items[(Item["symbol"], Item["timestamp"])] = Item
+        return {}
+
+    def get_item(self, Key, **kwargs):
+        self._call()
+        with self._lock:
+            item = self.items.get((Key["symbol"], Key["timestamp"]))
+        return {"Item": item} if item is not None else {}
+
+
+class FakeDynamoDB(FakeService):
+    def __init__(self, latency_ms: float = 0.0, keep: bool = False):
+        super().__init__(latency_ms, keep)
+        self.table = FakeTable(latency_ms, keep)
+        self.items: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        # Tick timestamps per symbol, in the order they were written
+        self.writes: Dict[str, List[str]] = defaultdict(list)
+
+    def Table(self, name):
+        return self.table
+
+    def batch_write_item(self, RequestItems):
+        self._call()
+        if self.keep:
+            with self._lock:
+                for requests in RequestItems.values():
+                    for request in requests:
+                        item = request["PutRequest"]["Item"]
+                        self.items[(item["symbol"], item["timestamp"])] = item
+                        self.writes[item["symbol"]].append(item["timestamp"])
+        return {"UnprocessedItems": {}}
+
+    def batch_get_item(self, RequestItems):
+        self._call()
+        responses = {}
+        with self._lock:
+            for table_name, request in RequestItems.items():
+                responses[table_name] = [
+                    self.items[(key["symbol"], key["timestamp"])]
+                    for key in request["Keys"]
+                    if (key["symbol"], key["timestamp"]) in self.items
+                ]
+        return {"Responses": responses}
+
+
+class FakeS3(FakeService):
+    def __init__(self, latency_ms: float = 0.0, keep: bool = False):
+        super().__init__(latency_ms, keep)
+        self.objects: Dict[str, bytes] = {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self._call()
+        if self.keep:
+            with self._lock:
+                self.objects[Key] = Body
+        return {}
+
+
+def install(app, dynamodb: FakeDynamoDB, s3: FakeS3):
+    """Point a freshly imported processor ``app`` module at the fakes."""
+    app.get_dynamodb = lambda: dynamodb
+    app.get_table = lambda: dynamodb.table
+    app.get_s3 = lambda: s3
+    app.get_secret = lambda: {}
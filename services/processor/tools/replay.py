@@ -0,0 +1,302 @@
+"""Recompute indicator history from the S3 archive.
+
+Run from services/processor:
+
+    python tools/replay.py --bucket BUCKET --start 2024-01-01 --end 2024-01-31
+        [--table TABLE] [--parquet-output DIR_OR_S3_URI]
+        [--progress FILE] [--workers N]
+
+Walks the archive's ``year=/month=/day=`` partitions day by day. Each day's
+objects (legacy per-event JSON and Parquet batches alike) are listed and
+fetched in parallel over one pooled S3 client, while the previous day is
+still being processed. Each symbol's ticks are deduplicated, put in timestamp
+order and run through the processor's own vectorized analytics, continuing
+the windows from the day before.
+
+Results are bulk-loaded into DynamoDB (BatchWriteItem on a thread pool, in
+the tick item shape the processor writes) and/or written as one Parquet file
+per day. After every day the progress file records the days done and the
+indicator windows reached, so an interrupted replay resumes from the next
+day with exactly the state it would have had.
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, ".."), os.path.join(HERE, "..", "..", "common")]
+
+from archive import partition_prefix, read_parquet  # noqa: E402
+from batch_analytics import compute_batch  # noqa: E402
+from indicators import IndicatorConfig, IndicatorEngine  # noqa: E402
+from quote_codec import iso_to_micros, micros_to_iso  # noqa: E402
+from state_store import decode_state, encode_state  # noqa: E402
+
+DYNAMODB_BATCH_SIZE = 25
+MAX_RETRIES = 8
+
+# (epoch micros, symbol, timestamp, price, volume)
+Tick = Tuple[int, str, str, float, int]
+
+
+def indicator_config() -> IndicatorConfig:
+    """The processor's indicator windows, from the same environment variables."""
+    return IndicatorConfig(
+        sma_window=int(os.environ.get("MOVING_AVG_WINDOW", "5")),
+        ema_span=int(os.environ.get("EMA_SPAN", "10")),
+        vwap_window=int(os.environ.get("VWAP_WINDOW", "20")),
+        volatility_window=int(os.environ.get("VOLATILITY_WINDOW", "20")),
+    )
+
+
+def days(start: date, end: date) -> List[date]:
+    return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+
+def day_prefix(day: date) -> str:
+    return partition_prefix((day.year, day.month, day.day))
+
+
+# =====================================================
+# Fetch
+# =====================================================
+def list_keys(s3, bucket: str, prefix: str) -> List[str]:
+    keys = []
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+        keys.extend(obj["Key"] for obj in page.get("Contents", []))
+    return keys
+
+
+def decode_object(key: str, body: bytes) -> List[Tick]:
+    """Ticks of one archive object, in either archive format."""
+    if key.endswith(".parquet"):
+        columns = read_parquet(body)
+        ticks = []
+        for symbol, price, volume, event_time in zip(
+            columns["symbol"], columns["price"], columns["volume"], columns["event_time"]
+        ):
+            micros = iso_to_micros(event_time.isoformat())
+            ticks.append((micros, symbol, micros_to_iso(micros), float(price), int(volume)))
+        return ticks
+
+    quote = json.loads(body)
+    timestamp = quote["timestamp"]
+    return [(iso_to_micros(timestamp), quote["symbol"], timestamp,
+             float(quote["price"]), int(quote["volume"]))]
+
+
+def fetch_day(s3, bucket: str, prefix: str, day: date, workers: int) -> List[Tick]:
+    """All ticks archived under one day's partition, fetched in parallel."""
+    keys = list_keys(s3, bucket, prefix + day_prefix(day))
+
+    def fetch(key):
+        body = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+        return decode_object(key, body)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return [tick for ticks in pool.map(fetch, keys) for tick in ticks]
+
+
+# =====================================================
+# Analytics
+# =====================================================
+def replay_day(engine: IndicatorEngine, ticks: List[Tick]) -> List[Dict[str, Any]]:
+    """Tick rows with their indicators, continuing ``engine``'s windows.
+
+    Duplicate ticks (same symbol and time, e.g. a batch archived twice) are
+    only counted once.
+    """
+    by_symbol: Dict[str, Dict[int, Tick]] = {}
+    for tick in ticks:
+        by_symbol.setdefault(tick[1], {}).setdefault(tick[0], tick)
+    ordered = {symbol: [series[micros] for micros in sorted(series)]
+               for symbol, series in sorted(by_symbol.items())}
+
+    results = compute_batch(engine, {
+        symbol: ([tick[3] for tick in series], [tick[4] for tick in series])
+        for symbol, series in ordered.items()
+    })
+
+    rows = []
+    for symbol, series in ordered.items():
+        for (micros, _, timestamp, price, volume), indicators in zip(series, results[symbol]):
+            rows.append({
+                "symbol": symbol,
+                "timestamp": timestamp,
+                "price": price,
+                "volume": volume,
+                "micros": micros,
+                **indicators,
+            })
+    return rows
+
+
+# =====================================================
+# Sinks
+# =====================================================
+def write_dynamodb(dynamodb, table_name: str, rows: List[Dict[str, Any]], workers: int) -> int:
+    """BatchWriteItem the rows as tick items; returns the number not written."""
+    items = [
+        {key: Decimal(str(value)) if isinstance(value, float) else value
+         for key, value in row.items() if key != "micros"}
+        for row in rows
+    ]
+    chunks = [items[start:start + DYNAMODB_BATCH_SIZE]
+              for start in range(0, len(items), DYNAMODB_BATCH_SIZE)]
+
+    def write(chunk) -> int:
+        pending = [{"PutRequest": {"Item": item}} for item in chunk]
+        for attempt in range(MAX_RETRIES + 1):
+            if attempt:
+                time.sleep(random.uniform(0, 0.05 * (2 ** attempt)))
+            response = dynamodb.batch_write_item(RequestItems={table_name: pending})
+            pending = response.get("UnprocessedItems", {}).get(table_name, [])
+            if not pending:
+                return 0
+        return len(pending)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(write, chunks))
+
+
+def encode_rows(rows: List[Dict[str, Any]]) -> bytes:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pydict({
+        "symbol": [row["symbol"] for row in rows],
+        "price": [row["price"] for row in rows],
+        "volume": [row["volume"] for row in rows],
+        "event_time": pa.array([row["micros"] // 1000 for row in rows], pa.timestamp("ms")),
+        "moving_average": [row["moving_average"] for row in rows],
+        "ema": [row["ema"] for row in rows],
+        "stddev": [row["stddev"] for row in rows],
+        "vwap": [row.get("vwap") for row in rows],
+    })
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression="snappy")
+    return buffer.getvalue()
+
+
+def write_parquet(s3, destination: str, day: date, rows: List[Dict[str, Any]]):
+    """One file per day under ``destination`` (a directory or s3://bucket/prefix)."""
+    relative = day_prefix(day) + "replay.parquet"
+    body = encode_rows(rows)
+    if destination.startswith("s3://"):
+        bucket, _, prefix = destination[len("s3://"):].partition("/")
+        key = f"{prefix.rstrip('/')}/{relative}" if prefix else relative
+        s3.put_object(Bucket=bucket, Key=key, Body=body,
+                      ContentType="application/vnd.apache.parquet")
+        return
+    path = os.path.join(destination, relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as output:
+        output.write(body)
+
+
+# =====================================================
+# Progress
+# =====================================================
+def load_progress(path: Optional[str], engine: IndicatorEngine) -> List[str]:
+    """Restore the windows of an interrupted replay; returns the days done."""
+    if not path or not os.path.exists(path):
+        return []
+    with open(path) as progress:
+        saved = json.load(progress)
+    for symbol, window in saved["state"].items():
+        engine.state(symbol).load(*decode_state(base64.b64decode(window)))
+    return saved["completed_days"]
+
+
+def save_progress(path: Optional[str], engine: IndicatorEngine, completed: List[str]):
+    if not path:
+        return
+    saved = {
+        "completed_days": completed,
+        "state": {
+            symbol: base64.b64encode(encode_state(state)).decode("ascii")
+            for symbol, state in engine.symbols.items()
+        },
+    }
+    with open(path + ".tmp", "w") as progress:
+        json.dump(saved, progress)
+    os.replace(path + ".tmp", path)
+
+
+# =====================================================
+# Replay
+# =====================================================
+def replay(s3, dynamodb, bucket: str, start: date, end: date, prefix: str = "",
+           table_name: Optional[str] = None, parquet_output: Optional[str] = None,
+           progress_path: Optional[str] = None, workers: int = 32,
+           config: Optional[IndicatorConfig] = None) -> Dict[str, Any]:
+    engine = IndicatorEngine(config or indicator_config())
+    completed = load_progress(progress_path, engine)
+    pending = [day for day in days(start, end) if day.isoformat() not in completed]
+
+    totals = {"days": 0, "ticks": 0, "unwritten": 0, "skipped_days": len(completed)}
+    started = time.perf_counter()
+    # The next day is fetched while the current one is computed and written
+    with ThreadPoolExecutor(max_workers=1) as prefetch:
+        upcoming = prefetch.submit(fetch_day, s3, bucket, prefix, pending[0], workers) if pending else None
+        for index, day in enumerate(pending):
+            ticks = upcoming.result()
+            if index + 1 < len(pending):
+                upcoming = prefetch.submit(fetch_day, s3, bucket, prefix, pending[index + 1], workers)
+
+            rows = replay_day(engine, ticks)
+            if rows and table_name:
+                totals["unwritten"] += write_dynamodb(dynamodb, table_name, rows, workers)
+            if rows and parquet_output:
+                write_parquet(s3, parquet_output, day, rows)
+
+            completed.append(day.isoformat())
+            save_progress(progress_path, engine, completed)
+            totals["days"] += 1
+            totals["ticks"] += len(rows)
+            print(f"{day}: {len(rows)} ticks", file=sys.stderr)
+
+    totals["seconds"] = round(time.perf_counter() - started, 3)
+    totals["symbols"] = len(engine)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bucket", required=True, help="archive bucket")
+    parser.add_argument("--prefix", default="", help="key prefix above the year= partitions")
+    parser.add_argument("--start", required=True, type=date.fromisoformat)
+    parser.add_argument("--end", required=True, type=date.fromisoformat)
+    parser.add_argument("--table", help="DynamoDB tick table to load the results into")
+    parser.add_argument("--parquet-output", help="directory or s3://bucket/prefix for Parquet results")
+    parser.add_argument("--progress", help="progress file; resumes from it when present")
+    parser.add_argument("--workers", type=int, default=32, help="parallel S3 GETs and DynamoDB writes")
+    args = parser.parse_args()
+    if not args.table and not args.parquet_output:
+        parser.error("give --table and/or --parquet-output")
+
+    import boto3
+    from botocore.config import Config
+
+    config = Config(max_pool_connections=args.workers, retries={"mode": "adaptive"})
+    totals = replay(
+        boto3.client("s3", config=config),
+        boto3.resource("dynamodb", config=config),
+        args.bucket, args.start, args.end, prefix=args.prefix,
+        table_name=args.table, parquet_output=args.parquet_output,
+        progress_path=args.progress, workers=args.workers,
+    )
+    print(json.dumps(totals))
+
+
+if __name__ == "__main__":
+    main()
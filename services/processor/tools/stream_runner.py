@@ -0,0 +1,311 @@
+"""Local multi-shard runner for the processor.
+
+Run from services/processor:
+
+    python tools/stream_runner.py --shards N (--input FILE | --synthetic Q)
+        [--symbols S] [--batch-size B] [--checkpoint-dir DIR]
+        [--max-retries R] [--output FILE] [--aws]
+
+Quotes are partitioned into N virtual shards by a CRC-32 hash of their
+symbol, like the producer's aggregation buckets, so each symbol stays on one
+shard and in order. Every shard runs in its own worker process, the way one
+Lambda container serves one shard: it imports app.py afresh, numbers its
+records with increasing sequence numbers and feeds them to ``handler`` in
+batches.
+
+Failures follow Kinesis' ReportBatchItemFailures semantics: the shard
+checkpoints just before the lowest failed sequence number and resumes from
+it. A record still failing after ``--max-retries`` retries is skipped and
+reported. Checkpoints are kept per shard in ``--checkpoint-dir``, so an
+interrupted run picks up where it stopped.
+
+``--input`` reads JSON lines holding either one quote each or a recorded
+Kinesis event (``{"Records": [...]}``). By default DynamoDB and S3 are the
+in-memory fakes of local_aws.py, and every written tick's moving average is
+checked against a sequential recomputation of its symbol's stream. With
+``--aws`` the workers use whatever boto3 is configured for, e.g. LocalStack
+through AWS_ENDPOINT_URL.
+"""
+import argparse
+import base64
+import json
+import math
+import os
+import random
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from multiprocessing import get_context
+from typing import Any, Dict, Iterable, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PATHS = [HERE, os.path.join(HERE, ".."), os.path.join(HERE, "..", "..", "common")]
+sys.path[:0] = PATHS
+
+# Lambda's default Kinesis batch size
+DEFAULT_BATCH_SIZE = 100
+# Handed to the handler as the remaining time of every invocation
+INVOCATION_TIMEOUT_MS = 15 * 60 * 1000
+
+
+class LocalContext:
+    def __init__(self, request_id: str):
+        self.aws_request_id = request_id
+
+    def get_remaining_time_in_millis(self) -> int:
+        return INVOCATION_TIMEOUT_MS
+
+
+# =====================================================
+# Input
+# =====================================================
+def shard_for(symbol: str, shards: int) -> int:
+    return zlib.crc32(symbol.encode("utf-8")) % shards
+
+
+def partition(quotes: Iterable[Dict[str, Any]], shards: int) -> List[List[Dict[str, Any]]]:
+    """Split quotes into per-shard streams, keeping their order."""
+    streams: List[List[Dict[str, Any]]] = [[] for _ in range(shards)]
+    for quote in quotes:
+        streams[shard_for(str(quote.get("symbol", "")), shards)].append(quote)
+    return streams
+
+
+def read_quotes(path: str) -> List[Dict[str, Any]]:
+    from quote_codec import decode_payload
+
+    quotes = []
+    with open(path) as lines:
+        for line in lines:
+            if not line.strip():
+                continue
+            document = json.loads(line)
+            if "Records" not in document:
+                quotes.append(document)
+                continue
+            for record in document["Records"]:
+                quotes.extend(decode_payload(base64.b64decode(record["kinesis"]["data"])))
+    return quotes
+
+
+def synthetic_quotes(count: int, symbols: int, seed: int) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    names = [f"SYM{index:05d}" for index in range(symbols)]
+    prices = {name: 100.0 for name in names}
+    clock = datetime(2024, 1, 2, 14, 30, tzinfo=timezone.utc)
+    quotes = []
+    for _ in range(count):
+        symbol = rng.choice(names)
+        prices[symbol] = round(max(0.01, prices[symbol] * (1 + rng.gauss(0, 0.001))), 4)
+        clock += timedelta(milliseconds=1)
+        quotes.append({
+            "symbol": symbol,
+            "price": prices[symbol],
+            "volume": rng.randint(1, 10_000),
+            "timestamp": clock.isoformat(timespec="milliseconds").replace("+00:00", "Z"),
+        })
+    return quotes
+
+
+# =====================================================
+# Checkpoints
+# =====================================================
+def checkpoint_path(directory: str, shard: int) -> str:
+    return os.path.join(directory, f"shard-{shard:04d}.json")
+
+
+def read_checkpoint(directory: Optional[str], shard: int) -> int:
+    """Sequence number of the last record the shard finished, 0 for none."""
+    if not directory or not os.path.exists(checkpoint_path(directory, shard)):
+        return 0
+    with open(checkpoint_path(directory, shard)) as checkpoint:
+        return json.load(checkpoint)["sequence"]
+
+
+def write_checkpoint(directory: Optional[str], shard: int, sequence: int):
+    if not directory:
+        return
+    path = checkpoint_path(directory, shard)
+    with open(path + ".tmp", "w") as checkpoint:
+        json.dump({"shard": shard, "sequence": sequence}, checkpoint)
+    os.replace(path + ".tmp", path)
+
+
+# =====================================================
+# Shard worker
+# =====================================================
+def run_shard(shard: int, quotes: List[Dict[str, Any]], options: Dict[str, Any]) -> Dict[str, Any]:
+    """Feed one shard's stream to a freshly imported processor, in batches."""
+    sys.path[:0] = PATHS
+    for name, value in options["environment"].items():
+        os.environ.setdefault(name, value)
+
+    import app
+    import local_aws
+
+    dynamodb = None
+    if not options["aws"]:
+        dynamodb = local_aws.FakeDynamoDB(keep=True)
+        local_aws.install(app, dynamodb, local_aws.FakeS3())
+    if not options["verbose"]:
+        app.logHandler.setStream(open(os.devnull, "w"))
+
+    # Record n of the shard is quotes[n - 1]
+    payloads = [json.dumps(quote).encode("utf-8") for quote in quotes]
+    resumed_from = read_checkpoint(options["checkpoint_dir"], shard)
+    position = resumed_from
+    batches = retries = attempts = 0
+    skipped: List[int] = []
+
+    started = time.perf_counter()
+    while position < len(payloads):
+        batch = range(position + 1, min(position + options["batch_size"], len(payloads)) + 1)
+        event = {"Records": [
+            {
+                "eventID": f"shardId-{shard:012d}:{sequence}",
+                "kinesis": {
+                    "sequenceNumber": str(sequence),
+                    "data": base64.b64encode(payloads[sequence - 1]).decode("ascii"),
+                },
+            }
+            for sequence in batch
+        ]}
+        result = app.handler(event, LocalContext(f"local-{shard}-{batches}"))
+        batches += 1
+
+        failed = [int(item["itemIdentifier"].rsplit(":", 1)[1])
+                  for item in result["batchItemFailures"]]
+        if not failed:
+            position = batch[-1]
+            attempts = 0
+        else:
+            retries += 1
+            first = min(failed)
+            attempts = attempts + 1 if first == position + 1 else 1
+            position = first - 1
+            if attempts > options["max_retries"]:
+                skipped.append(first)
+                position = first
+                attempts = 0
+        write_checkpoint(options["checkpoint_dir"], shard, position)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "shard": shard,
+        "records": len(payloads) - resumed_from,
+        "resumed_from": resumed_from,
+        "checkpoint": position,
+        "batches": batches,
+        "retries": retries,
+        "skipped": skipped,
+        "seconds": round(elapsed, 3),
+        "symbols": len({quote.get("symbol") for quote in quotes}),
+        # Without DEDUPE_RECORDS, replayed records are applied to the windows
+        # again, as on Lambda. Either way the sequential comparison needs
+        # every record processed, from a fresh start.
+        "mismatched_ticks": (
+            check_ticks(app, dynamodb, quotes)
+            if dynamodb is not None and not skipped and not resumed_from
+            and (app.DEDUPE_RECORDS or not retries) else None
+        ),
+    }
+
+
+def check_ticks(app, dynamodb, quotes: List[Dict[str, Any]]) -> int:
+    """Count written ticks whose moving average differs from a sequential run."""
+    from indicators import IndicatorEngine
+
+    reference = IndicatorEngine(app.indicator_engine.config)
+    mismatched = 0
+    for quote in quotes:
+        expected = reference.update(quote["symbol"], float(quote["price"]), int(quote["volume"]))
+        item = dynamodb.items.get((quote["symbol"], quote["timestamp"]))
+        if item is None or not math.isclose(
+            float(item["moving_average"]), expected["moving_average"], abs_tol=0.011
+        ):
+            mismatched += 1
+    return mismatched
+
+
+# =====================================================
+# Runner
+# =====================================================
+def run(quotes: List[Dict[str, Any]], shards: int, options: Dict[str, Any]) -> Dict[str, Any]:
+    if options["checkpoint_dir"]:
+        os.makedirs(options["checkpoint_dir"], exist_ok=True)
+
+    started = time.perf_counter()
+    # spawn, so each worker starts cold like a new Lambda container
+    with ProcessPoolExecutor(max_workers=shards, mp_context=get_context("spawn")) as pool:
+        futures = [pool.submit(run_shard, shard, stream, options)
+                   for shard, stream in enumerate(partition(quotes, shards))]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+
+    records = sum(result["records"] for result in results)
+    mismatched = [result["mismatched_ticks"] for result in results]
+    return {
+        "shards": shards,
+        "records": records,
+        "seconds": round(elapsed, 3),
+        "records_per_sec": round(records / elapsed, 1) if elapsed else None,
+        "retries": sum(result["retries"] for result in results),
+        "skipped": sum(len(result["skipped"]) for result in results),
+        "mismatched_ticks": None if None in mismatched else sum(mismatched),
+        "shard_results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="JSON lines of quotes or recorded Kinesis events")
+    source.add_argument("--synthetic", type=int, metavar="QUOTES",
+                        help="generate this many random-walk quotes")
+    parser.add_argument("--symbols", type=int, default=100,
+                        help="symbols in the synthetic stream")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--shards", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--checkpoint-dir", help="keep per-shard checkpoints here and resume from them")
+    parser.add_argument("--aws", action="store_true",
+                        help="write through boto3 instead of the in-memory fakes")
+    parser.add_argument("--verbose", action="store_true", help="show the processor's logs")
+    parser.add_argument("--output", help="write the results as JSON here")
+    args = parser.parse_args()
+
+    quotes = (read_quotes(args.input) if args.input
+              else synthetic_quotes(args.synthetic, args.symbols, args.seed))
+    summary = run(quotes, args.shards, {
+        "batch_size": args.batch_size,
+        "max_retries": args.max_retries,
+        "checkpoint_dir": args.checkpoint_dir,
+        "aws": args.aws,
+        "verbose": args.verbose,
+        "environment": {
+            "DYNAMODB_TABLE": "local-ticks",
+            "S3_BUCKET": "local-archive",
+            "AWS_DEFAULT_REGION": "us-east-1",
+            "EMIT_METRICS": "false",
+        },
+    })
+
+    print(f"{summary['records']} records on {summary['shards']} shards in "
+          f"{summary['seconds']} s ({summary['records_per_sec']} records/s), "
+          f"{summary['retries']} retried batches, {summary['skipped']} skipped records")
+    for result in summary["shard_results"]:
+        print(f"  shard {result['shard']:>3}: {result['records']:>8} records "
+              f"{result['symbols']:>5} symbols  checkpoint {result['checkpoint']}"
+              f"  skipped {result['skipped']}")
+    if summary["mismatched_ticks"] is not None:
+        print(f"Ticks differing from a sequential run: {summary['mismatched_ticks']}")
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(summary, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,93 @@
-import base64
 import json
 import logging
 import os
-from collections import defaultdict, deque
-from datetime import datetime
-from typing import Dict, Any, List, Optional
-
-import boto3
-from botocore.exceptions import ClientError, BotoCoreError
-from pythonjsonlogger import jsonlogger
+import random
+import time
+import zlib
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple
+
+from startup_profile import profiler
+
+# boto3 is imported when the Kinesis client is first created
+with profiler.phase("import:botocore"):
+    from botocore.exceptions import ClientError, BotoCoreError
+with profiler.phase("import:pythonjsonlogger"):
+    from pythonjsonlogger import jsonlogger
+
+with profiler.phase("import:fetcher"):
+    # Pulls in requests, needed on every invocation
+    from fetcher import TokenBucket, fetch_concurrently, pooled_session
+with profiler.phase("import:pipeline"):
+    from dead_letters import letter_batches, letter_body, send_letter_batch
+    from quote_codec import decode_payload, encode_quotes
+    from quote_schema import validate_quotes
+    from suppression import DeltaSuppressor
 
 # =====================================================
 # Configuration
 # =====================================================
-DYNAMODB_TABLE = os.environ["DYNAMODB_TABLE"]
-S3_BUCKET = os.environ["S3_BUCKET"]
-SECRET_NAME = os.environ.get("SECRET_NAME", "stock-api-key-dev")
-
-MOVING_AVG_WINDOW = 5
+DEFAULT_SYMBOLS = "AAPL,MSFT,GOOGL"
+
+STOCK_API_URL = os.environ.get("STOCK_API_URL", "https://www.alphavantage.co/query")
+STOCK_API_TIMEOUT = float(os.environ.get("STOCK_API_TIMEOUT", "5"))
+STOCK_API_MAX_WORKERS = int(os.environ.get("STOCK_API_MAX_WORKERS", "8"))
+# Client-side quota: requests per second and burst size (0 disables limiting)
+STOCK_API_RATE = float(os.environ.get("STOCK_API_RATE", "5"))
+STOCK_API_BURST = float(os.environ.get("STOCK_API_BURST", "5"))
+# Symbols per request; above 1 the multi-symbol BATCH_STOCK_QUOTES endpoint
+# is used instead of one GLOBAL_QUOTE call per symbol
+STOCK_API_BATCH_SIZE = int(os.environ.get("STOCK_API_BATCH_SIZE", "1"))
+
+# PutRecords limits: 500 records and 5 MiB (data plus partition keys) per call
+PUT_RECORDS_MAX_RECORDS = 500
+PUT_RECORDS_MAX_BYTES = 5 * 1024 * 1024
+PUT_RECORDS_MAX_RETRIES = int(os.environ.get("PUT_RECORDS_MAX_RETRIES", "5"))
+PUT_RECORDS_BACKOFF_BASE = float(os.environ.get("PUT_RECORDS_BACKOFF_BASE", "0.1"))
+
+# "binary" packs many quotes into each Kinesis record (see quote_codec);
+# "json" sends one JSON document per quote
+RECORD_FORMAT = os.environ.get("RECORD_FORMAT", "binary")
+# Aggregated records are keyed by a hash bucket of the symbol, so a symbol
+# always lands on the same shard. Keep this at or above the shard count.
+AGGREGATION_BUCKETS = int(os.environ.get("AGGREGATION_BUCKETS", "16"))
+# Well under the 1 MiB record limit (each quote takes ~30 bytes)
+MAX_QUOTES_PER_RECORD = int(os.environ.get("MAX_QUOTES_PER_RECORD", "1000"))
+
+# Delta suppression: skip quotes unchanged since the last publish, optionally
+# also price moves under SUPPRESS_THRESHOLD_BPS, but republish every symbol at
+# least every HEARTBEAT_SECONDS
+SUPPRESS_UNCHANGED = os.environ.get("SUPPRESS_UNCHANGED", "true").lower() == "true"
+SUPPRESS_THRESHOLD_BPS = float(os.environ.get("SUPPRESS_THRESHOLD_BPS", "0"))
+HEARTBEAT_SECONDS = float(os.environ.get("HEARTBEAT_SECONDS", "300"))
+
+# Quotes failing the shared quote schema are not published; they go to this
+# SQS queue when it is set
+DLQ_URL = os.environ.get("DLQ_URL", "")
 
 # =====================================================
 # Logging (Structured)
 # =====================================================
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+with profiler.phase("init:logging"):
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
 
-# Clear any existing handlers
-if logger.handlers:
-    for handler in logger.handlers:
-        logger.removeHandler(handler)
+    # Clear any existing handlers
+    if logger.handlers:
+        for handler in logger.handlers:
+            logger.removeHandler(handler)
 
-logHandler = logging.StreamHandler()
-formatter = jsonlogger.JsonFormatter()
-logHandler.setFormatter(formatter)
-logger.addHandler(logHandler)
+    logHandler = logging.StreamHandler()
+    formatter = jsonlogger.JsonFormatter()
+    logHandler.setFormatter(formatter)
+    logger.addHandler(logHandler)
 
 
 def log(message: str, level: str = "info", **kwargs):
     """Structured logging helper"""
     log_data = {"message": message, **kwargs}
-    
+
     if level == "error":
         logger.error(log_data)
     elif level == "warning":
@@ -51,193 +99,368 @@ def log(message: str, level: str = "info", **kwargs):
 # =====================================================
 # AWS Clients
 # =====================================================
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(DYNAMODB_TABLE)
+_kinesis_client = None
+_sqs_client = None
 
-s3 = boto3.client("s3")
-secrets_manager = boto3.client("secretsmanager")
 
-# =====================================================
-# Secrets Management
-# =====================================================
-_secret_cache: Optional[Dict[str, Any]] = None
-
-
-def get_secret() -> Dict[str, Any]:
-    """Retrieve and cache secrets from AWS Secrets Manager."""
-    global _secret_cache
-    
-    if _secret_cache is not None:
-        return _secret_cache
-    
-    try:
-        response = secrets_manager.get_secret_value(SecretId=SECRET_NAME)
-        
-        if "SecretString" in response:
-            _secret_cache = json.loads(response["SecretString"])
-        else:
-            _secret_cache = json.loads(base64.b64decode(response["SecretBinary"]))
-        
-        log("Secret retrieved successfully", secret_name=SECRET_NAME)
-        return _secret_cache
-        
-    except ClientError as err:
-        log("Failed to retrieve secret", level="error", error=str(err), 
-            error_type=type(err).__name__, secret_name=SECRET_NAME)
-        raise
+def get_kinesis_client():
+    """Create the Kinesis client on first use and reuse it while warm."""
+    global _kinesis_client
+
+    if _kinesis_client is None:
+        with profiler.phase("import:boto3"):
+            import boto3
+        with profiler.phase("init:kinesis"):
+            _kinesis_client = boto3.client("kinesis")
+    return _kinesis_client
+
+
+def get_sqs_client():
+    """Create the SQS client on first use; only rejected quotes need it."""
+    global _sqs_client
 
+    if _sqs_client is None:
+        with profiler.phase("import:boto3"):
+            import boto3
+        with profiler.phase("init:sqs"):
+            _sqs_client = boto3.client("sqs")
+    return _sqs_client
+
+
+with profiler.phase("init:http_session"):
+    http_session = pooled_session(STOCK_API_MAX_WORKERS)
+rate_limiter = TokenBucket(STOCK_API_RATE, STOCK_API_BURST)
 
 # =====================================================
 # In-memory state (warm Lambda only)
 # =====================================================
-price_cache: Dict[str, deque] = defaultdict(
-    lambda: deque(maxlen=MOVING_AVG_WINDOW)
+suppressor = DeltaSuppressor(
+    threshold_bps=SUPPRESS_THRESHOLD_BPS,
+    heartbeat_seconds=HEARTBEAT_SECONDS,
+    enabled=SUPPRESS_UNCHANGED,
 )
 
 
 # =====================================================
-# Helpers
+# Stock API
 # =====================================================
-def decode_kinesis_record(record: Dict[str, Any]) -> Dict[str, Any]:
-    payload = base64.b64decode(record["kinesis"]["data"]).decode("utf-8")
-    return json.loads(payload)
-
-
-def calculate_moving_average(symbol: str, price: float) -> float:
-    prices = price_cache[symbol]
-    prices.append(price)
-    return round(sum(prices) / len(prices), 2)
-
-
-def write_to_dynamodb(item: Dict[str, Any]):
-    try:
-        table.put_item(Item=item)
-        log("DynamoDB write successful", 
-            symbol=item.get("symbol"), 
-            timestamp=item.get("timestamp"))
-    except Exception as err:
-        log("DynamoDB write failed", level="error", 
-            error=str(err), error_type=type(err).__name__)
-        raise
-
-
-def write_to_s3(raw_event: Dict[str, Any], event_time: datetime):
-    key = (
-        f"year={event_time.year}/"
-        f"month={event_time.month:02d}/"
-        f"day={event_time.day:02d}/"
-        f"{raw_event['symbol']}-{event_time.isoformat()}.json"
+def get_stock_price(symbol: str) -> Dict[str, Any]:
+    """Fetch the current quote for `symbol` (Alpha Vantage GLOBAL_QUOTE)."""
+    rate_limiter.acquire()
+    response = http_session.get(
+        STOCK_API_URL,
+        params={
+            "function": "GLOBAL_QUOTE",
+            "symbol": symbol,
+            "apikey": os.environ.get("STOCK_API_KEY", ""),
+        },
+        timeout=STOCK_API_TIMEOUT,
     )
+    response.raise_for_status()
 
-    try:
-        s3.put_object(
-            Bucket=S3_BUCKET,
-            Key=key,
-            Body=json.dumps(raw_event).encode("utf-8"),
-            ContentType="application/json"
-        )
-        log("S3 write successful", 
-            bucket=S3_BUCKET, 
-            key=key, 
-            symbol=raw_event.get("symbol"))
-    except Exception as err:
-        log("S3 write failed", level="error", 
-            error=str(err), error_type=type(err).__name__, 
-            bucket=S3_BUCKET, key=key)
-        raise
-
-
-# =====================================================
-# Lambda Handler (Partial Batch Failure Enabled)
-# =====================================================
-def handler(event, context):
-    batch_failures: List[Dict[str, str]] = []
-    
-    log("Lambda invocation started", 
-        function="processor",
-        request_id=context.request_id,
-        event_records=len(event.get('Records', [])))
-    
-    # Load secrets on cold start
-    try:
-        secrets = get_secret()
-        log("Secrets loaded successfully", has_api_key=bool(secrets.get("api_key")))
-    except Exception as err:
-        log("Failed to load secrets - continuing without", level="warning",
-            error=str(err), error_type=type(err).__name__)
-
-    successful_records = 0
-    failed_records = 0
-
-    for record in event["Records"]:
-        record_id = record["eventID"]
+    quote = response.json().get("Global Quote") or {}
+    if "05. price" not in quote:
+        raise ValueError(f"No quote returned for {symbol}")
 
+    return {
+        "symbol": quote.get("01. symbol", symbol),
+        "price": float(quote["05. price"]),
+        "volume": int(quote.get("06. volume", 0)),
+        "timestamp": utc_now_iso(),
+    }
+
+
+def get_stock_prices(symbols: List[str]) -> List[Dict[str, Any]]:
+    """Fetch quotes for several symbols in one call (BATCH_STOCK_QUOTES)."""
+    rate_limiter.acquire()
+    response = http_session.get(
+        STOCK_API_URL,
+        params={
+            "function": "BATCH_STOCK_QUOTES",
+            "symbols": ",".join(symbols),
+            "apikey": os.environ.get("STOCK_API_KEY", ""),
+        },
+        timeout=STOCK_API_TIMEOUT,
+    )
+    response.raise_for_status()
+
+    timestamp = utc_now_iso()
+    return [
+        {
+            "symbol": quote["1. symbol"],
+            "price": float(quote["2. price"]),
+            "volume": int(quote.get("3. volume") or 0),
+            "timestamp": timestamp,
+        }
+        for quote in response.json().get("Stock Quotes", [])
+    ]
+
+
+def fetch_quotes(symbols: List[str]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Fetch every symbol concurrently within the API rate limit.
+
+    Returns the quotes fetched and the symbols that could not be fetched.
+    """
+    if STOCK_API_BATCH_SIZE > 1:
+        batches = [
+            symbols[start:start + STOCK_API_BATCH_SIZE]
+            for start in range(0, len(symbols), STOCK_API_BATCH_SIZE)
+        ]
+        results, errors = fetch_concurrently(
+            get_stock_prices, batches, STOCK_API_MAX_WORKERS
+        )
+        quotes = [quote for _, batch in results for quote in batch]
+        returned = {quote["symbol"] for quote in quotes}
+        failed = [symbol for batch, _ in errors for symbol in batch]
+        failed += [
+            symbol for batch, _ in results for symbol in batch if symbol not in returned
+        ]
+    else:
+        results, errors = fetch_concurrently(
+            get_stock_price, symbols, STOCK_API_MAX_WORKERS
+        )
+        quotes = [quote for _, quote in results]
+        failed = [symbol for symbol, _ in errors]
+
+    for item, err in errors:
+        log("Failed to fetch quote", level="error",
+            error=str(err),
+            error_type=type(err).__name__,
+            symbols=item if isinstance(item, list) else [item])
+    return quotes, failed
+
+
+def validate_fetched(fetched: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+    """Check fetched quotes against the quote schema.
+
+    Returns the valid quotes, normalised, and how many were rejected.
+    Rejects are logged once per invocation and dead-lettered.
+    """
+    candidates = [{"volume": 0, **quote} for quote in fetched]
+    valid, invalid = validate_quotes(candidates)
+    if invalid:
+        log("Invalid quotes rejected", level="warning",
+            quotes=len(invalid),
+            reasons=dict(Counter(reason for _, reason in invalid)),
+            symbols=sorted({str(candidates[index].get("symbol")) for index, _ in invalid}))
+        if DLQ_URL:
+            dead_letter_quotes([(candidates[index], reason) for index, reason in invalid])
+
+    return [
+        {
+            "symbol": symbol,
+            "price": price,
+            "volume": volume,
+            "timestamp": candidates[index]["timestamp"],
+        }
+        for index, (symbol, price, volume, _) in valid
+    ], len(invalid)
+
+
+def dead_letter_quotes(rejected: List[Tuple[Dict[str, Any], str]]):
+    """Send rejected quotes to the DLQ; failures are logged, not raised."""
+    letters = [
+        (str(index), letter_body("stock-data-producer", reason, quote=quote))
+        for index, (quote, reason) in enumerate(rejected)
+    ]
+    unsent = 0
+    for batch in letter_batches(letters):
         try:
-            data = decode_kinesis_record(record)
+            unsent += len(send_letter_batch(get_sqs_client(), DLQ_URL, batch))
+        except (ClientError, BotoCoreError) as err:
+            log("Dead-letter send failed", level="error",
+                error=str(err), error_type=type(err).__name__, letters=len(batch))
+            unsent += len(batch)
+    if unsent:
+        log("Rejected quotes were not dead-lettered", level="error", quotes=unsent)
 
-            symbol = data["symbol"]
-            price = float(data["price"])
-            volume = int(data["volume"])
-            timestamp = data["timestamp"]
 
-            event_time = datetime.fromisoformat(
-                timestamp.replace("Z", "+00:00")
-            )
+def utc_now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace(
+        "+00:00", "Z"
+    )
 
-            moving_avg = calculate_moving_average(symbol, price)
 
-            processed_item = {
-                "symbol": symbol,
-                "timestamp": timestamp,
-                "price": price,
-                "volume": volume,
-                "moving_average": moving_avg
+# =====================================================
+# Kinesis Publishing
+# =====================================================
+def build_entries(quotes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """PutRecords entries, partitioned so each symbol stays on one shard."""
+    if RECORD_FORMAT != "binary":
+        return [
+            {
+                "Data": json.dumps(quote).encode("utf-8"),
+                "PartitionKey": quote["symbol"],
             }
+            for quote in quotes
+        ]
+
+    buckets: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+    for quote in quotes:
+        buckets[aggregation_bucket(quote["symbol"])].append(quote)
+
+    entries = []
+    for bucket, bucket_quotes in sorted(buckets.items()):
+        for start in range(0, len(bucket_quotes), MAX_QUOTES_PER_RECORD):
+            chunk = bucket_quotes[start:start + MAX_QUOTES_PER_RECORD]
+            entries.append({
+                "Data": encode_quotes(
+                    chunk,
+                    event_time=chunk[0].get("event_time"),
+                    request_id=chunk[0].get("request_id"),
+                ),
+                "PartitionKey": f"quotes-{bucket}",
+            })
+    return entries
+
+
+def aggregation_bucket(symbol: str) -> int:
+    # crc32 rather than hash(): it must not change between containers
+    return zlib.crc32(symbol.encode("utf-8")) % AGGREGATION_BUCKETS
+
+
+def entry_symbols(entry: Dict[str, Any]) -> List[str]:
+    """Symbols carried by an entry, decoded only on the failure path."""
+    return [quote["symbol"] for quote in decode_payload(entry["Data"])]
+
+
+def chunk_entries(entries: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Split entries into PutRecords calls within the record and size limits."""
+    chunks: List[List[Dict[str, Any]]] = []
+    current: List[Dict[str, Any]] = []
+    current_bytes = 0
+
+    for entry in entries:
+        size = len(entry["Data"]) + len(entry["PartitionKey"].encode("utf-8"))
+        if current and (
+            len(current) >= PUT_RECORDS_MAX_RECORDS
+            or current_bytes + size > PUT_RECORDS_MAX_BYTES
+        ):
+            chunks.append(current)
+            current, current_bytes = [], 0
+        current.append(entry)
+        current_bytes += size
+
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def put_records(stream_name: str, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Send one PutRecords chunk, retrying only the entries that failed.
+
+    Returns the entries still failing after PUT_RECORDS_MAX_RETRIES.
+    """
+    kinesis = get_kinesis_client()
+    pending = entries
+
+    for attempt in range(PUT_RECORDS_MAX_RETRIES + 1):
+        if attempt:
+            time.sleep(_backoff_delay(attempt))
 
-            write_to_dynamodb(processed_item)
-            write_to_s3(data, event_time)
-
-            log("Record processed successfully",
-                symbol=symbol,
-                price=price,
-                volume=volume,
-                moving_average=moving_avg,
-                record_id=record_id)
-            
-            successful_records += 1
-
-        except (KeyError, ValueError) as err:
-            log("Invalid record format", level="error",
-                error=str(err),
-                error_type=type(err).__name__,
-                record_id=record_id)
-            batch_failures.append({"itemIdentifier": record_id})
-            failed_records += 1
-
+        try:
+            response = kinesis.put_records(StreamName=stream_name, Records=pending)
         except (ClientError, BotoCoreError) as err:
-            log("AWS service error", level="error",
-                error=str(err),
-                error_type=type(err).__name__,
-                record_id=record_id)
-            batch_failures.append({"itemIdentifier": record_id})
-            failed_records += 1
-
-        except Exception as err:
-            log("Unexpected error", level="error",
-                error=str(err),
-                error_type=type(err).__name__,
-                record_id=record_id,
-                exc_info=True)
-            batch_failures.append({"itemIdentifier": record_id})
-            failed_records += 1
+            log("Kinesis PutRecords failed", level="warning",
+                error=str(err), error_type=type(err).__name__,
+                attempt=attempt + 1, records=len(pending))
+            continue
+
+        if not response.get("FailedRecordCount"):
+            return []
+
+        # Results line up with the request entries
+        failed = [
+            (entry, result)
+            for entry, result in zip(pending, response["Records"])
+            if result.get("ErrorCode")
+        ]
+        log("Kinesis PutRecords partially failed", level="warning",
+            attempt=attempt + 1,
+            failed_records=len(failed),
+            error_codes=sorted({result["ErrorCode"] for _, result in failed}))
+        pending = [entry for entry, _ in failed]
+
+    return pending
+
+
+def publish_quotes(stream_name: str, quotes: List[Dict[str, Any]]) -> List[str]:
+    """Publish quotes through PutRecords.
+
+    Returns the symbol of every record that could not be sent.
+    """
+    failed_symbols: List[str] = []
+    for chunk in chunk_entries(build_entries(quotes)):
+        failed = put_records(stream_name, chunk)
+        symbols = [symbol for entry in failed for symbol in entry_symbols(entry)]
+        if failed:
+            log("Kinesis records dropped after retries", level="error",
+                stream_name=stream_name,
+                failed_records=len(failed),
+                symbols=sorted(set(symbols)))
+        failed_symbols.extend(symbols)
+    return failed_symbols
+
+
+def _backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, PUT_RECORDS_BACKOFF_BASE * (2 ** attempt))
+
+
+# =====================================================
+# Lambda Handler
+# =====================================================
+def handler(event, context):
+    stream_name = os.environ["KINESIS_STREAM_NAME"]
+    symbols = [
+        symbol.strip()
+        for symbol in os.environ.get("STOCK_SYMBOLS", DEFAULT_SYMBOLS).split(",")
+        if symbol.strip()
+    ]
+    request_id: Optional[str] = getattr(context, "aws_request_id", None)
+
+    log("Lambda invocation started",
+        function="producer",
+        request_id=request_id,
+        symbols=len(symbols))
+
+    event_time = utc_now_iso()
+    fetched, failed_symbols = fetch_quotes(symbols)
+    fetch_failures = len(failed_symbols)
+
+    quotes, rejected = validate_fetched(fetched)
+    for quote in quotes:
+        quote["event_time"] = event_time
+        quote["request_id"] = request_id
+
+    selected, suppression = suppressor.filter(quotes)
+    failed = publish_quotes(stream_name, selected) if selected else []
+    failed_set = set(failed)
+    suppressor.record(quote for quote in selected if quote["symbol"] not in failed_set)
 
     log("Lambda invocation completed",
-        function="processor",
-        request_id=context.request_id,
-        total_records=len(event.get('Records', [])),
-        successful_records=successful_records,
-        failed_records=failed_records)
+        function="producer",
+        request_id=request_id,
+        fetched=len(fetched),
+        fetch_failures=fetch_failures,
+        rejected=rejected,
+        published=len(selected) - len(failed),
+        publish_failures=len(failed),
+        suppressed_duplicate=suppression["suppressed_duplicate"],
+        suppressed_threshold=suppression["suppressed_threshold"],
+        heartbeats=suppression["heartbeats"],
+        suppression_rate=suppressor.suppression_rate(suppression),
+        total_suppression_rate=suppressor.suppression_rate(suppressor.totals))
+
+    # Only when STARTUP_PROFILE is set, and only once phases have run
+    startup = profiler.report()
+    if startup:
+        log("Startup profile", function="producer", **startup)
 
     return {
-        "batchItemFailures": batch_failures
-    }
\ No newline at end of file
+        "published": len(selected) - len(failed),
+        "suppressed": suppression["suppressed_duplicate"] + suppression["suppressed_threshold"],
+        "fetch_failures": fetch_failures,
+        "rejected": rejected,
+        "publish_failures": len(failed),
+    }
@@ -0,0 +1,85 @@
+"""Concurrent, rate-limited quote fetching.
+
+Quotes are fetched on a thread pool over one pooled ``requests`` session, so
+connections stay alive between calls. Every API call first takes a token from
+a shared token bucket, which keeps the whole pool inside the provider's
+request quota however many workers are running.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`.
+
+    A non-positive rate disables limiting.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        """Block until `tokens` are available, then take them."""
+        if self.rate <= 0:
+            return
+
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+def pooled_session(pool_size: int) -> requests.Session:
+    """A keep-alive session whose connection pool fits `pool_size` workers."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def fetch_concurrently(
+    fetch: Callable[[Any], Any], items: Iterable[Any], max_workers: int
+) -> Tuple[List[Tuple[Any, Any]], List[Tuple[Any, Exception]]]:
+    """Call `fetch` for every item on up to `max_workers` threads.
+
+    Returns ``(item, result)`` pairs for the calls that succeeded and
+    ``(item, error)`` pairs for those that raised, both in input order.
+    """
+    items = list(items)
+    if not items:
+        return [], []
+
+    def call(item):
+        try:
+            return True, fetch(item)
+        except Exception as err:
+            return False, err
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        outcomes = list(executor.map(call, items))
+
+    results = [(item, value) for item, (ok, value) in zip(items, outcomes) if ok]
+    errors = [(item, value) for item, (ok, value) in zip(items, outcomes) if not ok]
+    return results, errors
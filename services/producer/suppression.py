@@ -0,0 +1,84 @@
+"""Warm-container delta suppression for published quotes.
+
+Remembers the last price and volume published per symbol and drops quotes
+that have not moved: exact duplicates, and optionally price moves below a
+basis-point threshold. A symbol is still republished every
+``heartbeat_seconds`` so consumers can tell a quiet symbol from a dead feed.
+"""
+import time
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+COUNTERS = ("considered", "published", "heartbeats",
+            "suppressed_duplicate", "suppressed_threshold")
+
+
+class DeltaSuppressor:
+    def __init__(self, threshold_bps: float = 0.0, heartbeat_seconds: float = 300.0,
+                 enabled: bool = True, clock: Callable[[], float] = time.time):
+        self.threshold_bps = threshold_bps
+        self.heartbeat_seconds = heartbeat_seconds
+        self.enabled = enabled
+        self._clock = clock
+        self._last: Dict[str, Tuple[float, int, float]] = {}
+        self.totals = dict.fromkeys(COUNTERS, 0)
+
+    def filter(self, quotes: Iterable[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """Split off the quotes worth publishing.
+
+        Returns those quotes and this call's counters. Call ``record`` once
+        they have actually been published.
+        """
+        counters = dict.fromkeys(COUNTERS, 0)
+        now = self._clock()
+        selected = []
+
+        for quote in quotes:
+            counters["considered"] += 1
+            reason = self._suppression_reason(quote, now)
+            if reason == "heartbeat":
+                counters["heartbeats"] += 1
+            elif reason:
+                counters[f"suppressed_{reason}"] += 1
+                continue
+            counters["published"] += 1
+            selected.append(quote)
+
+        for name, value in counters.items():
+            self.totals[name] += value
+        return selected, counters
+
+    def record(self, quotes: Iterable[Dict[str, Any]]):
+        """Remember quotes that were published successfully."""
+        now = self._clock()
+        for quote in quotes:
+            self._last[quote["symbol"]] = (quote["price"], quote.get("volume", 0), now)
+
+    def _suppression_reason(self, quote: Dict[str, Any], now: float):
+        """Why the quote can be dropped, "heartbeat" if it is only published
+        because one is due, or None when it changed."""
+        last = self._last.get(quote["symbol"]) if self.enabled else None
+        if last is None:
+            return None
+
+        last_price, last_volume, published_at = last
+        price = quote["price"]
+        if price == last_price and quote.get("volume", 0) == last_volume:
+            reason = "duplicate"
+        elif self.threshold_bps > 0 and last_price and (
+            abs(price - last_price) / abs(last_price) * 10_000 < self.threshold_bps
+        ):
+            reason = "threshold"
+        else:
+            return None
+
+        if now - published_at >= self.heartbeat_seconds:
+            return "heartbeat"
+        return reason
+
+    @staticmethod
+    def suppression_rate(counters: Dict[str, int]) -> float:
+        considered = counters["considered"]
+        if not considered:
+            return 0.0
+        suppressed = counters["suppressed_duplicate"] + counters["suppressed_threshold"]
+        return round(suppressed / considered, 4)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules shared with the processor are packaged next to app.py at deploy time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "common"))
@@ -6,7 +6,10 @@ import boto3
 import pytest
 from moto import mock_aws
 
+import app
 from app import handler
+from quote_codec import decode_payload
+from suppression import DeltaSuppressor
 
 
 @pytest.fixture
@@ -19,6 +22,15 @@ def aws_credentials():
     os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
 
 
+@pytest.fixture(autouse=True)
+def reset_warm_state():
+    # The client and suppression cache live while warm; each test starts cold
+    app._kinesis_client = app._sqs_client = None
+    with patch("app.suppressor", DeltaSuppressor()):
+        yield
+    app._kinesis_client = app._sqs_client = None
+
+
 @pytest.fixture
 def kinesis_stream(aws_credentials):
     with mock_aws():
@@ -39,10 +51,12 @@ def test_handler_success(mock_get_stock_price, kinesis_stream):
     # Mock the Kinesis client
     with patch("boto3.client") as mock_boto_client:
         mock_kinesis = MagicMock()
+        mock_kinesis.put_records.return_value = {"FailedRecordCount": 0, "Records": []}
         mock_boto_client.return_value = mock_kinesis
 
         # Set environment variables
         os.environ["KINESIS_STREAM_NAME"] = kinesis_stream
+        os.environ["STOCK_SYMBOLS"] = "AAPL"
 
         # Call the handler
         event = {}
@@ -50,11 +64,14 @@ def test_handler_success(mock_get_stock_price, kinesis_stream):
         handler(event, context)
 
         # Assert that the Kinesis client was called correctly
-        mock_kinesis.put_record.assert_called_once()
-        call_args = mock_kinesis.put_record.call_args[1]
+        mock_kinesis.put_records.assert_called_once()
+        call_args = mock_kinesis.put_records.call_args[1]
         assert call_args["StreamName"] == kinesis_stream
-        
-        data = json.loads(call_args["Data"])
+        assert call_args["Records"][0]["PartitionKey"] == (
+            f"quotes-{app.aggregation_bucket('AAPL')}"
+        )
+
+        data, = decode_payload(call_args["Records"][0]["Data"])
         assert data["symbol"] == "AAPL"
         assert data["price"] == 150.0
         
@@ -79,5 +96,171 @@ def test_handler_api_failure(mock_get_stock_price, kinesis_stream):
             pytest.fail(f"Handler raised an unexpected exception: {e}")
         
         # Assert that Kinesis was not called
-        mock_kinesis.put_record.assert_not_called()
+        mock_kinesis.put_records.assert_not_called()
+
+
+
+def quotes_for(symbols):
+    return [
+        {"symbol": symbol, "price": 1.0, "volume": 1, "timestamp": "2024-01-01T00:00:00.000Z"}
+        for symbol in symbols
+    ]
+
+
+@patch("app.RECORD_FORMAT", "json")
+def test_entries_are_chunked_within_put_records_limits():
+    quotes = [{"symbol": f"S{index}", "price": 1.0} for index in range(1200)]
+
+    chunks = app.chunk_entries(app.build_entries(quotes))
+
+    assert [len(chunk) for chunk in chunks] == [500, 500, 200]
+
+
+@patch("app.RECORD_FORMAT", "json")
+def test_entries_are_chunked_by_request_size():
+    big = {"symbol": "AAPL", "blob": "x" * (1024 * 1024 - 100)}
+
+    chunks = app.chunk_entries(app.build_entries([big] * 6))
+
+    assert [len(chunk) for chunk in chunks] == [5, 1]
+    for chunk in chunks:
+        size = sum(len(e["Data"]) + len(e["PartitionKey"]) for e in chunk)
+        assert size <= app.PUT_RECORDS_MAX_BYTES
+
+
+@patch("app.RECORD_FORMAT", "json")
+@patch("app.time.sleep")
+def test_only_failed_records_are_retried(mock_sleep):
+    mock_kinesis = MagicMock()
+    mock_kinesis.put_records.side_effect = [
+        {
+            "FailedRecordCount": 1,
+            "Records": [
+                {"SequenceNumber": "1", "ShardId": "shardId-0"},
+                {"ErrorCode": "ProvisionedThroughputExceededException", "ErrorMessage": "slow down"},
+                {"SequenceNumber": "2", "ShardId": "shardId-0"},
+            ],
+        },
+        {"FailedRecordCount": 0, "Records": [{"SequenceNumber": "3", "ShardId": "shardId-0"}]},
+    ]
+    app._kinesis_client = mock_kinesis
+    assert app.publish_quotes("test-stream", quotes_for(["AAPL", "MSFT", "GOOGL"])) == []
+
+    retried = mock_kinesis.put_records.call_args_list[1][1]["Records"]
+    assert [entry["PartitionKey"] for entry in retried] == ["MSFT"]
+    mock_sleep.assert_called_once()
+
+
+@patch("app.time.sleep")
+def test_records_failing_every_retry_are_counted(mock_sleep):
+    mock_kinesis = MagicMock()
+    mock_kinesis.put_records.return_value = {
+        "FailedRecordCount": 1,
+        "Records": [{"ErrorCode": "InternalFailure", "ErrorMessage": "oops"}],
+    }
+    app._kinesis_client = mock_kinesis
+
+    assert app.publish_quotes("test-stream", quotes_for(["AAPL"])) == ["AAPL"]
+    assert mock_kinesis.put_records.call_count == app.PUT_RECORDS_MAX_RETRIES + 1
+
+
+def test_put_records_against_moto(kinesis_stream):
+    quotes = quotes_for(["AAPL", "MSFT"])
+    app._kinesis_client = boto3.client("kinesis", region_name="us-east-1")
+
+    assert app.publish_quotes(kinesis_stream, quotes) == []
+
+    shard_id = app._kinesis_client.describe_stream(StreamName=kinesis_stream)[
+        "StreamDescription"]["Shards"][0]["ShardId"]
+    iterator = app._kinesis_client.get_shard_iterator(
+        StreamName=kinesis_stream, ShardId=shard_id, ShardIteratorType="TRIM_HORIZON"
+    )["ShardIterator"]
+    records = app._kinesis_client.get_records(ShardIterator=iterator)["Records"]
+    published = [quote for record in records for quote in decode_payload(record["Data"])]
+    assert sorted(quote["symbol"] for quote in published) == ["AAPL", "MSFT"]
+
+
+def test_binary_records_aggregate_quotes_per_bucket():
+    symbols = [f"SYM{index}" for index in range(200)]
+
+    with patch("app.AGGREGATION_BUCKETS", 4), patch("app.MAX_QUOTES_PER_RECORD", 40):
+        entries = app.build_entries(quotes_for(symbols))
+
+    by_key = {}
+    for entry in entries:
+        for quote in decode_payload(entry["Data"]):
+            by_key.setdefault(quote["symbol"], set()).add(entry["PartitionKey"])
+            assert len(decode_payload(entry["Data"])) <= 40
+
+    # Every symbol is in exactly one record, under its stable bucket key
+    assert sorted(by_key) == sorted(symbols)
+    assert all(len(keys) == 1 for keys in by_key.values())
+    assert {key for keys in by_key.values() for key in keys} <= {
+        f"quotes-{bucket}" for bucket in range(4)
+    }
+    assert len(entries) < len(symbols) / 10
+
+
+@patch("app.time.sleep")
+def test_failed_aggregate_reports_all_of_its_symbols(mock_sleep):
+    mock_kinesis = MagicMock()
+    mock_kinesis.put_records.return_value = {
+        "FailedRecordCount": 1,
+        "Records": [{"ErrorCode": "InternalFailure", "ErrorMessage": "oops"}],
+    }
+    app._kinesis_client = mock_kinesis
+
+    with patch("app.AGGREGATION_BUCKETS", 1):
+        failed = app.publish_quotes("test-stream", quotes_for(["AAPL", "MSFT"]))
+
+    assert failed == ["AAPL", "MSFT"]
+
+
+@patch("app.get_stock_price")
+def test_unchanged_quotes_are_suppressed_until_published(mock_get_stock_price):
+    mock_get_stock_price.return_value = {
+        "symbol": "AAPL", "price": 150.0, "volume": 10, "timestamp": "2024-01-01T00:00:00Z",
+    }
+    mock_kinesis = MagicMock()
+    mock_kinesis.put_records.side_effect = [
+        {"FailedRecordCount": 1, "Records": [{"ErrorCode": "InternalFailure"}]},
+    ] * (app.PUT_RECORDS_MAX_RETRIES + 1) + [
+        {"FailedRecordCount": 0, "Records": [{}]},
+    ]
+    app._kinesis_client = mock_kinesis
+    os.environ["KINESIS_STREAM_NAME"] = "test-stream"
+    os.environ["STOCK_SYMBOLS"] = "AAPL"
+
+    with patch("app.time.sleep"):
+        # The first publish fails, so the same quote is not treated as sent
+        assert handler({}, {})["publish_failures"] == 1
+        assert handler({}, {})["published"] == 1
+        assert handler({}, {}) == {
+            "published": 0, "suppressed": 1, "fetch_failures": 0, "rejected": 0,
+            "publish_failures": 0,
+        }
+
+
+@patch("app.DLQ_URL", "https://sqs.us-east-1.amazonaws.com/123456789012/producer-dlq")
+@patch("app.fetch_quotes")
+def test_invalid_quotes_are_dead_lettered_instead_of_published(mock_fetch_quotes):
+    mock_fetch_quotes.return_value = ([
+        {"symbol": "AAPL", "price": 150.0, "volume": 10, "timestamp": "2024-01-01T00:00:00Z"},
+        {"symbol": "HALT", "price": 0.0, "volume": 0, "timestamp": "2024-01-01T00:00:00Z"},
+    ], [])
+    app._kinesis_client = mock_kinesis = MagicMock()
+    mock_kinesis.put_records.return_value = {"FailedRecordCount": 0, "Records": []}
+    app._sqs_client = mock_sqs = MagicMock()
+    mock_sqs.send_message_batch.return_value = {"Successful": [{"Id": "0"}], "Failed": []}
+    os.environ["KINESIS_STREAM_NAME"] = "test-stream"
+
+    result = handler({}, {})
 
+    assert result["published"] == 1
+    assert result["rejected"] == 1
+    published = decode_payload(mock_kinesis.put_records.call_args[1]["Records"][0]["Data"])
+    assert [quote["symbol"] for quote in published] == ["AAPL"]
+    [entry] = mock_sqs.send_message_batch.call_args[1]["Entries"]
+    letter = json.loads(entry["MessageBody"])
+    assert letter["reason"] == "price must be > 0"
+    assert letter["quote"]["symbol"] == "HALT"
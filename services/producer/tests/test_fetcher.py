@@ -0,0 +1,144 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import app
+from fetcher import TokenBucket, fetch_concurrently
+
+
+class StubQuoteAPI(BaseHTTPRequestHandler):
+    """Serves GLOBAL_QUOTE and BATCH_STOCK_QUOTES responses, 50 ms per call."""
+
+    protocol_version = "HTTP/1.1"
+    requests_seen = []
+    connections = set()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        with self.lock:
+            self.requests_seen.append(params)
+            self.connections.add(self.client_address)
+        time.sleep(0.05)
+
+        if params["function"] == "GLOBAL_QUOTE":
+            symbol = params["symbol"]
+            if symbol == "BAD":
+                body = {"Error Message": "Invalid API call"}
+            else:
+                body = {"Global Quote": {
+                    "01. symbol": symbol, "05. price": "101.50", "06. volume": "1200",
+                }}
+        else:
+            body = {"Stock Quotes": [
+                {"1. symbol": symbol, "2. price": "99.00", "3. volume": "10"}
+                for symbol in params["symbols"].split(",") if symbol != "BAD"
+            ]}
+
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_api():
+    StubQuoteAPI.requests_seen = []
+    StubQuoteAPI.connections = set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubQuoteAPI)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_port}/query"
+    with patch("app.STOCK_API_URL", url), patch("app.rate_limiter", TokenBucket(0)):
+        yield StubQuoteAPI
+    server.shutdown()
+    server.server_close()
+
+
+def test_quotes_are_fetched_concurrently(stub_api):
+    symbols = [f"SYM{index}" for index in range(16)]
+
+    started = time.monotonic()
+    quotes, failed = app.fetch_quotes(symbols)
+    elapsed = time.monotonic() - started
+
+    assert failed == []
+    assert sorted(quote["symbol"] for quote in quotes) == sorted(symbols)
+    assert quotes[0]["price"] == 101.5
+    assert quotes[0]["volume"] == 1200
+    # 16 calls of 50 ms on 8 workers, not 800 ms one after another
+    assert elapsed < 0.5
+
+
+def test_connections_are_reused(stub_api):
+    app.fetch_quotes([f"SYM{index}" for index in range(32)])
+
+    assert len(stub_api.requests_seen) == 32
+    assert len(stub_api.connections) <= app.STOCK_API_MAX_WORKERS
+
+
+def test_failed_symbols_are_reported(stub_api):
+    quotes, failed = app.fetch_quotes(["AAPL", "BAD", "MSFT"])
+
+    assert [quote["symbol"] for quote in quotes] == ["AAPL", "MSFT"]
+    assert failed == ["BAD"]
+
+
+def test_multi_symbol_endpoint(stub_api):
+    with patch("app.STOCK_API_BATCH_SIZE", 3):
+        quotes, failed = app.fetch_quotes(["A", "B", "C", "BAD", "E"])
+
+    assert sorted(quote["symbol"] for quote in quotes) == ["A", "B", "C", "E"]
+    assert failed == ["BAD"]
+    assert [params["symbols"] for params in stub_api.requests_seen] in (
+        ["A,B,C", "BAD,E"], ["BAD,E", "A,B,C"]
+    )
+
+
+def test_rate_limiter_caps_request_rate(stub_api):
+    with patch("app.rate_limiter", TokenBucket(rate=20, capacity=1)):
+        started = time.monotonic()
+        app.fetch_quotes([f"SYM{index}" for index in range(6)])
+        elapsed = time.monotonic() - started
+
+    # One token up front, then five more at 20 per second
+    assert elapsed >= 0.25
+
+
+def test_token_bucket_refills_over_time():
+    now = [0.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0], sleep=sleep)
+
+    for _ in range(4):
+        bucket.acquire()
+
+    assert sleeps == [pytest.approx(0.5), pytest.approx(0.5)]
+    assert now[0] == pytest.approx(1.0)
+
+
+def test_fetch_concurrently_separates_errors():
+    def fetch(value):
+        if value % 2:
+            raise ValueError(value)
+        return value * 10
+
+    results, errors = fetch_concurrently(fetch, range(5), max_workers=3)
+
+    assert results == [(0, 0), (2, 20), (4, 40)]
+    assert [item for item, _ in errors] == [1, 3]
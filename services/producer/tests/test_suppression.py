@@ -0,0 +1,70 @@
+from suppression import DeltaSuppressor
+
+
+def quote(price, volume=100, symbol="AAPL"):
+    return {"symbol": symbol, "price": price, "volume": volume}
+
+
+def make(**kwargs):
+    now = [1000.0]
+    return DeltaSuppressor(clock=lambda: now[0], **kwargs), now
+
+
+def test_exact_duplicates_are_suppressed():
+    suppressor, _ = make()
+    suppressor.record([quote(150.0)])
+
+    selected, counters = suppressor.filter([quote(150.0), quote(150.0, volume=101)])
+
+    assert selected == [quote(150.0, volume=101)]
+    assert counters["suppressed_duplicate"] == 1
+    assert suppressor.suppression_rate(counters) == 0.5
+
+
+def test_unseen_symbols_are_always_published():
+    suppressor, _ = make()
+
+    selected, _ = suppressor.filter([quote(150.0), quote(10.0, symbol="MSFT")])
+
+    assert len(selected) == 2
+
+
+def test_moves_below_threshold_are_suppressed():
+    suppressor, _ = make(threshold_bps=5)
+    suppressor.record([quote(100.0)])
+
+    # 4 bp and 6 bp moves
+    selected, counters = suppressor.filter([quote(100.04, volume=200), quote(100.06)])
+
+    assert selected == [quote(100.06)]
+    assert counters["suppressed_threshold"] == 1
+
+
+def test_heartbeat_republishes_quiet_symbols():
+    suppressor, now = make(heartbeat_seconds=60)
+    suppressor.record([quote(150.0)])
+
+    now[0] += 59
+    assert suppressor.filter([quote(150.0)])[0] == []
+
+    now[0] += 1
+    selected, counters = suppressor.filter([quote(150.0)])
+    assert selected == [quote(150.0)]
+    assert counters["heartbeats"] == 1
+
+
+def test_disabled_suppressor_publishes_everything():
+    suppressor, _ = make(enabled=False)
+    suppressor.record([quote(150.0)])
+
+    assert suppressor.filter([quote(150.0)])[0] == [quote(150.0)]
+
+
+def test_totals_accumulate_across_calls():
+    suppressor, _ = make()
+    suppressor.record([quote(150.0)])
+    suppressor.filter([quote(150.0)])
+    suppressor.filter([quote(150.0), quote(151.0)])
+
+    assert suppressor.totals["considered"] == 3
+    assert suppressor.totals["suppressed_duplicate"] == 2
@@ -0,0 +1,193 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from botocore.config import Config
+from botocore.exceptions import ClientError, BotoCoreError
+from pythonjsonlogger import jsonlogger
+
+from quotes import QuoteReader, QuoteReadError
+
+# =====================================================
+# Configuration
+# =====================================================
+# Required; checked when the handler runs rather than at import
+DYNAMODB_TABLE = os.environ.get("DYNAMODB_TABLE", "")
+
+# How long a read quote is served from the container's cache
+QUOTE_CACHE_TTL_MS = int(os.environ.get("QUOTE_CACHE_TTL_MS", "1000"))
+QUOTE_CACHE_MAX_SYMBOLS = int(os.environ.get("QUOTE_CACHE_MAX_SYMBOLS", "10000"))
+MAX_SYMBOLS_PER_REQUEST = int(os.environ.get("MAX_SYMBOLS_PER_REQUEST", "500"))
+
+# Parallel BatchGetItem/Query calls; also sizes the botocore connection pool
+IO_MAX_WORKERS = int(os.environ.get("IO_MAX_WORKERS", "8"))
+DYNAMODB_MAX_RETRIES = int(os.environ.get("DYNAMODB_MAX_RETRIES", "5"))
+DYNAMODB_BACKOFF_BASE = float(os.environ.get("DYNAMODB_BACKOFF_BASE", "0.05"))
+
+EMIT_METRICS = os.environ.get("EMIT_METRICS", "true").lower() == "true"
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "StockPipeline")
+
+# =====================================================
+# Logging (Structured)
+# =====================================================
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Clear any existing handlers
+if logger.handlers:
+    for handler in logger.handlers:
+        logger.removeHandler(handler)
+
+logHandler = logging.StreamHandler()
+formatter = jsonlogger.JsonFormatter()
+logHandler.setFormatter(formatter)
+logger.addHandler(logHandler)
+
+
+def log(message: str, level: str = "info", **kwargs):
+    """Structured logging helper"""
+    log_data = {"message": message, **kwargs}
+
+    if level == "error":
+        logger.error(log_data)
+    elif level == "warning":
+        logger.warning(log_data)
+    else:
+        logger.info(log_data)
+
+
+def emit_metrics(counts: Dict[str, int]):
+    """One CloudWatch Embedded Metric Format document of counts."""
+    print(json.dumps({
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": METRICS_NAMESPACE,
+                "Dimensions": [["FunctionName"]],
+                "Metrics": [{"Name": name, "Unit": "Count"} for name in counts],
+            }],
+        },
+        "FunctionName": os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "stock-quote-api"),
+        **counts,
+    }), flush=True)
+
+
+# =====================================================
+# AWS Clients
+# =====================================================
+_dynamodb = None
+_dynamodb_lock = threading.Lock()
+
+
+def get_dynamodb():
+    global _dynamodb
+    if _dynamodb is None:
+        with _dynamodb_lock:
+            if _dynamodb is None:
+                import boto3
+                _dynamodb = boto3.resource(
+                    "dynamodb", config=Config(max_pool_connections=IO_MAX_WORKERS)
+                )
+    return _dynamodb
+
+
+# Kept while the container is warm, so repeated polls hit the cache
+reader = QuoteReader(
+    DYNAMODB_TABLE,
+    ttl_seconds=QUOTE_CACHE_TTL_MS / 1000,
+    max_cached=QUOTE_CACHE_MAX_SYMBOLS,
+    max_workers=IO_MAX_WORKERS,
+    max_retries=DYNAMODB_MAX_RETRIES,
+    backoff_base=DYNAMODB_BACKOFF_BASE,
+)
+
+
+# =====================================================
+# Request handling
+# =====================================================
+def requested_symbols(event: Dict[str, Any]) -> List[str]:
+    """Symbols from ``?symbols=AAPL,MSFT`` or a ``{"symbols": [...]}`` body.
+
+    Raises ValueError for a malformed request.
+    """
+    query = event.get("queryStringParameters") or {}
+    if query.get("symbols"):
+        symbols = query["symbols"].split(",")
+    elif event.get("body"):
+        try:
+            symbols = json.loads(event["body"]).get("symbols")
+        except (ValueError, AttributeError):
+            raise ValueError("Body must be a JSON object")
+        if not isinstance(symbols, list):
+            raise ValueError("symbols must be a list")
+    else:
+        symbols = event.get("symbols") or []
+
+    symbols = list(dict.fromkeys(str(symbol).strip().upper() for symbol in symbols))
+    symbols = [symbol for symbol in symbols if symbol]
+    if not symbols:
+        raise ValueError("No symbols requested")
+    if len(symbols) > MAX_SYMBOLS_PER_REQUEST:
+        raise ValueError(f"At most {MAX_SYMBOLS_PER_REQUEST} symbols per request")
+    return symbols
+
+
+def response(status: int, body: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "statusCode": status,
+        "headers": {"Content-Type": "application/json", "Cache-Control": "no-store"},
+        "body": json.dumps(body),
+    }
+
+
+# =====================================================
+# Lambda Handler
+# =====================================================
+def handler(event: Dict[str, Any], context: Optional[Any]) -> Dict[str, Any]:
+    """Latest quotes for an API Gateway, function URL or direct invocation."""
+    if not DYNAMODB_TABLE:
+        log("Missing required configuration", level="error", missing=["DYNAMODB_TABLE"])
+        return response(500, {"error": "Service is not configured"})
+
+    try:
+        symbols = requested_symbols(event)
+    except ValueError as err:
+        return response(400, {"error": str(err)})
+
+    before = dict(reader.stats)
+    try:
+        quotes = reader.get_quotes(get_dynamodb(), symbols)
+    except QuoteReadError as err:
+        log("Quote read incomplete", level="error", error=str(err), symbols=len(err.symbols))
+        return response(503, {"error": "Quotes temporarily unavailable"})
+    except (ClientError, BotoCoreError) as err:
+        log("Quote read failed", level="error",
+            error=str(err), error_type=type(err).__name__, symbols=len(symbols))
+        return response(503, {"error": "Quotes temporarily unavailable"})
+
+    counts = {name: reader.stats[name] - before[name] for name in reader.stats}
+    if counts["queries"]:
+        # Each of these symbols cost a Query of its own: the processor is not
+        # writing latest-quote items (DYNAMODB_WRITE_MODE "latest" or "both")
+        log("Latest-quote items missing - fell back to tick queries", level="warning",
+            symbols=counts["queries"])
+    log("Quote request completed",
+        function="quote_api",
+        request_id=getattr(context, "aws_request_id", None),
+        symbols=len(symbols),
+        found=sum(quote is not None for quote in quotes.values()),
+        **counts)
+    if EMIT_METRICS:
+        emit_metrics({
+            "QuoteCacheHits": counts["cache_hits"],
+            "QuoteBatchGets": counts["batch_gets"],
+            "LatestQuoteFallbacks": counts["queries"],
+        })
+
+    return response(200, {
+        "quotes": {symbol: quote for symbol, quote in quotes.items() if quote is not None},
+        "missing": [symbol for symbol, quote in quotes.items() if quote is None],
+    })
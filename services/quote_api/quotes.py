@@ -0,0 +1,227 @@
+"""Latest quote and indicators for many symbols, read from the tick table.
+
+The processor keeps one latest-quote item per symbol (sort key ``LATEST``)
+when DYNAMODB_WRITE_MODE is "latest" or "both", as the deployed stack sets
+it. Those are read with BatchGetItem, 100 symbols per call and the calls in
+parallel. A symbol without one (the table only holds ticks) falls back to a
+Query for its newest tick; the handler reports those as the
+LatestQuoteFallbacks metric, since every one is a round trip of its own.
+
+Reads go through a small in-process cache. An entry is served for
+``ttl_seconds`` after it was read, and a refresh never replaces a quote with
+an older one, since an eventually consistent read can lag the last write.
+Quotes are ordered by epoch microseconds (the processor's ``quote_time_us``,
+or the parsed tick timestamp), not by their timestamp strings.
+Symbols without any data are cached as misses too. Concurrent requests for
+a symbol that is already being read wait for that read instead of issuing
+their own, so dashboards polling the same symbols share one read per TTL.
+"""
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Sort key of the processor's latest-quote item
+LATEST_QUOTE_TIMESTAMP = "LATEST"
+
+# BatchGetItem reads at most 100 keys per call
+READ_BATCH_SIZE = 100
+
+# Attributes of table items that are not part of a quote
+_INTERNAL_ATTRIBUTES = ("ttl", "quote_time_us")
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+Quote = Dict[str, Any]
+
+
+class QuoteReadError(Exception):
+    """Some symbols could not be read; none of them were cached."""
+
+    def __init__(self, message: str, symbols: List[str]):
+        super().__init__(message)
+        self.symbols = symbols
+
+
+class QuoteReader:
+    """Batched, cached and coalesced reads of latest quotes.
+
+    Safe to share between threads. The DynamoDB resource is passed to each
+    call, like the processor's state store.
+    """
+
+    def __init__(self, table_name: str, ttl_seconds: float = 1.0,
+                 max_cached: int = 10000, max_workers: int = 8,
+                 max_retries: int = 5, backoff_base: float = 0.05,
+                 clock: Callable[[], float] = time.monotonic):
+        self.table_name = table_name
+        self.ttl_seconds = ttl_seconds
+        self.max_cached = max_cached
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.clock = clock
+        # symbol -> (read at, quote time in epoch us, quote or None),
+        # least recently used first
+        self._cache: "OrderedDict[str, Tuple[float, int, Optional[Quote]]]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="quote-reader")
+        self.stats = {"cache_hits": 0, "coalesced": 0, "batch_gets": 0, "queries": 0}
+
+    def get_quotes(self, dynamodb, symbols: Iterable[str]) -> Dict[str, Optional[Quote]]:
+        """Latest quote per symbol, or None for a symbol with no data."""
+        wanted = list(dict.fromkeys(symbols))
+        results: Dict[str, Optional[Quote]] = {}
+        owned: Dict[str, Future] = {}
+        waiting: Dict[str, Future] = {}
+
+        now = self.clock()
+        with self._lock:
+            for symbol in wanted:
+                entry = self._cache.get(symbol)
+                if entry is not None and now - entry[0] < self.ttl_seconds:
+                    self._cache.move_to_end(symbol)
+                    results[symbol] = entry[2]
+                    self.stats["cache_hits"] += 1
+                elif symbol in self._inflight:
+                    waiting[symbol] = self._inflight[symbol]
+                    self.stats["coalesced"] += 1
+                else:
+                    owned[symbol] = self._inflight[symbol] = Future()
+
+        if owned:
+            try:
+                fetched = self._read(dynamodb, list(owned))
+            except BaseException as err:
+                with self._lock:
+                    for symbol, future in owned.items():
+                        del self._inflight[symbol]
+                        future.set_exception(err)
+                raise
+            with self._lock:
+                for symbol, future in owned.items():
+                    results[symbol] = self._store(symbol, fetched.get(symbol), now)
+                    del self._inflight[symbol]
+                    future.set_result(results[symbol])
+
+        for symbol, future in waiting.items():
+            results[symbol] = future.result()
+        return {symbol: results[symbol] for symbol in wanted}
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def _store(self, symbol: str, fetched: Optional[Tuple[int, Quote]],
+               now: float) -> Optional[Quote]:
+        # Called under the lock. Keeps the cached quote if it is newer.
+        quote_time, quote = fetched if fetched is not None else (-1, None)
+        entry = self._cache.get(symbol)
+        if entry is not None and entry[2] is not None and (
+            quote is None or quote_time < entry[1]
+        ):
+            _, quote_time, quote = entry
+        self._cache[symbol] = (now, quote_time, quote)
+        self._cache.move_to_end(symbol)
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+        return quote
+
+    # =====================================================
+    # DynamoDB
+    # =====================================================
+    def _read(self, dynamodb, symbols: List[str]) -> Dict[str, Tuple[int, Quote]]:
+        """``(quote time in epoch us, quote)`` for each symbol that has data."""
+        chunks = [symbols[start:start + READ_BATCH_SIZE]
+                  for start in range(0, len(symbols), READ_BATCH_SIZE)]
+        found: Dict[str, Tuple[int, Quote]] = {}
+        for items in self._executor.map(lambda chunk: self._batch_get(dynamodb, chunk), chunks):
+            for item in items:
+                found[item["symbol"]] = (quote_time_us(item), to_quote(item))
+
+        # Without a latest-quote item, the symbol's newest tick
+        missing = [symbol for symbol in symbols if symbol not in found]
+        for symbol, item in zip(missing, self._executor.map(
+            lambda symbol: self._newest_tick(dynamodb, symbol), missing
+        )):
+            if item is not None:
+                found[symbol] = (quote_time_us(item), to_quote(item))
+        return found
+
+    def _batch_get(self, dynamodb, symbols: List[str]) -> List[Dict[str, Any]]:
+        request = {
+            self.table_name: {
+                "Keys": [{"symbol": symbol, "timestamp": LATEST_QUOTE_TIMESTAMP}
+                         for symbol in symbols],
+            }
+        }
+        found: List[Dict[str, Any]] = []
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self._backoff_delay(attempt))
+            with self._lock:
+                self.stats["batch_gets"] += 1
+            response = dynamodb.batch_get_item(RequestItems=request)
+            found.extend(response.get("Responses", {}).get(self.table_name, []))
+            request = response.get("UnprocessedKeys") or {}
+            if not request:
+                return found
+        raise QuoteReadError(
+            "BatchGetItem left unprocessed keys after retries",
+            [key["symbol"] for key in request[self.table_name]["Keys"]],
+        )
+
+    def _newest_tick(self, dynamodb, symbol: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self.stats["queries"] += 1
+        response = dynamodb.Table(self.table_name).query(
+            # Tick timestamps sort before the LATEST and STATE items
+            KeyConditionExpression="#symbol = :symbol AND #timestamp < :latest",
+            ExpressionAttributeNames={"#symbol": "symbol", "#timestamp": "timestamp"},
+            ExpressionAttributeValues={":symbol": symbol, ":latest": LATEST_QUOTE_TIMESTAMP},
+            ScanIndexForward=False,
+            Limit=1,
+        )
+        items = response.get("Items", [])
+        return items[0] if items else None
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff."""
+        return random.uniform(0, self.backoff_base * (2 ** attempt))
+
+
+def to_quote(item: Dict[str, Any]) -> Quote:
+    """A tick or latest-quote item as plain JSON-ready values."""
+    quote = {
+        key: _plain(value) for key, value in item.items()
+        if key not in _INTERNAL_ATTRIBUTES
+    }
+    if quote.get("timestamp") == LATEST_QUOTE_TIMESTAMP:
+        quote["timestamp"] = quote.pop("quote_timestamp")
+    return quote
+
+
+def quote_time_us(item: Dict[str, Any]) -> int:
+    """Epoch microseconds of a tick or latest-quote item's quote."""
+    if "quote_time_us" in item:
+        return int(item["quote_time_us"])
+    timestamp = item["timestamp"]
+    if timestamp == LATEST_QUOTE_TIMESTAMP:
+        # Written before the processor stored quote_time_us
+        timestamp = item["quote_timestamp"]
+    moment = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    delta = moment - _EPOCH
+    return (delta.days * 86_400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def _plain(value):
+    # The DynamoDB resource hands every number back as Decimal
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
@@ -0,0 +1,5 @@
+import os
+
+# Required by the handler
+os.environ.setdefault("DYNAMODB_TABLE", "test-table")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
@@ -0,0 +1,68 @@
+import json
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+import pytest
+from botocore.exceptions import ClientError
+
+import app
+
+
+@pytest.fixture
+def dynamodb():
+    app.reader.clear()
+    resource = MagicMock()
+    resource.batch_get_item.return_value = {"Responses": {"test-table": [
+        {"symbol": "AAPL", "timestamp": "LATEST", "quote_timestamp": "2024-01-02T14:30:00.000Z",
+         "price": Decimal("150.25"), "volume": Decimal("100")},
+    ]}}
+    resource.Table.return_value.query.return_value = {"Items": []}
+    with patch.object(app, "get_dynamodb", return_value=resource):
+        yield resource
+
+
+def test_quotes_for_query_string_symbols(dynamodb):
+    result = app.handler({"queryStringParameters": {"symbols": "aapl, msft,AAPL"}}, None)
+
+    assert result["statusCode"] == 200
+    body = json.loads(result["body"])
+    assert body["quotes"]["AAPL"]["price"] == 150.25
+    assert body["missing"] == ["MSFT"]
+    keys = dynamodb.batch_get_item.call_args.kwargs["RequestItems"]["test-table"]["Keys"]
+    assert [key["symbol"] for key in keys] == ["AAPL", "MSFT"]
+
+
+def test_quotes_for_json_body(dynamodb):
+    result = app.handler({"body": json.dumps({"symbols": ["AAPL"]})}, None)
+
+    assert result["statusCode"] == 200
+    assert list(json.loads(result["body"])["quotes"]) == ["AAPL"]
+
+
+@pytest.mark.parametrize("event", [
+    {},
+    {"body": "not json"},
+    {"body": json.dumps({"symbols": "AAPL"})},
+    {"queryStringParameters": {"symbols": ",".join(f"S{index}" for index in range(501))}},
+])
+def test_malformed_requests_are_rejected(dynamodb, event):
+    assert app.handler(event, None)["statusCode"] == 400
+    dynamodb.batch_get_item.assert_not_called()
+
+
+def test_dynamodb_errors_return_503(dynamodb):
+    dynamodb.batch_get_item.side_effect = ClientError(
+        {"Error": {"Code": "ProvisionedThroughputExceededException", "Message": "slow down"}},
+        "BatchGetItem",
+    )
+
+    assert app.handler({"symbols": ["AAPL"]}, None)["statusCode"] == 503
+
+
+def test_tick_query_fallbacks_are_reported_as_a_metric(dynamodb, capsys):
+    app.handler({"symbols": ["AAPL", "MSFT"]}, None)
+
+    [document] = [json.loads(line) for line in capsys.readouterr().out.splitlines()
+                  if line.startswith('{"_aws"')]
+    assert document["LatestQuoteFallbacks"] == 1
+    assert document["QuoteBatchGets"] == 1
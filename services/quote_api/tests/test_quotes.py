@@ -0,0 +1,172 @@
+import threading
+from decimal import Decimal
+from unittest.mock import MagicMock
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from quotes import QuoteReader, QuoteReadError
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        resource = boto3.resource("dynamodb", region_name="us-east-1")
+        table = resource.create_table(
+            TableName="ticks",
+            KeySchema=[
+                {"AttributeName": "symbol", "KeyType": "HASH"},
+                {"AttributeName": "timestamp", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "symbol", "AttributeType": "S"},
+                {"AttributeName": "timestamp", "AttributeType": "S"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        yield resource, table
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def latest_item(symbol, timestamp, price):
+    return {"symbol": symbol, "timestamp": "LATEST", "quote_timestamp": timestamp,
+            "price": Decimal(str(price)), "volume": 100, "moving_average": Decimal("10.5")}
+
+
+def test_many_symbols_take_a_few_batched_reads(dynamodb):
+    resource, table = dynamodb
+    with table.batch_writer() as batch:
+        for index in range(250):
+            batch.put_item(Item=latest_item(f"SYM{index:03d}", "2024-01-02T14:30:00.000Z", 10.5))
+    reader = QuoteReader("ticks")
+
+    quotes = reader.get_quotes(resource, [f"SYM{index:03d}" for index in range(250)])
+
+    assert len(quotes) == 250
+    assert quotes["SYM007"] == {"symbol": "SYM007", "timestamp": "2024-01-02T14:30:00.000Z",
+                                "price": 10.5, "volume": 100, "moving_average": 10.5}
+    assert reader.stats["batch_gets"] == 3
+    assert reader.stats["queries"] == 0
+
+
+def test_symbol_without_latest_item_falls_back_to_its_newest_tick(dynamodb):
+    resource, table = dynamodb
+    for timestamp, price in (("2024-01-02T14:30:00.000Z", 1.0), ("2024-01-02T14:31:00.000Z", 2.0)):
+        table.put_item(Item={"symbol": "AAPL", "timestamp": timestamp,
+                             "price": Decimal(str(price)), "volume": 5})
+    table.put_item(Item={"symbol": "AAPL", "timestamp": "STATE", "window": b"x"})
+
+    quotes = QuoteReader("ticks").get_quotes(resource, ["AAPL", "NOPE"])
+
+    assert quotes["AAPL"]["timestamp"] == "2024-01-02T14:31:00.000Z"
+    assert quotes["AAPL"]["price"] == 2
+    assert quotes["NOPE"] is None
+
+
+def test_cache_serves_hot_symbols_until_the_ttl_passes(dynamodb):
+    resource, table = dynamodb
+    table.put_item(Item=latest_item("AAPL", "2024-01-02T14:30:00.000Z", 1.5))
+    clock = Clock()
+    reader = QuoteReader("ticks", ttl_seconds=1.0, clock=clock)
+
+    reader.get_quotes(resource, ["AAPL", "NOPE"])
+    table.put_item(Item=latest_item("AAPL", "2024-01-02T14:30:01.000Z", 2.5))
+    clock.now = 0.5
+    assert reader.get_quotes(resource, ["AAPL", "NOPE"])["AAPL"]["price"] == 1.5
+    assert reader.stats["cache_hits"] == 2
+
+    clock.now = 1.0
+    assert reader.get_quotes(resource, ["AAPL"])["AAPL"]["price"] == 2.5
+    assert reader.stats["batch_gets"] == 2
+
+
+def test_refresh_never_goes_back_to_an_older_quote():
+    clock = Clock()
+    reader = QuoteReader("ticks", ttl_seconds=1.0, clock=clock)
+    dynamodb = MagicMock()
+    dynamodb.batch_get_item.side_effect = [
+        {"Responses": {"ticks": [latest_item("AAPL", "2024-01-02T14:30:01.000Z", 2.5)]}},
+        # A lagging replica
+        {"Responses": {"ticks": [latest_item("AAPL", "2024-01-02T14:30:00.000Z", 1.5)]}},
+    ]
+
+    reader.get_quotes(dynamodb, ["AAPL"])
+    clock.now = 2.0
+
+    assert reader.get_quotes(dynamodb, ["AAPL"])["AAPL"]["price"] == 2.5
+
+
+def test_quotes_are_ordered_by_time_not_by_timestamp_string():
+    clock = Clock()
+    reader = QuoteReader("ticks", ttl_seconds=1.0, clock=clock)
+    dynamodb = MagicMock()
+    newer = latest_item("AAPL", "2024-01-02T14:30:01.500Z", 2.5)
+    newer["quote_time_us"] = Decimal(1704205801500000)
+    dynamodb.batch_get_item.side_effect = [
+        {"Responses": {"ticks": [latest_item("AAPL", "2024-01-02T14:30:01Z", 1.5)]}},
+        # Sorts before "...:01Z" as a string
+        {"Responses": {"ticks": [newer]}},
+    ]
+
+    reader.get_quotes(dynamodb, ["AAPL"])
+    clock.now = 2.0
+    quote = reader.get_quotes(dynamodb, ["AAPL"])["AAPL"]
+
+    assert quote["price"] == 2.5
+    assert "quote_time_us" not in quote
+
+
+def test_concurrent_requests_for_a_symbol_share_one_read():
+    reader = QuoteReader("ticks")
+    started, release = threading.Event(), threading.Event()
+
+    def batch_get_item(RequestItems):
+        started.set()
+        release.wait(5)
+        return {"Responses": {"ticks": [latest_item("AAPL", "2024-01-02T14:30:00.000Z", 1.5)]}}
+
+    dynamodb = MagicMock()
+    dynamodb.batch_get_item.side_effect = batch_get_item
+    results = []
+    first = threading.Thread(target=lambda: results.append(reader.get_quotes(dynamodb, ["AAPL"])))
+    first.start()
+    started.wait(5)
+    second = threading.Thread(target=lambda: results.append(reader.get_quotes(dynamodb, ["AAPL"])))
+    second.start()
+    while not reader.stats["coalesced"]:
+        pass
+    release.set()
+    first.join()
+    second.join()
+
+    assert dynamodb.batch_get_item.call_count == 1
+    assert results[0] == results[1]
+
+
+def test_unprocessed_keys_after_retries_raise_and_are_not_cached(monkeypatch):
+    monkeypatch.setattr("quotes.time.sleep", lambda seconds: None)
+    reader = QuoteReader("ticks", max_retries=2)
+    dynamodb = MagicMock()
+    dynamodb.batch_get_item.return_value = {
+        "Responses": {}, "UnprocessedKeys": {"ticks": {"Keys": [{"symbol": "AAPL", "timestamp": "LATEST"}]}},
+    }
+
+    with pytest.raises(QuoteReadError) as raised:
+        reader.get_quotes(dynamodb, ["AAPL"])
+
+    assert raised.value.symbols == ["AAPL"]
+    assert dynamodb.batch_get_item.call_count == 3
+    assert not reader._inflight
+    dynamodb.batch_get_item.return_value = {"Responses": {"ticks": []}}
+    dynamodb.Table.return_value.query.return_value = {"Items": []}
+    assert reader.get_quotes(dynamodb, ["AAPL"]) == {"AAPL": None}